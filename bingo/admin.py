@@ -4,8 +4,12 @@ from django.urls import path, reverse
 from django.utils.html import format_html
 import json
 from django.contrib import messages
-from .models import CardPurchase, Event, BingoCard, Number, PaymentMethod, TestCoinBalance, Wallet, WinningPattern, DepositRequest, SystemConfig, RatesConfig
-from .views import BingoCardViewSet
+from .models import CardPurchase, Event, BingoCard, Number, PaymentMethod, TestCoinBalance, Wallet, WinningPattern, DepositRequest, SystemConfig, RatesConfig, WinClaim
+from .card_pdf import cards_pdf_response, payload_records
+from .email_outbox import queue_cards_email
+from .card_issuing import new_batch_metadata, purchase_cards
+from .locks import LockTimeout, balance_lock_name, get_lock_manager
+from django.conf import settings
 from django.core.management import call_command
 from io import StringIO
 import sys
@@ -20,6 +24,7 @@ admin.site.register(TestCoinBalance)
 admin.site.register(CardPurchase)
 admin.site.register(DepositRequest)
 admin.site.register(SystemConfig)
+admin.site.register(WinClaim)
 
 # Formulario para verificar cartón con número específico
 class VerifyWinWithNumberForm(forms.Form):
@@ -50,14 +55,28 @@ class BingoCardAdmin(admin.ModelAdmin):
         if request.method == 'POST':
             event_id = request.POST.get('event_id')
             quantity = int(request.POST.get('quantity', 1))
+            event = Event.objects.get(id=event_id)
             
-            # Use the ViewSet method to generate cards
-            card_viewset = BingoCardViewSet()
-            card_viewset.request = request
-            response = card_viewset.generate_bulk(request._request)
+            # Same issuing path as the seller generate_bulk endpoint
+            try:
+                with get_lock_manager().lock(balance_lock_name(request.user.id),
+                                             timeout=settings.LOCK_ACQUIRE_TIMEOUT) as lock:
+                    success, result = purchase_cards(
+                        request.user, event, quantity, SystemConfig.get_card_price(),
+                        new_batch_metadata(quantity), lock=lock)
+            except LockTimeout:
+                self.message_user(request, "Another generation is in progress", level='error')
+                return redirect('admin:generate-cards')
+            if not success:
+                self.message_user(request, result, level='error')
+                return redirect('admin:generate-cards')
             
             # Store the generated cards in session for next steps
-            request.session['generated_cards'] = response.data['cards']
+            request.session['generated_cards'] = [{
+                'id': str(card.id),
+                'numbers': card.numbers,
+                'event_id': str(event.id)
+            } for card in result['cards']]
             request.session['event_id'] = event_id
             
             self.message_user(request, f"Successfully generated {quantity} cards")
@@ -80,16 +99,9 @@ class BingoCardAdmin(admin.ModelAdmin):
                 self.message_user(request, "No hay cartones disponibles, debes tener cartones", level='error')
                 return redirect('admin:generate-cards')
             
-            # Create a request object for the viewset
-            request._request.data = {
-                'cards': cards,
-                'event_id': event_id
-            }
-            
-            # Use the ViewSet method to generate PDF
-            card_viewset = BingoCardViewSet()
-            card_viewset.request = request._request
-            return card_viewset.download_pdf(request._request)
+            event = Event.objects.get(id=event_id)
+            return cards_pdf_response(request, payload_records(cards, event), event,
+                                      f"bingo_cards_{event.name}.pdf")
         
         # Display confirmation page
         card_count = len(request.session.get('generated_cards', []))
@@ -111,24 +123,10 @@ class BingoCardAdmin(admin.ModelAdmin):
                 self.message_user(request, "Missing required information", level='error')
                 return redirect('admin:generate-cards')
             
-            # Create a request object for the viewset
-            request._request.data = {
-                'cards': cards,
-                'event_id': event_id,
-                'email': email,
-                'subject': subject,
-                'message': message
-            }
-            
-            # Use the ViewSet method to send email
-            card_viewset = BingoCardViewSet()
-            card_viewset.request = request._request
-            response = card_viewset.email_cards(request._request)
-            
-            if response.data.get('success'):
-                self.message_user(request, f"Email fue enviado exitosamente a {email}", level='success')
-            else:
-                self.message_user(request, f"Hubo un error enviando el email: {response.data.get('message')}", level='error')
+            event = Event.objects.get(id=event_id)
+            # Lo envía el worker de la bandeja de salida (send_email_outbox)
+            queue_cards_email(request.user, event, cards, email, subject, message)
+            self.message_user(request, f"Email en cola para {email}", level='success')
             
             return redirect('admin:bingo_bingocard_changelist')
         
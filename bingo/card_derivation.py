@@ -0,0 +1,118 @@
+"""
+Cartones derivados: un cartón queda definido por (semilla del evento, índice) y sus
+números se calculan al leerlo en lugar de guardarse.
+
+El índice pasa por una permutación pseudoaleatoria (red de Feistel con cycle-walking)
+sobre el espacio completo de cartones válidos y el resultado se decodifica en base mixta
+como una selección ordenada de números por columna. La permutación es biyectiva, así que
+índices distintos de un mismo evento siempre producen cartones distintos, y es invertible
+(grid_index) para saber si un cartón guardado coincide con uno derivado.
+"""
+import hashlib
+from functools import lru_cache
+from math import perm
+
+from django.conf import settings
+
+from .win_patterns import grid_to_numbers
+
+# Números por columna: B, I, G y O tienen 5; N tiene 4 por el espacio libre
+COLUMN_SIZES = (5, 5, 4, 5, 5)
+COLUMN_RADIX = tuple(perm(15, size) for size in COLUMN_SIZES)
+GRID_SPACE = 1
+for _radix in COLUMN_RADIX:
+    GRID_SPACE *= _radix
+
+HALF_BITS = (GRID_SPACE.bit_length() + 1) // 2
+HALF_MASK = (1 << HALF_BITS) - 1
+HALF_BYTES = (HALF_BITS + 7) // 8
+ROUNDS = 4
+
+
+@lru_cache(maxsize=1024)
+def _round_hasher(seed, round_number):
+    return hashlib.blake2b(key=seed.to_bytes(8, 'big') + bytes([round_number]), digest_size=HALF_BYTES)
+
+
+def _round(seed, round_number, value):
+    hasher = _round_hasher(seed, round_number).copy()
+    hasher.update(value.to_bytes(HALF_BYTES, 'big'))
+    return int.from_bytes(hasher.digest(), 'big') & HALF_MASK
+
+
+def _feistel(seed, value):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for round_number in range(ROUNDS):
+        left, right = right, left ^ _round(seed, round_number, right)
+    return (left << HALF_BITS) | right
+
+
+def _feistel_inverse(seed, value):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for round_number in reversed(range(ROUNDS)):
+        left, right = right ^ _round(seed, round_number, left), left
+    return (left << HALF_BITS) | right
+
+
+def _cycle_walk(step, seed, value):
+    # El dominio de Feistel es mayor que GRID_SPACE: se repite hasta caer dentro
+    value = step(seed, value)
+    while value >= GRID_SPACE:
+        value = step(seed, value)
+    return value
+
+
+def _rank_to_grid(rank):
+    grid = [0] * 25
+    for col, (size, radix) in enumerate(zip(COLUMN_SIZES, COLUMN_RADIX)):
+        rank, digit = divmod(rank, radix)
+        pool = list(range(col * 15 + 1, col * 15 + 16))
+        rows = [0, 1, 3, 4] if size == 4 else range(5)
+        for row in rows:
+            digit, choice = divmod(digit, len(pool))
+            grid[row * 5 + col] = pool.pop(choice)
+    return grid
+
+
+def _grid_to_rank(grid):
+    rank = 0
+    multiplier = 1
+    for col, (size, radix) in enumerate(zip(COLUMN_SIZES, COLUMN_RADIX)):
+        pool = list(range(col * 15 + 1, col * 15 + 16))
+        rows = [0, 1, 3, 4] if size == 4 else range(5)
+        digit = 0
+        digit_multiplier = 1
+        for row in rows:
+            value = grid[row * 5 + col]
+            if value not in pool:
+                return None
+            choice = pool.index(value)
+            digit += choice * digit_multiplier
+            digit_multiplier *= len(pool)
+            pool.pop(choice)
+        rank += digit * multiplier
+        multiplier *= radix
+    return rank
+
+
+@lru_cache(maxsize=settings.CARD_DERIVATION_CACHE_SIZE)
+def derive_grid(seed, index):
+    """Cuadrícula row-major (0 = espacio libre) del cartón `index` del evento con `seed`"""
+    if not 0 <= index < GRID_SPACE:
+        raise ValueError(f"Índice de cartón fuera de rango: {index}")
+    return tuple(_rank_to_grid(_cycle_walk(_feistel, seed, index)))
+
+
+def derive_card_numbers(seed, index):
+    """Números del cartón en el formato guardado: ["B1", "I16", "N0", ...]"""
+    return grid_to_numbers(derive_grid(seed, index))
+
+
+def grid_index(seed, grid):
+    """Índice del cartón derivado que produce `grid`, o None si no es un cartón válido"""
+    if len(grid) != 25 or grid[12] != 0:
+        return None
+    rank = _grid_to_rank(grid)
+    if rank is None:
+        return None
+    return _cycle_walk(_feistel_inverse, seed, rank)
@@ -0,0 +1,236 @@
+"""
+Streaming export of cards as CSV, JSON Lines or a compact columnar binary file.
+
+Cards are read with values_list(...).iterator(chunk_size=CARD_EXPORT_CHUNK_SIZE) and
+every chunk is encoded and handed to the caller before the next one is fetched, so
+memory stays constant whatever the size of the event. Derived cards get their grid
+from the event seed like everywhere else.
+
+Columnar layout (all integers little-endian):
+
+    b'BINGOCOL' | uint8 version
+    row group*: uint32 rows | one block per column in COLUMNS order
+    uint32 0 | uint64 total rows | b'BINGOCOL'
+
+Column blocks: uuid columns are 16 raw bytes per row; string columns are rows + 1
+uint32 offsets followed by the UTF-8 data; user_id and created_at (microseconds since
+the epoch, UTC) are int64, user_id 0 meaning no owner; is_winner is one byte per row;
+grid is 25 uint8 per row, row-major with 0 as the free space.
+"""
+import csv
+import io
+import json
+import struct
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .card_derivation import derive_grid
+from .models import BingoCard, Event
+from .win_patterns import parse_card_numbers
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+FORMAT_COLUMNAR = 'columnar'
+EXPORT_FORMATS = (FORMAT_CSV, FORMAT_JSONL, FORMAT_COLUMNAR)
+
+CONTENT_TYPES = {
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+    FORMAT_JSONL: 'application/x-ndjson',
+    FORMAT_COLUMNAR: 'application/octet-stream',
+}
+FILE_EXTENSIONS = {
+    FORMAT_CSV: 'csv',
+    FORMAT_JSONL: 'jsonl',
+    FORMAT_COLUMNAR: 'bcol',
+}
+
+COLUMNS = ('id', 'correlative_id', 'event_id', 'user_id', 'transaction_id', 'is_winner',
+           'created_at', 'grid')
+
+COLUMNAR_MAGIC = b'BINGOCOL'
+COLUMNAR_VERSION = 1
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def cards_to_export(event_id=None, transaction_id=None, user_id=None):
+    """Cards of an event and/or transaction (CardBatch id), optionally only those of one owner"""
+    queryset = BingoCard.objects.all()
+    if event_id:
+        queryset = queryset.filter(event_id=event_id)
+    if transaction_id:
+        queryset = queryset.filter(batch_id=transaction_id)
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    return queryset.order_by('created_at')
+
+
+def iter_export_rows(queryset, chunk_size=None):
+    """Rows as tuples in COLUMNS order, read with a server-side cursor"""
+    chunk_size = chunk_size or settings.CARD_EXPORT_CHUNK_SIZE
+    rows = queryset.values_list(
+        'id', 'correlative_id', 'event_id', 'user_id', 'batch_id',
+        'is_winner', 'created_at', 'numbers', 'seed_index'
+    ).iterator(chunk_size=chunk_size)
+    for (card_id, correlative_id, event_id, user_id, transaction_id,
+         is_winner, created_at, numbers, seed_index) in rows:
+        if numbers is None and seed_index is not None:
+            # Derived card: values_list does not go through BingoCard.from_db
+            grid = list(derive_grid(Event.card_seed_for(event_id), seed_index))
+        else:
+            grid = parse_card_numbers(numbers)
+        yield (card_id, correlative_id or '', event_id, user_id, str(transaction_id or ''),
+               bool(is_winner), created_at, grid)
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _csv_chunk(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(COLUMNS)
+    for card_id, correlative_id, event_id, user_id, transaction_id, is_winner, created_at, grid in rows:
+        writer.writerow([card_id, correlative_id, event_id, user_id or '', transaction_id,
+                         int(is_winner), created_at.isoformat(), ' '.join(map(str, grid))])
+    return buffer.getvalue().encode()
+
+
+def _jsonl_chunk(rows):
+    lines = []
+    for card_id, correlative_id, event_id, user_id, transaction_id, is_winner, created_at, grid in rows:
+        lines.append(json.dumps({
+            'id': str(card_id),
+            'correlative_id': correlative_id,
+            'event_id': str(event_id),
+            'user_id': user_id,
+            'transaction_id': transaction_id or None,
+            'is_winner': is_winner,
+            'created_at': created_at.isoformat(),
+            'grid': grid,
+        }, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def _uuid_block(values):
+    return b''.join(uuid.UUID(str(value)).bytes for value in values)
+
+
+def _string_block(values):
+    encoded = [value.encode() for value in values]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return struct.pack(f'<{len(offsets)}I', *offsets) + b''.join(encoded)
+
+
+def _microseconds(value):
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _columnar_chunk(rows):
+    count = len(rows)
+    card_ids, correlatives, event_ids, user_ids, transactions, winners, created, grids = zip(*rows)
+    return b''.join([
+        struct.pack('<I', count),
+        _uuid_block(card_ids),
+        _string_block(correlatives),
+        _uuid_block(event_ids),
+        struct.pack(f'<{count}q', *(user_id or 0 for user_id in user_ids)),
+        _string_block(transactions),
+        bytes(winners),
+        struct.pack(f'<{count}q', *map(_microseconds, created)),
+        bytes(value for grid in grids for value in grid),
+    ])
+
+
+def iter_export(queryset, export_format, chunk_size=None):
+    """
+    Encoded export of the queryset as successive bytes chunks, one per
+    CARD_EXPORT_CHUNK_SIZE cards, suitable for StreamingHttpResponse or file.write.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    chunk_size = chunk_size or settings.CARD_EXPORT_CHUNK_SIZE
+    chunks = _chunks(iter_export_rows(queryset, chunk_size), chunk_size)
+
+    if export_format == FORMAT_CSV:
+        yield _csv_chunk([], header=True)
+        for rows in chunks:
+            yield _csv_chunk(rows)
+    elif export_format == FORMAT_JSONL:
+        for rows in chunks:
+            yield _jsonl_chunk(rows)
+    else:
+        yield COLUMNAR_MAGIC + struct.pack('<B', COLUMNAR_VERSION)
+        total = 0
+        for rows in chunks:
+            total += len(rows)
+            yield _columnar_chunk(rows)
+        yield struct.pack('<IQ', 0, total) + COLUMNAR_MAGIC
+
+
+def _read_exact(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated columnar export")
+    return data
+
+
+def _read_strings(file, count):
+    offsets = struct.unpack(f'<{count + 1}I', _read_exact(file, 4 * (count + 1)))
+    data = _read_exact(file, offsets[-1])
+    return [data[offsets[i]:offsets[i + 1]].decode() for i in range(count)]
+
+
+def _read_uuids(file, count):
+    data = _read_exact(file, 16 * count)
+    return [str(uuid.UUID(bytes=data[i * 16:(i + 1) * 16])) for i in range(count)]
+
+
+def _read_int64(file, count):
+    return list(struct.unpack(f'<{count}q', _read_exact(file, 8 * count)))
+
+
+def iter_columnar_groups(file):
+    """
+    Read a columnar export back one row group at a time, as a dict of column name to
+    list of values. Raises ValueError if the file is not a complete export.
+    """
+    header = _read_exact(file, len(COLUMNAR_MAGIC) + 1)
+    if header[:-1] != COLUMNAR_MAGIC or header[-1] != COLUMNAR_VERSION:
+        raise ValueError("Not a card columnar export")
+
+    total = 0
+    while True:
+        count, = struct.unpack('<I', _read_exact(file, 4))
+        if count == 0:
+            expected, = struct.unpack('<Q', _read_exact(file, 8))
+            if expected != total or _read_exact(file, len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+                raise ValueError("Corrupt columnar export footer")
+            return
+
+        group = {
+            'id': _read_uuids(file, count),
+            'correlative_id': _read_strings(file, count),
+            'event_id': _read_uuids(file, count),
+            'user_id': [value or None for value in _read_int64(file, count)],
+            'transaction_id': _read_strings(file, count),
+            'is_winner': [bool(value) for value in _read_exact(file, count)],
+            'created_at': _read_int64(file, count),
+        }
+        grid_bytes = _read_exact(file, 25 * count)
+        group['grid'] = [list(grid_bytes[i * 25:(i + 1) * 25]) for i in range(count)]
+        total += count
+        yield group
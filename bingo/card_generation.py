@@ -0,0 +1,91 @@
+"""
+Random card grids, one at a time or in bulk.
+
+Bulk generation builds all the grids of a batch at once with NumPy: for every card and
+column the 15 candidates are shuffled in one vectorized call and the first 5 are kept.
+The result is a compact (count, 25) uint8 matrix; the legacy ["B1", ...] strings are
+only formatted when a card is actually stored.
+"""
+import random
+
+from .win_patterns import grid_to_numbers
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Cards per vectorized call, bounds the temporary arrays
+MATRIX_CHUNK_SIZE = 50000
+
+
+def generate_grid():
+    """Random row-major grid of 25 integers, 0 is the free space in the center"""
+    # B: 1-15, I: 16-30, N: 31-45, G: 46-60, O: 61-75
+    columns = [random.sample(range(col * 15 + 1, col * 15 + 16), 5) for col in range(5)]
+    grid = [columns[pos % 5][pos // 5] for pos in range(25)]
+    grid[12] = 0  # Free space
+    return grid
+
+
+def generate_card_numbers():
+    """
+    Generate a valid bingo card with numbers in the correct range for each column.
+    Card format: ["B1", "I16", "N31", "G46", "O61", "B3", ...] (25 elements, "N0" is the free space)
+
+    Numbers are arranged in row-major order: position = row * 5 + column, so each
+    row of the list reads B, I, N, G, O:
+    0  1  2  3  4
+    5  6  7  8  9
+    10 11 12 13 14 (free space at 12)
+    15 16 17 18 19
+    20 21 22 23 24
+    Positions 0, 5, 10, 15, 20 hold the B column (1-15), 1, 6, 11, 16, 21 the I column, etc.
+    """
+    return grid_to_numbers(generate_grid())
+
+
+def _generate_matrix(count, rng):
+    # Shuffle the 15 offsets of every (card, column) in place; the first 5 are kept
+    picks = np.broadcast_to(np.arange(15, dtype=np.uint8), (count, 5, 15)).copy()
+    rng.permuted(picks, axis=2, out=picks)
+    picks = picks[:, :, :5] + (np.arange(5, dtype=np.uint8) * 15 + 1)[None, :, None]
+    # (card, col, row) -> row-major (card, row * 5 + col)
+    matrix = np.ascontiguousarray(picks.transpose(0, 2, 1)).reshape(count, 25)
+    matrix[:, 12] = 0  # Free space
+    return matrix
+
+
+class GridBatch:
+    """
+    `count` grids as one matrix, row-major with 0 as the free space: a NumPy uint8
+    array, or a list of lists when NumPy is not installed. Iterating yields each grid
+    as a list of ints and numbers() formats the legacy strings lazily.
+    """
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def __iter__(self):
+        rows = self.matrix.tolist() if hasattr(self.matrix, 'tolist') else self.matrix
+        return iter(rows)
+
+    def numbers(self):
+        """Cards in the stored format, formatted one at a time"""
+        return (grid_to_numbers(grid) for grid in self)
+
+
+def generate_grids(count):
+    """Generate `count` random grids in one pass"""
+    if np is None:
+        return GridBatch([generate_grid() for _ in range(count)])
+
+    rng = np.random.default_rng()
+    chunks = [_generate_matrix(min(MATRIX_CHUNK_SIZE, count - start), rng)
+              for start in range(0, count, MATRIX_CHUNK_SIZE)]
+    if not chunks:
+        return GridBatch(np.empty((0, 25), dtype=np.uint8))
+    return GridBatch(chunks[0] if len(chunks) == 1 else np.concatenate(chunks))
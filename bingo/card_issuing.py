@@ -0,0 +1,259 @@
+import hashlib
+import json
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .card_derivation import derive_grid
+from .card_generation import generate_grids
+from .event_stats import add_stats
+from .models import BingoCard, CardBatch, CardPurchase, CorrelativeSequence, Event, TestCoinBalance
+from .win_patterns import grid_fingerprint, grid_to_numbers
+
+# CorrelativeSequence prefix that hands out derived card indices
+SEED_INDEX_SEQUENCE = '#seed'
+
+
+def existing_fingerprints(event, fingerprints):
+    """Subset of `fingerprints` already issued in the event, looked up in chunks on the unique index"""
+    fingerprints = list(fingerprints)
+    chunk_size = settings.CARD_BULK_CREATE_BATCH_SIZE
+    taken = set()
+    for start in range(0, len(fingerprints), chunk_size):
+        taken.update(BingoCard.objects.filter(
+            event=event, fingerprint__in=fingerprints[start:start + chunk_size]
+        ).values_list('fingerprint', flat=True))
+    return taken
+
+
+def generate_unique_grids(event, quantity, exclude=()):
+    """
+    Generate `quantity` grids whose fingerprints are unique within the batch and
+    not yet issued in the event (nor in `exclude`).
+
+    Returns:
+        dict fingerprint -> grid
+    """
+    grids = {}
+    excluded = set(exclude)
+    while len(grids) < quantity:
+        fresh = {}
+        while len(grids) + len(fresh) < quantity:
+            for grid in generate_grids(quantity - len(grids) - len(fresh)):
+                fingerprint = grid_fingerprint(grid)
+                if fingerprint not in grids and fingerprint not in excluded:
+                    fresh[fingerprint] = grid
+        # Collisions with issued cards are dropped and generated again in the next round
+        taken = existing_fingerprints(event, fresh)
+        excluded |= taken
+        grids.update((fp, grid) for fp, grid in fresh.items() if fp not in taken)
+    return grids
+
+
+def new_batch_metadata(quantity):
+    """Metadata stored on every card of a seller batch, identified by its transaction_id"""
+    return {
+        'transaction_id': str(uuid.uuid4()),
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'batch_size': quantity
+    }
+
+
+def record_batch(event, seller, metadata, price_paid=None):
+    """
+    CardBatch of the cards built with `metadata`, created on first use.
+    Returns (batch, created); (None, False) without a transaction_id. The caller adds
+    `price_paid` to the event revenue when the batch was created, together with its
+    other stats right before committing, so the EventStats row is locked only briefly.
+    """
+    batch_id = CardBatch.id_for(metadata)
+    if batch_id is None:
+        return None, False
+    return CardBatch.objects.get_or_create(
+        id=batch_id,
+        defaults={
+            'seller': seller,
+            'event': event,
+            'size': metadata.get('batch_size') or 0,
+            'price_paid': price_paid
+        }
+    )
+
+
+def _set_grid(card, fingerprint, grid):
+    # A derived card that collided becomes a stored card with the new grid
+    card.seed_index = None
+    card.numbers = grid_to_numbers(grid)
+    card.fingerprint = fingerprint
+    # Create a unique hash for the card
+    card.hash = hashlib.sha256(
+        f"{card.user_id}-{card.event_id}-{json.dumps(card.numbers)}-{uuid.uuid4()}".encode()
+    ).hexdigest()
+
+
+def build_cards(event, user, quantity, metadata=None):
+    """
+    Build `quantity` unsaved cards in memory with grids not yet issued in the event.
+    """
+    cards = []
+    for fingerprint, grid in generate_unique_grids(event, quantity).items():
+        card = BingoCard(
+            event=event,
+            user=user,
+            is_winner=False,
+            batch_id=CardBatch.id_for(metadata),
+            metadata=dict(metadata) if metadata else {}
+        )
+        _set_grid(card, fingerprint, grid)
+        cards.append(card)
+    return cards
+
+
+def uses_derived_storage(quantity):
+    """Large batches store (event seed, index) instead of numbers, see CARD_DERIVED_STORAGE_MIN_BATCH"""
+    min_batch = settings.CARD_DERIVED_STORAGE_MIN_BATCH
+    return bool(min_batch) and quantity >= min_batch
+
+
+def build_derived_cards(event, user, quantity, metadata=None):
+    """
+    Build `quantity` unsaved derived cards: only the event seed index is stored and the
+    numbers are derived when the card is read. Indices come from a per-event sequence,
+    so they never repeat, and indices whose grid was already issued are skipped.
+    The fingerprint is stored like on any card, so the (event, fingerprint) constraint
+    also rejects a grid issued concurrently; the batch metadata is not copied onto each
+    card, the batch FK points to it.
+    """
+    seed = event.ensure_card_seed()
+    cards = []
+    while len(cards) < quantity:
+        missing = quantity - len(cards)
+        first = CorrelativeSequence.reserve(event, SEED_INDEX_SEQUENCE, missing)
+        candidates = {grid_fingerprint(derive_grid(seed, index)): index
+                      for index in range(first, first + missing)}
+        taken = existing_fingerprints(event, candidates)
+        cards.extend(
+            BingoCard(
+                event=event,
+                user=user,
+                is_winner=False,
+                seed_index=index,
+                fingerprint=fingerprint,
+                batch_id=CardBatch.id_for(metadata)
+            )
+            for fingerprint, index in candidates.items() if fingerprint not in taken
+        )
+    return cards
+
+
+def insert_cards(event, cards):
+    """
+    bulk_create the cards in chunks. If another batch issued one of the grids
+    concurrently, only the colliding cards get new grids and the insert is retried.
+    """
+    retries = settings.CARD_FINGERPRINT_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                BingoCard.objects.bulk_create(
+                    cards, batch_size=settings.CARD_BULK_CREATE_BATCH_SIZE)
+            for card in cards:
+                if card.is_derived:
+                    card.derive_numbers()
+            return cards
+        except IntegrityError:
+            taken = existing_fingerprints(
+                event, [card.fingerprint for card in cards if card.fingerprint])
+            if not taken or attempt == retries:
+                raise
+            replacements = iter(generate_unique_grids(
+                event, len(taken), exclude=[card.fingerprint for card in cards]).items())
+            for card in cards:
+                if card.fingerprint in taken:
+                    _set_grid(card, *next(replacements))
+
+
+def assign_correlatives(event, cards, reserved=()):
+    """Give the built cards the `reserved` correlative ids, reserving any missing ones in one call"""
+    correlative_ids = list(reserved)[:len(cards)]
+    if len(correlative_ids) < len(cards):
+        correlative_ids += BingoCard.reserve_correlative_ids(event, len(cards) - len(correlative_ids))
+    for card, correlative_id in zip(cards, correlative_ids):
+        card.correlative_id = correlative_id
+    return cards
+
+
+def issue_cards(event, user, quantity, metadata=None):
+    """Generate and store `quantity` cards without charging for them"""
+    record_batch(event, user, metadata)
+    cards = assign_correlatives(event, build_cards(event, user, quantity, metadata))
+    return insert_cards(event, cards)
+
+
+def purchase_cards(user, event, quantity, unit_price, metadata=None, lock=None):
+    """
+    Charge the user and issue `quantity` cards.
+
+    Cards are taken from the event's pre-generated pool (see card_pool) and only the
+    shortfall is generated inline. The balance row is locked last, so it is held only
+    for the deduction and the purchase counter. Correlatives for the cards the pool
+    is not expected to cover are reserved before the transaction, so the sequence row
+    is not locked until the purchase commits; unused ones are gaps in the numbering.
+    When the caller holds the balance `lock`, the deduction is fenced with its token
+    (see TestCoinBalance.deduct_coins) and raises LockLost if a newer holder wrote the balance.
+
+    Returns:
+        (True, {'cards', 'balance', 'card_purchase', 'total_cost'}) on success
+        (False, message) if the balance is insufficient
+    """
+    total_cost = (Decimal(str(unit_price)) * quantity).quantize(Decimal('0.01'))
+
+    balance, created = TestCoinBalance.objects.get_or_create(user=user)
+    current_balance = Decimal(str(balance.balance)).quantize(Decimal('0.01'))
+    if current_balance < total_cost:
+        return False, f"No tienes saldo suficiente. Necesitas tener {total_cost:.2f}, y tu saldo es {current_balance:.2f}."
+
+    pooled = BingoCard.objects.filter(event=event, user__isnull=True)[:quantity].count()
+    reserved = BingoCard.reserve_correlative_ids(event, quantity - pooled) if pooled < quantity else []
+
+    with transaction.atomic():
+        _, batch_created = record_batch(event, user, metadata, total_cost)
+        # SKIP LOCKED lets concurrent purchases take disjoint cards without waiting
+        cards = BingoCard.claim_from_pool(event, user, quantity, metadata)
+        shortfall = quantity - len(cards)
+        if shortfall:
+            # Concurrent purchases may have drained the pool since it was counted
+            cards += insert_cards(event, assign_correlatives(
+                event, build_cards(event, user, shortfall, metadata), reserved))
+
+        success, balance = TestCoinBalance.deduct_coins(
+            user.id, total_cost, fence=lock.token if lock is not None else None)
+        if not success:
+            # Claimed cards return to the pool, generated ones are discarded
+            transaction.set_rollback(True)
+            return False, balance
+
+        purchases = CardPurchase.objects.filter(user=user, event=event)
+        created = False
+        if not purchases.update(cards_owned=F('cards_owned') + quantity):
+            # First purchase in the event; a concurrent first purchase makes get_or_create fetch its row
+            _, created = CardPurchase.objects.get_or_create(
+                user=user,
+                event=event,
+                defaults={"cards_owned": 0}
+            )
+            purchases.update(cards_owned=F('cards_owned') + quantity)
+        card_purchase = purchases.get()
+        add_stats(event.id, cards_sold=quantity, unique_players=int(created),
+                  revenue=total_cost if batch_created else 0)
+
+    return True, {
+        'cards': cards,
+        'balance': balance,
+        'card_purchase': card_purchase,
+        'total_cost': total_cost
+    }
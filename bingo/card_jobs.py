@@ -0,0 +1,263 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+
+from .card_issuing import (
+    assign_correlatives, build_cards, build_derived_cards, insert_cards, record_batch, uses_derived_storage,
+)
+from .event_stats import add_stats
+from .locks import LockLost, LockTimeout, balance_lock_name, get_lock_manager
+from .models import CardBatch, CardGenerationJob, CardPurchase, TestCoinBalance
+from .pdf_artifacts import warm_transaction_pdf
+
+logger = logging.getLogger(__name__)
+
+
+class JobReclaimed(Exception):
+    """Another worker claimed the job after this one stopped reporting progress"""
+
+
+def user_group_name(user_id):
+    """Channel group that receives a user's job progress"""
+    return f"bingo_user_{user_id}"
+
+
+def job_payload(job):
+    return {
+        'id': str(job.id),
+        'event_id': str(job.event_id),
+        'status': job.status,
+        'quantity': job.quantity,
+        'cards_generated': job.cards_generated,
+        'progress': job.progress,
+        'transaction_id': str(job.transaction_id),
+        'error': job.error,
+    }
+
+
+def publish_progress(job):
+    """Push the job state to the owner's websocket group"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            user_group_name(job.user_id),
+            {
+                'type': 'card_job_progress',
+                'job': job_payload(job)
+            }
+        )
+    except Exception as e:
+        logger.warning(f"No se pudo publicar el progreso del trabajo {job.id}: {str(e)}")
+
+
+def submit_job(user, event, quantity, unit_price, lock=None):
+    """
+    Charge the whole batch and queue it. Constant work regardless of quantity:
+    the cards are generated later by the job workers.
+
+    Returns:
+        (True, {'job', 'balance'}) on success
+        (False, message) if the balance is insufficient
+    """
+    unit_price = Decimal(str(unit_price)).quantize(Decimal('0.01'))
+    TestCoinBalance.objects.get_or_create(user=user)
+
+    with transaction.atomic():
+        success, balance = TestCoinBalance.deduct_coins(
+            user.id, unit_price * quantity, fence=lock.token if lock is not None else None)
+        if not success:
+            return False, balance
+
+        job = CardGenerationJob.objects.create(
+            user=user,
+            event=event,
+            quantity=quantity,
+            unit_price=unit_price
+        )
+
+    return True, {'job': job, 'balance': balance}
+
+
+def claim_next_job():
+    """
+    Take the oldest pending job, or a running one whose worker stopped reporting
+    progress. SKIP LOCKED lets several workers claim jobs concurrently.
+    """
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=settings.CARD_JOB_STALE_AFTER)
+
+    with transaction.atomic():
+        job = CardGenerationJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=CardGenerationJob.STATUS_PENDING) |
+            Q(status=CardGenerationJob.STATUS_RUNNING, updated_at__lt=stale)
+        ).order_by('created_at').first()
+        if job is None:
+            return None
+
+        job.status = CardGenerationJob.STATUS_RUNNING
+        job.started_at = job.started_at or now
+        job.attempt += 1
+        job.save(update_fields=['status', 'started_at', 'attempt', 'updated_at'])
+
+    return CardGenerationJob.objects.select_related('event', 'user').get(pk=job.pk)
+
+
+def _owned(job):
+    """The job row, only while `job` is the current attempt (see CardGenerationJob.attempt)"""
+    return CardGenerationJob.objects.filter(
+        pk=job.pk, attempt=job.attempt, status=CardGenerationJob.STATUS_RUNNING)
+
+
+def process_job(job):
+    """
+    Generate the remaining cards of a job in chunks of CARD_JOB_CHUNK_SIZE.
+    Each chunk commits its cards together with the job progress, so a job resumed
+    by another worker continues from `cards_generated`. Progress is only recorded by
+    the worker of the job's current attempt: a worker whose job was claimed again
+    rolls its chunk back and stops.
+    """
+    metadata = {
+        'transaction_id': str(job.transaction_id),
+        'generated_at': job.created_at.isoformat(),
+        'batch_size': job.quantity,
+        'job_id': str(job.id)
+    }
+    # Print runs above CARD_DERIVED_STORAGE_MIN_BATCH only store the derivation index
+    build = build_derived_cards if uses_derived_storage(job.quantity) else build_cards
+    publish_progress(job)
+
+    try:
+        price_paid = job.unit_price * job.quantity
+        with transaction.atomic():
+            _, batch_created = record_batch(job.event, job.user, metadata, price_paid)
+            card_purchase, created = CardPurchase.objects.get_or_create(
+                user=job.user,
+                event=job.event,
+                defaults={"cards_owned": 0}
+            )
+            add_stats(job.event_id, unique_players=int(created),
+                      revenue=price_paid if batch_created else 0)
+
+        while job.cards_generated < job.quantity:
+            count = min(settings.CARD_JOB_CHUNK_SIZE, job.quantity - job.cards_generated)
+            cards = assign_correlatives(
+                job.event, build(job.event, job.user, count, metadata))
+
+            with transaction.atomic():
+                # Locks the job row until the chunk commits
+                if not _owned(job).update(
+                        cards_generated=F('cards_generated') + count,
+                        updated_at=datetime.now(timezone.utc)):
+                    raise JobReclaimed(job.id)
+                insert_cards(job.event, cards)
+                CardPurchase.objects.filter(pk=card_purchase.pk).update(
+                    cards_owned=F('cards_owned') + count)
+                add_stats(job.event_id, cards_sold=count)
+
+            job.cards_generated += count
+            publish_progress(job)
+
+        job.finished_at = datetime.now(timezone.utc)
+        if not _owned(job).update(status=CardGenerationJob.STATUS_COMPLETED,
+                                  finished_at=job.finished_at, updated_at=job.finished_at):
+            raise JobReclaimed(job.id)
+        job.status = CardGenerationJob.STATUS_COMPLETED
+        publish_progress(job)
+
+        if settings.CARD_PDF_ARTIFACT_WARM:
+            warm_job_pdf(job)
+
+    except JobReclaimed:
+        logger.warning(f"El trabajo {job.id} fue tomado por otro worker, se abandona el intento {job.attempt}")
+    except Exception as e:
+        logger.error(f"Error generando el trabajo {job.id}: {str(e)}", exc_info=True)
+        fail_job(job, str(e))
+
+
+def warm_job_pdf(job):
+    """Render the batch PDF in the worker so the seller's download is served from the store"""
+    try:
+        warm_transaction_pdf(job.user_id, str(job.transaction_id))
+    except Exception as e:
+        logger.warning(f"No se pudo precalentar el PDF del trabajo {job.id}: {str(e)}")
+
+
+def fail_job(job, error):
+    """
+    Mark the job failed and refund the cards that were not generated, also from the batch
+    revenue. Does nothing if another worker claimed the job again.
+    The refund is written under the user's balance lock and fenced with its token, like
+    every other balance change; if the lock cannot be taken or is lost, the job is left
+    running so it is reclaimed once its lease expires.
+    """
+    try:
+        lock = get_lock_manager().acquire(
+            balance_lock_name(job.user_id), timeout=settings.LOCK_ACQUIRE_TIMEOUT, auto_renew=True)
+    except LockTimeout:
+        logger.warning(f"Saldo bloqueado, el trabajo {job.id} se reintentará al expirar su lease")
+        return
+
+    try:
+        with transaction.atomic():
+            current = _owned(job).select_for_update().first()
+            if current is None:
+                return
+            refund = job.unit_price * (job.quantity - current.cards_generated)
+
+            TestCoinBalance.credit_coins(job.user_id, refund, fence=lock.token)
+            # The batch is not recorded yet if the job failed before its first chunk
+            if refund and CardBatch.objects.filter(id=job.transaction_id).update(
+                    price_paid=F('price_paid') - refund):
+                add_stats(job.event_id, revenue=-refund)
+            job.cards_generated = current.cards_generated
+            job.status = CardGenerationJob.STATUS_FAILED
+            job.error = error
+            job.finished_at = datetime.now(timezone.utc)
+            job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+    except LockLost:
+        logger.warning(f"Lock del saldo perdido, el trabajo {job.id} se reintentará al expirar su lease")
+        return
+    finally:
+        lock.release()
+
+    publish_progress(job)
+
+
+def run_worker(once=False, poll_interval=None):
+    """Process jobs until none are left (once) or forever, sleeping while the queue is empty"""
+    poll_interval = settings.CARD_JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    while True:
+        close_old_connections()
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        process_job(job)
+
+
+def run_worker_pool(workers, once=False, poll_interval=None):
+    """Run `workers` job workers in threads, each with its own database connection"""
+    def target():
+        try:
+            run_worker(once=once, poll_interval=poll_interval)
+        finally:
+            close_old_connections()
+
+    threads = [threading.Thread(target=target, name=f"card-job-worker-{i}", daemon=True)
+               for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
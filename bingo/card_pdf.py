@@ -0,0 +1,694 @@
+"""
+PDF de cartones de bingo, compartido por las descargas, el envío por email y el admin.
+
+Los cartones llegan como registros ya resueltos (id, correlativo, cuadrícula) leídos en
+una sola consulta, así que renderizar no toca la base de datos. Estilos, estilos de tabla
+y logo se construyen una vez por proceso y el encabezado una vez por documento. Las
+páginas se dibujan de a una, así que la memoria no crece con los flowables del lote, y
+los lotes grandes se reparten entre varios procesos y se unen con pypdf.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from itertools import chain, islice
+
+import django
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.template.loader import render_to_string
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Image, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus.frames import Frame
+
+from core.streaming import streaming_content
+
+from .card_derivation import derive_grid
+from .models import BingoCard, Event
+from .win_patterns import parse_card_numbers
+
+try:
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import (
+        ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, StreamObject,
+    )
+except ImportError:
+    PdfReader = PdfWriter = None
+
+# Cartón listo para imprimir: `grid` es row-major con 0 en el espacio libre
+PdfCard = namedtuple('PdfCard', ['id', 'correlative_id', 'grid'])
+
+CARDS_PER_PAGE = 4  # Grid de 2x2
+RESPONSE_CHUNK_SIZE = 64 * 1024
+PAGE_MARGIN = 0.3*inch  # Márgenes reducidos
+
+# Modos de render: tablas platypus o dibujo directo en el canvas (más rápido)
+RENDERER_PLATYPUS = 'platypus'
+RENDERER_CANVAS = 'canvas'
+PDF_RENDERERS = (RENDERER_PLATYPUS, RENDERER_CANVAS)
+# Subir al cambiar el aspecto de los PDFs: invalida los guardados (ver pdf_artifacts)
+PDF_LAYOUT_VERSION = 1
+
+# Coordenadas del modo canvas, tomadas de las que resultan del layout platypus en letter
+CANVAS_HEADER_ORIGIN = (54, 693.6)
+CANVAS_CARD_ORIGINS = ((64.8, 405.4), (331.2, 405.4), (64.8, 119.4), (331.2, 119.4))
+CANVAS_CELL = 0.55*inch
+CANVAS_LETTERS_HEIGHT = 0.25*inch
+
+# Procesos de render paralelo, se crean con el primer PDF grande y se reutilizan
+_pool = None
+_pool_lock = threading.Lock()
+
+GRID_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 5),  # Reducir padding
+    ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+    ('TOPPADDING', (0, 0), (-1, -1), 5),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+])
+
+BINGO_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('BACKGROUND', (0, 0), (4, 0), colors.lightgrey),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),  # Fuente más pequeña
+    ('FONTSIZE', (0, 0), (4, 0), 12),
+    ('FONTNAME', (0, 0), (4, 0), 'Helvetica-Bold'),
+])
+
+CONTAINER_STYLE = TableStyle([
+    ('SPAN', (0, 2), (1, 2)),
+    ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+    ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+HEADER_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('SPAN', (0, 0), (0, -1)),  # Logo spans all rows
+    ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+])
+
+
+@lru_cache(maxsize=None)
+def _styles():
+    return getSampleStyleSheet()
+
+
+@lru_cache(maxsize=None)
+def _logo_path():
+    """Ruta del logo, o None si no existe; se comprueba una sola vez por proceso"""
+    logo_path = os.path.join(settings.BASE_DIR, 'static', 'images', 'bingo_logo.png')
+    return logo_path if os.path.exists(logo_path) else None
+
+
+def _is_card_uuid(card_id):
+    return isinstance(card_id, str) and len(card_id) > 10  # Probablemente es un UUID
+
+
+def iter_card_records(queryset):
+    """
+    Registros PdfCard de los cartones del queryset, leídos con un cursor en bloques de
+    CARD_PDF_CHUNK_SIZE filas en lugar de cargar todo el resultado.
+    """
+    rows = queryset.values_list(
+        'id', 'correlative_id', 'numbers', 'event_id', 'seed_index'
+    ).iterator(chunk_size=settings.CARD_PDF_CHUNK_SIZE)
+    for card_id, correlative_id, numbers, event_id, seed_index in rows:
+        if numbers is None and seed_index is not None:
+            # Cartón derivado: values_list no pasa por BingoCard.from_db
+            grid = list(derive_grid(Event.card_seed_for(event_id), seed_index))
+        else:
+            grid = parse_card_numbers(numbers)
+        yield PdfCard(str(card_id), correlative_id, grid)
+
+
+def card_records(queryset):
+    """Registros PdfCard de los cartones del queryset, en una sola consulta"""
+    return list(iter_card_records(queryset))
+
+
+def payload_records(cards, event):
+    """
+    Registros PdfCard de los cartones enviados por el cliente: dicts con 'numbers' (y
+    opcionalmente 'id') o directamente la lista de números. Los correlativos de los ids
+    conocidos se buscan todos juntos en una consulta.
+    """
+    # Si cards es un string (JSON), convertirlo
+    if isinstance(cards, str):
+        cards = json.loads(cards)
+
+    entries = []
+    for position, card in enumerate(cards, start=1):
+        # Extraer los números del cartón según su estructura
+        if isinstance(card, dict) and 'numbers' in card:
+            entries.append((card.get('id', position), card['numbers']))
+        else:
+            entries.append((position, card))
+
+    card_ids = [card_id for card_id, _ in entries if _is_card_uuid(card_id)]
+    correlatives = {}
+    if card_ids:
+        try:
+            correlatives = {
+                str(card_id): correlative_id
+                for card_id, correlative_id in BingoCard.objects.filter(
+                    event=event, id__in=card_ids
+                ).values_list('id', 'correlative_id')
+            }
+        except Exception:
+            # Ids inválidos: se muestran tal cual, sin correlativo
+            pass
+
+    return [PdfCard(card_id, correlatives.get(str(card_id)), parse_card_numbers(numbers))
+            for card_id, numbers in entries]
+
+
+def header_date(event):
+    # Ensure date is displayed properly, defaulting to current date if not available
+    if hasattr(event, 'date') and event.date:
+        return event.date.strftime('%d/%m/%Y')
+    # Fallback to current date instead of "TBD"
+    return datetime.now().strftime('%d/%m/%Y')
+
+
+def create_header(event):
+    """Crea el encabezado con logo y datos del evento (versión compacta)"""
+    styles = _styles()
+
+    logo_path = _logo_path()
+    if logo_path:
+        logo = Image(logo_path, width=0.9*inch, height=0.9*inch)
+    else:
+        logo = Paragraph(
+            "<font size='10'>BINGO APP</font>", styles['Normal'])
+
+    # Encabezado más compacto
+    event_title = Paragraph(f"<b>{event.name}</b>", styles['Normal'])
+
+    event_date = Paragraph(
+        f"<font size='8'>Fecha: {header_date(event)}</font>", styles['Normal'])
+    event_info = Paragraph(
+        f"<font size='8'>ID: {event.id}</font>", styles['Normal'])
+
+    header_data = [
+        [logo, event_title],
+        ['', event_date],
+        ['', event_info]
+    ]
+
+    # If event has location, add it
+    if hasattr(event, 'location') and event.location:
+        location_info = Paragraph(
+            f"<font size='8'>Lugar: {event.location}</font>", styles['Normal'])
+        header_data.append(['', location_info])
+
+    header = Table(header_data, colWidths=[0.8*inch, 6.2*inch])
+    header.setStyle(HEADER_STYLE)
+    return header
+
+
+def create_card_table(card, event):
+    """Crea la representación en tabla de un cartón de bingo con datos adicionales"""
+    styles = _styles()
+    container_data = []
+
+    # Mostrar el correlativo si existe, si no el id recibido
+    display_id = card.correlative_id or card.id
+
+    # Get seller info if available
+    user = getattr(event, 'user', None)
+    if user:
+        seller_info = Paragraph(
+            f"<font size='7'>Vendedor: {user.username}</font>", styles['Normal'])
+        container_data.append([seller_info, ''])
+
+    # Encabezado del cartón: título y ID (pequeño y compacto)
+    container_data.append([Paragraph(
+        "<font size='10'>BINGO CARD</font>", styles['Normal'])])
+    container_data.append([Paragraph(
+        f"<font size='7'>Evento: {event.name}</font>", styles['Normal']), ''])
+    container_data.append([Paragraph(
+        f"<font size='7'>ID: {display_id}</font>", styles['Normal']), ''])
+
+    # Creación de la cuadrícula del cartón: encabezado y 5x5
+    table_data = [['B', 'I', 'N', 'G', 'O']]
+    for row in range(5):
+        row_data = []
+        for col in range(5):
+            index = row * 5 + col
+            if index < len(card.grid):
+                val = card.grid[index]
+                # Si es el centro y el valor es 0, mostrar "FREE"
+                row_data.append("FREE" if index == 12 and val == 0 else str(val))
+            else:
+                row_data.append("")
+        table_data.append(row_data)
+
+    # Tabla más compacta
+    bingo_table = Table(table_data, colWidths=[
+                        0.55*inch]*5, rowHeights=[0.25*inch] + [0.55*inch]*5)
+    bingo_table.setStyle(BINGO_TABLE_STYLE)
+
+    # Integrar la cuadrícula en el contenedor del cartón
+    container_data.append([bingo_table, ''])
+    container = Table(container_data, colWidths=[2.2*inch, 0.8*inch])
+    container.setStyle(CONTAINER_STYLE)
+    return container
+
+
+def create_page_grid(page_cards, event):
+    """Tabla 2x2 con los cartones de una página; las posiciones vacías quedan en blanco"""
+    tables = [create_card_table(card, event) for card in page_cards]
+    while len(tables) < CARDS_PER_PAGE:
+        tables.append(Spacer(3*inch, 3*inch))
+
+    grid = Table([tables[:2], tables[2:]], colWidths=[3.7*inch, 3.7*inch])
+    grid.setStyle(GRID_STYLE)
+    return grid
+
+
+def add_back_page_content(canvas):
+    """Contenido mejorado en la contraportada"""
+    canvas.saveState()
+
+    # Texto de copyright con fecha e información adicional
+    canvas.setFont('Helvetica', 6)
+    canvas.setFillColorRGB(0.5, 0.5, 0.5)  # Gris claro para no distraer
+
+    # Add current date/time
+    current_time = datetime.now().strftime("%d/%m/%Y %H:%M")
+    footer_text = f"© Bingo App - Generado: {current_time}"
+
+    canvas.drawCentredString(4.25*inch, 0.2*inch, footer_text)
+
+    canvas.restoreState()
+
+
+def add_page_number(canvas, page_number):
+    """Agrega numeración de página discreta"""
+    canvas.saveState()
+    canvas.setFont('Helvetica', 6)  # Fuente más pequeña
+    page_text = f"Página {page_number}"
+    canvas.drawRightString(8*inch, 0.2*inch, page_text)
+
+    # Solo agregar texto de copyright en la última página
+    if page_number % 2 == 0:  # Páginas pares
+        add_back_page_content(canvas)
+
+    canvas.restoreState()
+
+
+def iter_pages(records):
+    """Agrupa los registros (lista o iterador) en páginas de CARDS_PER_PAGE"""
+    records = iter(records)
+    while True:
+        page_cards = list(islice(records, CARDS_PER_PAGE))
+        if not page_cards:
+            return
+        yield page_cards
+
+
+def _platypus_page_drawer(event):
+    """Páginas con tablas platypus: el cartón se maqueta como tablas anidadas"""
+    width, height = letter
+    # El encabezado es igual en todas las páginas: se construye una vez
+    header = create_header(event)
+
+    def draw_page(canvas, page_cards):
+        # Frame que ocupa toda la página menos los márgenes
+        frame = Frame(PAGE_MARGIN, PAGE_MARGIN, width - 2*PAGE_MARGIN, height - 2*PAGE_MARGIN,
+                      id='normal', showBoundary=0)
+        elements = [header, Spacer(1, 0.1*inch)]  # Reducir espacio
+        if page_cards:
+            elements.append(create_page_grid(page_cards, event))
+        frame.addFromList(elements, canvas)
+
+    return draw_page
+
+
+def draw_canvas_header(canvas, event, date_str):
+    """Encabezado del modo canvas, en la posición que ocupa la tabla platypus"""
+    x, y = CANVAS_HEADER_ORIGIN
+    logo_path = _logo_path()
+    if logo_path:
+        canvas.drawImage(logo_path, x - 3.6, y + 3, 0.9*inch, 0.9*inch, mask='auto')
+    else:
+        canvas.setFont('Helvetica', 10)
+        canvas.drawString(x + 6, y + 57.8, "BINGO APP")
+
+    canvas.setFont('Helvetica-Bold', 10)
+    canvas.drawString(x + 63.6, y + 57.8, event.name)
+    canvas.setFont('Helvetica', 8)
+    canvas.drawString(x + 63.6, y + 36.2, f"Fecha: {date_str}")
+    canvas.drawString(x + 63.6, y + 12.6, f"ID: {event.id}")
+
+
+def draw_canvas_card(canvas, card, event, x, y):
+    """Cartón del modo canvas con origen (x, y) en la esquina inferior izquierda"""
+    canvas.setFont('Helvetica', 10)
+    canvas.drawString(x + 6, y + 263, "BINGO CARD")
+    canvas.setFont('Helvetica', 7)
+    canvas.drawString(x + 6, y + 248, f"Evento: {event.name}")
+    canvas.drawString(x + 6, y + 230, f"ID: {card.correlative_id or card.id}")
+
+    # Cuadrícula 5x5 con la fila de letras, 6 pt por encima del borde inferior
+    left, bottom = x + 6, y + 3
+    cell = CANVAS_CELL
+    canvas.setFillColor(colors.lightgrey)
+    canvas.rect(left, bottom + 5*cell, 5*cell, CANVAS_LETTERS_HEIGHT, stroke=0, fill=1)
+    canvas.setFillColor(colors.black)
+
+    canvas.setFont('Helvetica-Bold', 12)
+    for col, letter_text in enumerate('BINGO'):
+        canvas.drawCentredString(left + (col + 0.5)*cell, bottom + 5*cell + 3, letter_text)
+
+    canvas.setFont('Helvetica', 10)
+    for index, value in enumerate(card.grid[:25]):
+        row, col = divmod(index, 5)
+        text = "FREE" if index == 12 and value == 0 else str(value)
+        canvas.drawCentredString(left + (col + 0.5)*cell, bottom + (4 - row)*cell + 15.8, text)
+
+    canvas.grid([left + col*cell for col in range(6)],
+                [bottom + row*cell for row in range(6)] + [bottom + 5*cell + CANVAS_LETTERS_HEIGHT])
+
+
+def _canvas_page_drawer(event):
+    """Páginas dibujadas directamente en el canvas con coordenadas precalculadas"""
+    date_str = header_date(event)
+
+    def draw_page(canvas, page_cards):
+        canvas.saveState()
+        canvas.setLineWidth(1)
+        canvas.setLineCap(1)
+        canvas.setLineJoin(1)
+        draw_canvas_header(canvas, event, date_str)
+        for card, (x, y) in zip(page_cards, CANVAS_CARD_ORIGINS):
+            draw_canvas_card(canvas, card, event, x, y)
+        canvas.restoreState()
+
+    return draw_page
+
+
+PAGE_DRAWERS = {
+    RENDERER_PLATYPUS: _platypus_page_drawer,
+    RENDERER_CANVAS: _canvas_page_drawer,
+}
+
+
+def write_cards_pdf(records, event, output, first_page=1, renderer=RENDERER_PLATYPUS):
+    """
+    Escribe en `output` un PDF con los cartones de bingo en un grid 2x2 por página.
+
+    Cada página se arma y se dibuja directamente en el canvas antes de pasar a la
+    siguiente, así que solo los flowables de una página están en memoria y `records`
+    puede ser un iterador que se va leyendo de la base de datos. `first_page` es el
+    número de la primera página cuando el documento es un tramo de uno mayor.
+    `renderer` elige entre las tablas platypus y el dibujo directo en el canvas.
+
+    Returns:
+        Número de páginas escritas
+    """
+    canvas = Canvas(output, pagesize=letter)
+    draw_page = PAGE_DRAWERS[renderer](event)
+    pages = 0
+    for page_cards in chain(iter_pages(records), [[]]):
+        # Una página vacía solo si no hay cartones
+        if page_cards or not pages:
+            add_page_number(canvas, first_page + pages)
+            draw_page(canvas, page_cards)
+            canvas.showPage()
+            pages += 1
+
+    canvas.save()
+    return pages
+
+
+def _render_range(records, event, first_page, renderer):
+    buffer = BytesIO()
+    write_cards_pdf(records, event, buffer, first_page=first_page, renderer=renderer)
+    return buffer.getvalue()
+
+
+def _render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.CARD_PDF_WORKERS,
+                # spawn: los procesos cargan Django desde cero, sin heredar conexiones ni hilos
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup
+            )
+        return _pool
+
+
+def parallel_render_enabled():
+    """Render en varios procesos: requiere pypdf para unir los tramos y más de un worker"""
+    return PdfWriter is not None and settings.CARD_PDF_WORKERS > 1
+
+
+def iter_range_pdfs(records, event, renderer=RENDERER_PLATYPUS, parallel=False):
+    """
+    PDFs (bytes) de tramos contiguos de CARD_PDF_RANGE_PAGES páginas, en orden. `records`
+    se lee tramo a tramo, así que puede ser un iterador de la base de datos. Cada tramo
+    numera sus páginas desde su posición en el documento, así que la numeración y las
+    contraportadas quedan igual que en un solo render. Con `parallel` los tramos se
+    renderizan en los workers, con a lo sumo dos tramos por worker en vuelo.
+    Sin cartones se produce un tramo con una página vacía.
+    """
+    range_size = settings.CARD_PDF_RANGE_PAGES * CARDS_PER_PAGE
+    max_pending = settings.CARD_PDF_WORKERS * 2
+    pending = deque()
+    pages = 0
+    records = iter(records)
+    try:
+        while True:
+            chunk = list(islice(records, range_size))
+            if not chunk:
+                break
+            if parallel:
+                pending.append(_render_pool().submit(_render_range, chunk, event, pages + 1, renderer))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            else:
+                yield _render_range(chunk, event, pages + 1, renderer)
+            pages += -(-len(chunk) // CARDS_PER_PAGE)
+
+        if not pages:
+            yield _render_range([], event, 1, renderer)
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Descarga interrumpida: los tramos que no empezaron no se renderizan
+        for future in pending:
+            future.cancel()
+
+
+def _renumber(value, references, discover):
+    """
+    Cambia en el lugar las referencias de `value` a la numeración del documento cosido;
+    `references` lleva número original -> nuevo y `discover(referencia)` numera un objeto
+    que aún no se copió.
+    """
+    if isinstance(value, IndirectObject):
+        if value.idnum not in references:
+            references[value.idnum] = discover(value)
+        return IndirectObject(references[value.idnum], 0, None)
+    if isinstance(value, DictionaryObject):
+        for key, item in list(dict.items(value)):
+            dict.__setitem__(value, key, _renumber(item, references, discover))
+    elif isinstance(value, ArrayObject):
+        for index, item in enumerate(list(list.__iter__(value))):
+            list.__setitem__(value, index, _renumber(item, references, discover))
+    return value
+
+
+def stitch_pdfs(range_pdfs):
+    """
+    Une los PDFs de los tramos en uno solo y lo emite en bloques a medida que llega cada
+    tramo. Los objetos de cada página (contenido, fuentes, logo) se copian renumerados; el
+    árbol de páginas, el catálogo y la tabla xref se escriben al final, así que de los
+    tramos anteriores solo quedan en memoria los offsets de sus objetos.
+    Devuelve (como valor de retorno del generador) el número de páginas.
+    """
+    # Objeto 1: catálogo, 2: árbol de páginas; offsets[n] es la posición del objeto n
+    offsets = array('Q', [0, 0, 0])
+    kids = []
+    # sha256 de los datos de cada imagen ya escrita -> su número
+    images = {}
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+
+    def serialize(number, obj):
+        buffer = BytesIO()
+        buffer.write(b"%d 0 obj\n" % number)
+        obj.write_to_stream(buffer)
+        buffer.write(b"\nendobj\n")
+        return buffer.getvalue()
+
+    for data in range_pdfs:
+        reader = PdfReader(BytesIO(data))
+        references = {}
+        # Cola FIFO: los objetos se escriben en el orden en que se numeran
+        queue = deque()
+
+        def discover(reference):
+            obj = reference.get_object()
+            # El logo se repite en cada tramo: se escribe una vez y los demás lo referencian
+            image = isinstance(obj, StreamObject) and obj.get('/Subtype') == '/Image'
+            if image:
+                digest = hashlib.sha256(obj._data).hexdigest()
+                if digest in images:
+                    return images[digest]
+            number = len(offsets) + len(queue)
+            queue.append((number, obj, False))
+            if image:
+                images[digest] = number
+            return number
+
+        for page in reader.pages:
+            # El /Parent es el árbol de páginas del documento cosido, no el del tramo
+            dict.pop(page, '/Parent', None)
+            number = len(offsets) + len(queue)
+            references[page.indirect_reference.idnum] = number
+            kids.append(number)
+            queue.append((number, page, True))
+
+        while queue:
+            # Sigue en la cola mientras se renumera, así discover() cuenta su número
+            number, obj, is_page = queue[0]
+            _renumber(obj, references, discover)
+            if is_page:
+                obj[NameObject('/Parent')] = IndirectObject(2, 0, None)
+            queue.popleft()
+            data = serialize(number, obj)
+            offsets.append(position)
+            position += len(data)
+            yield data
+
+    for number, obj in ((2, DictionaryObject({
+        NameObject('/Type'): NameObject('/Pages'),
+        NameObject('/Count'): NumberObject(len(kids)),
+        NameObject('/Kids'): ArrayObject(IndirectObject(kid, 0, None) for kid in kids),
+    })), (1, DictionaryObject({
+        NameObject('/Type'): NameObject('/Catalog'),
+        NameObject('/Pages'): IndirectObject(2, 0, None),
+    }))):
+        data = serialize(number, obj)
+        offsets[number] = position
+        position += len(data)
+        yield data
+
+    yield b"xref\n0 %d\n0000000000 65535 f \n" % len(offsets)
+    for start in range(1, len(offsets), 4096):
+        yield b''.join(b"%010d 00000 n \n" % offset for offset in offsets[start:start + 4096])
+    yield b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets), position)
+    return len(kids)
+
+
+def iter_pdf(records, event, renderer=RENDERER_PLATYPUS):
+    """
+    PDF de los cartones en bloques de bytes, emitidos a medida que se renderiza cada tramo
+    (ver stitch_pdfs); los tramos van a los workers desde CARD_PDF_PARALLEL_MIN_CARDS
+    cartones. Solo se leen por adelantado los registros necesarios para decidirlo. Sin
+    pypdf el PDF se renderiza completo en un archivo temporal y se emite después.
+    Devuelve (como valor de retorno del generador) el número de páginas.
+    """
+    if PdfReader is None:
+        output = tempfile.SpooledTemporaryFile(max_size=settings.CARD_PDF_SPOOL_MAX_SIZE)
+        with output:
+            pages = write_cards_pdf(records, event, output, renderer=renderer)
+            output.seek(0)
+            while chunk := output.read(RESPONSE_CHUNK_SIZE):
+                yield chunk
+        return pages
+
+    parallel = False
+    if parallel_render_enabled():
+        records = iter(records)
+        head = list(islice(records, settings.CARD_PDF_PARALLEL_MIN_CARDS))
+        records = chain(head, records)
+        parallel = len(head) >= settings.CARD_PDF_PARALLEL_MIN_CARDS
+    return (yield from stitch_pdfs(iter_range_pdfs(records, event, renderer, parallel)))
+
+
+def write_pdf(records, event, output, renderer=RENDERER_PLATYPUS):
+    """Escribe el PDF (ver iter_pdf) en `output`; devuelve el número de páginas"""
+    chunks = iter_pdf(records, event, renderer)
+    while True:
+        try:
+            output.write(next(chunks))
+        except StopIteration as done:
+            return done.value
+
+
+def render_cards_pdf(records, event, renderer=RENDERER_PLATYPUS):
+    """PDF de los cartones como bytes, para adjuntarlo a un email"""
+    return b''.join(iter_pdf(records, event, renderer))
+
+
+def cards_pdf_response(request, records, event, filename, renderer=RENDERER_PLATYPUS):
+    """
+    Descarga del PDF que empieza a enviarse con el primer tramo renderizado. Bajo ASGI
+    cada tramo se envía al terminarse en lugar de acumular el documento entero.
+    """
+    response = StreamingHttpResponse(
+        streaming_content(request, iter_pdf(records, event, renderer)), content_type='application/pdf')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def cards_email_message(event, records, email, subject, message):
+    """EmailMessage con los cartones en PDF adjunto, sin enviar"""
+    pdf = render_cards_pdf(records, event)
+
+    # Create HTML content with safe handling of potentially missing attributes
+    event_date_str = getattr(event, 'date', None) or getattr(
+        event, 'event_date', None) or ''
+    if hasattr(event_date_str, 'strftime'):
+        event_date_str = event_date_str.strftime('%Y-%m-%d %H:%M')
+
+    # Safely get event description or use empty string
+    event_description = getattr(event, 'description', '') or getattr(
+        event, 'event_description', '') or ''
+
+    html_message = render_to_string(
+        'email/bingo_cards_email.html',
+        {
+            'event_name': event.name,
+            'event_date': event_date_str,
+            'event_description': event_description,
+            'message': message,
+            'cards_count': len(records)
+        }
+    )
+
+    email_message = EmailMessage(
+        subject=subject,
+        body=html_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email]
+    )
+    # Set HTML content type
+    email_message.content_subtype = "html"
+    email_message.attach(f'bingo_cards_{event.name}.pdf', pdf, 'application/pdf')
+    return email_message
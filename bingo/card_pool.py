@@ -0,0 +1,65 @@
+import logging
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .card_issuing import issue_cards
+from .locks import LockTimeout, get_lock_manager
+from .models import BingoCard, Event
+
+logger = logging.getLogger(__name__)
+
+
+def pool_size(event):
+    """Pre-generated cards of the event not yet assigned to a user"""
+    return BingoCard.objects.filter(event=event, user__isnull=True).count()
+
+
+def pool_events():
+    """Events that keep a card pool: active and not finished"""
+    return Event.objects.filter(is_active=True, end__gt=datetime.now(timezone.utc))
+
+
+def refill_pool(event, low_watermark=None, high_watermark=None):
+    """
+    Top up the event pool to the high watermark once it drops below the low watermark.
+    Cards are generated in chunks of CARD_BULK_CREATE_BATCH_SIZE so each insert is short.
+
+    Returns:
+        Number of cards added
+    """
+    low_watermark = settings.CARD_POOL_LOW_WATERMARK if low_watermark is None else low_watermark
+    high_watermark = settings.CARD_POOL_HIGH_WATERMARK if high_watermark is None else high_watermark
+
+    # Only one refill per event at a time across workers
+    try:
+        lock = get_lock_manager().acquire(f"card_pool_refill:{event.id}", auto_renew=True)
+    except LockTimeout:
+        return 0
+
+    try:
+        size = pool_size(event)
+        if size >= low_watermark:
+            return 0
+
+        missing = high_watermark - size
+        chunk_size = settings.CARD_BULK_CREATE_BATCH_SIZE
+        added = 0
+        while added < missing:
+            added += len(issue_cards(event, None, min(chunk_size, missing - added)))
+
+        logger.info(f"Pool de cartones del evento {event.id}: {size} -> {size + added}")
+        return added
+    finally:
+        lock.release()
+
+
+def refill_all_pools():
+    """Refill the pool of every upcoming event; returns {event_id: cards added}"""
+    added = {}
+    for event in pool_events():
+        try:
+            added[event.id] = refill_pool(event)
+        except Exception as e:
+            logger.error(f"Error rellenando el pool del evento {event.id}: {str(e)}", exc_info=True)
+    return added
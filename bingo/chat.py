@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryChatBackend:
+    """
+    Historial de chat en memoria del proceso.
+    Guarda los últimos N mensajes por evento en un deque acotado.
+    Útil en desarrollo y pruebas; con varios workers cada proceso tiene su propio historial.
+    """
+
+    def __init__(self, history_size, rate_limit, rate_window):
+        self.history_size = history_size
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self._messages = defaultdict(lambda: deque(maxlen=self.history_size))
+        self._sequences = defaultdict(int)
+        self._sent_at = defaultdict(deque)
+
+    async def allow_message(self, event_id, user_id):
+        """Ventana deslizante: como máximo rate_limit mensajes por rate_window segundos"""
+        now = time.monotonic()
+        timestamps = self._sent_at[(event_id, user_id)]
+        while timestamps and now - timestamps[0] >= self.rate_window:
+            timestamps.popleft()
+        if len(timestamps) >= self.rate_limit:
+            return False
+        timestamps.append(now)
+        return True
+
+    async def append(self, event_id, message):
+        """Asigna un número de secuencia al mensaje y lo guarda en el historial"""
+        self._sequences[event_id] += 1
+        message = dict(message, seq=self._sequences[event_id])
+        self._messages[event_id].append(message)
+        return message
+
+    async def history(self, event_id, before=None, limit=50):
+        """Devuelve hasta `limit` mensajes con seq < before, en orden cronológico"""
+        messages = [
+            m for m in self._messages.get(event_id, ())
+            if before is None or m['seq'] < before
+        ]
+        return messages[-limit:] if limit else []
+
+
+class RedisChatBackend:
+    """
+    Historial de chat compartido entre workers usando un sorted set de Redis por evento
+    (score = número de secuencia), recortado a los últimos N mensajes en cada escritura.
+    """
+
+    def __init__(self, history_size, rate_limit, rate_window, url=None):
+        import redis.asyncio as aioredis
+
+        self.history_size = history_size
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.client = aioredis.from_url(url or settings.CHAT_REDIS_URL)
+
+    def _key(self, event_id, suffix):
+        return f"chat:{event_id}:{suffix}"
+
+    async def allow_message(self, event_id, user_id):
+        """Ventana fija en Redis: INCR + EXPIRE por usuario y evento"""
+        window = int(time.time() // self.rate_window)
+        key = self._key(event_id, f"rate:{user_id}:{window}")
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, int(self.rate_window) + 1)
+        count, _ = await pipe.execute()
+        return count <= self.rate_limit
+
+    async def append(self, event_id, message):
+        seq = await self.client.incr(self._key(event_id, 'seq'))
+        message = dict(message, seq=seq)
+        messages_key = self._key(event_id, 'messages')
+        pipe = self.client.pipeline()
+        pipe.zadd(messages_key, {json.dumps(message): seq})
+        # Conservar solo los últimos history_size mensajes
+        pipe.zremrangebyrank(messages_key, 0, -self.history_size - 1)
+        await pipe.execute()
+        return message
+
+    async def history(self, event_id, before=None, limit=50):
+        if not limit:
+            return []
+        max_score = f"({before}" if before is not None else '+inf'
+        raw = await self.client.zrevrangebyscore(
+            self._key(event_id, 'messages'), max_score, '-inf', start=0, num=limit)
+        return [json.loads(item) for item in reversed(raw)]
+
+
+_backend = None
+
+
+def get_chat_backend():
+    """Devuelve el backend de chat configurado en settings.CHAT_BACKEND ('memory' o 'redis')"""
+    global _backend
+    if _backend is None:
+        options = {
+            'history_size': settings.CHAT_HISTORY_SIZE,
+            'rate_limit': settings.CHAT_RATE_LIMIT,
+            'rate_window': settings.CHAT_RATE_WINDOW,
+        }
+        if settings.CHAT_BACKEND == 'redis':
+            _backend = RedisChatBackend(**options)
+        else:
+            _backend = MemoryChatBackend(**options)
+    return _backend
+
+
+async def get_history_page(event_id, before=None, limit=None):
+    """
+    Obtiene una página del historial de chat.
+    Retorna (mensajes, next_before) donde next_before es el cursor para la página anterior
+    o None si no hay más mensajes.
+    """
+    page_size = settings.CHAT_HISTORY_PAGE_SIZE
+    try:
+        limit = max(1, min(int(limit or page_size), page_size))
+        before = int(before) if before is not None else None
+    except (TypeError, ValueError):
+        limit, before = page_size, None
+
+    messages = await get_chat_backend().history(event_id, before=before, limit=limit)
+    next_before = messages[0]['seq'] if len(messages) == limit and messages[0]['seq'] > 1 else None
+    return messages, next_before
+
+
+class ChatBatcher:
+    """
+    Agrupa los mensajes de chat de un evento y los envía al grupo como un solo frame
+    cada flush_interval segundos, en lugar de un group_send por mensaje.
+    """
+
+    def __init__(self, channel_layer, group_name, flush_interval):
+        self.channel_layer = channel_layer
+        self.group_name = group_name
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._flush_task = None
+
+    def add(self, message):
+        self._pending.append(message)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            await self.channel_layer.group_send(
+                self.group_name,
+                {
+                    'type': 'broadcast_chat_batch',
+                    'messages': batch
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error enviando lote de chat a {self.group_name}: {str(e)}")
+        finally:
+            # Los mensajes que llegaron durante el envío vieron esta tarea en curso
+            if self._pending:
+                self._flush_task = asyncio.ensure_future(self._flush_later())
+
+
+_batchers = {}
+
+
+def get_chat_batcher(channel_layer, group_name):
+    """Un batcher por grupo y por proceso"""
+    batcher = _batchers.get(group_name)
+    if batcher is None or batcher.channel_layer is not channel_layer:
+        batcher = ChatBatcher(channel_layer, group_name, settings.CHAT_FLUSH_INTERVAL)
+        _batchers[group_name] = batcher
+    return batcher
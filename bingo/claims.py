@@ -0,0 +1,260 @@
+import asyncio
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .event_stats import add_stats
+from .models import BingoCard, Event, Number, WinClaim, WinningPattern
+from .win_patterns import get_patterns_for_event, normalize_pattern_name, parse_card_numbers
+
+logger = logging.getLogger(__name__)
+
+# Un reclamo recibido por REST o WebSocket, pendiente de adjudicar
+Claim = namedtuple('Claim', ['card_id', 'user_id', 'pattern', 'claimed_at', 'source'])
+
+
+def make_claim(card_id, user_id, pattern='bingo', source=WinClaim.SOURCE_API):
+    return Claim(str(card_id), user_id, pattern or 'bingo', datetime.now(timezone.utc), source)
+
+
+def called_bitmap(values):
+    """Convierte los números llamados en un entero donde el bit n indica que n fue llamado"""
+    bitmap = 0
+    for value in values:
+        bitmap |= 1 << value
+    return bitmap
+
+
+def find_win_sequence(grid, patterns, bitmap, call_sequence):
+    """
+    Busca el patrón completado más temprano en un cartón.
+
+    Args:
+        grid: lista de 25 enteros (0 = espacio libre)
+        patterns: dict pattern_name -> posiciones
+        bitmap: números llamados (ver called_bitmap)
+        call_sequence: dict valor -> orden en que fue llamado (1 = primer número)
+
+    Returns:
+        (pattern_name, positions, win_sequence) o None si ningún patrón está completo.
+        win_sequence es el número de llamada con el que el patrón quedó completo.
+    """
+    best = None
+    for name, positions in patterns.items():
+        # Una posición fuera del cartón nunca se marca; sin ninguna casilla numerada
+        # (solo el espacio libre) el patrón no puede completarse con llamadas
+        if not positions or not all(0 <= pos < len(grid) for pos in positions):
+            continue
+        values = [grid[pos] for pos in positions if grid[pos]]
+        if not values:
+            continue
+        mask = called_bitmap(values)
+        if bitmap & mask != mask:
+            continue
+        win_sequence = max((call_sequence[v] for v in values), default=0)
+        if best is None or (win_sequence, name) < (best[2], best[0]):
+            best = (name, positions, win_sequence)
+    return best
+
+
+def _patterns_for_claim(patterns, pattern_name):
+    """
+    'bingo' acepta cualquier patrón del evento, cualquier otro nombre (también los nombres
+    en español, ver normalize_pattern_name) solo ese patrón; un nombre desconocido ninguno.
+    """
+    pattern_name = normalize_pattern_name(pattern_name)
+    if pattern_name == 'bingo':
+        return patterns
+    if pattern_name not in patterns:
+        return {}
+    return {pattern_name: patterns[pattern_name]}
+
+
+def _claim_result(claim, card=None, valid=False, message='', **extra):
+    result = {
+        'card_id': claim.card_id,
+        'user_id': claim.user_id,
+        'card': card,
+        'valid': valid,
+        'duplicate': False,
+        'win_details': None,
+        'win_sequence': None,
+        'rank': None,
+        'message': message,
+    }
+    result.update(extra)
+    return result
+
+
+def adjudicate_claims(event_id, claims):
+    """
+    Adjudica en un solo lote todos los reclamos de un evento.
+
+    Los reclamos repetidos del mismo cartón se evalúan una sola vez, todos se verifican
+    contra el mismo bitmap de números llamados y los ganadores se ordenan de forma
+    determinista por (número de llamada en que completaron, hora del reclamo, id del cartón).
+
+    Returns:
+        Lista de resultados (dict) en el mismo orden que `claims`.
+    """
+    if not claims:
+        return []
+
+    with transaction.atomic():
+        # Serializa la adjudicación por evento entre procesos: un bloqueo por lote, no por reclamo
+        Event.objects.select_for_update().filter(id=event_id).first()
+
+        call_order = list(Number.objects.filter(
+            event_id=event_id
+        ).order_by('called_at').values_list('value', flat=True))
+        call_sequence = {value: index for index, value in enumerate(call_order, start=1)}
+        bitmap = called_bitmap(call_order)
+
+        card_ids = {claim.card_id for claim in claims}
+        cards = {str(card.id): card for card in BingoCard.objects.filter(
+            id__in=card_ids, event_id=event_id)}
+        existing = {str(c.card_id): c for c in WinClaim.objects.filter(card_id__in=card_ids)}
+        patterns = get_patterns_for_event(event_id)
+        display_names = dict(WinningPattern.objects.filter(
+            name__in=patterns.keys()).values_list('name', 'display_name'))
+
+        results = {}
+        new_winners = []
+        for claim in sorted(claims, key=lambda c: (c.claimed_at, c.card_id)):
+            key = (claim.card_id, claim.user_id)
+            if key in results:
+                continue
+
+            card = cards.get(claim.card_id)
+            if card is None or card.user_id != claim.user_id:
+                results[key] = _claim_result(
+                    claim, message="Cartón no encontrado o no pertenece al usuario")
+                continue
+
+            previous = existing.get(claim.card_id)
+            if previous is not None:
+                results[key] = _claim_result(
+                    claim, card, valid=True, duplicate=True,
+                    win_details=previous.win_details,
+                    win_sequence=previous.win_sequence, rank=previous.rank,
+                    message="Este cartón ya fue adjudicado como ganador")
+                continue
+
+            grid = parse_card_numbers(card.numbers)
+            win = find_win_sequence(
+                grid, _patterns_for_claim(patterns, claim.pattern), bitmap, call_sequence)
+            if win is None:
+                results[key] = _claim_result(
+                    claim, card, message="No has ganado con el patrón especificado")
+                continue
+
+            name, positions, win_sequence = win
+            win_details = {
+                'pattern_name': name,
+                'positions': positions,
+                'matched_numbers': [str(grid[pos]) for pos in positions if 0 <= pos < len(grid)],
+                'display_name': display_names.get(name, name.replace('_', ' ').title()),
+            }
+            results[key] = _claim_result(
+                claim, card, valid=True, win_details=win_details, win_sequence=win_sequence,
+                message=f"¡Felicidades! Has ganado con el patrón '{win_details['display_name']}'")
+            new_winners.append((win_sequence, claim.claimed_at, claim.card_id, key))
+
+        if new_winners:
+            ranked = WinClaim.objects.filter(event_id=event_id).count()
+            rows = []
+            for rank, (win_sequence, claimed_at, card_id, key) in enumerate(sorted(new_winners), start=ranked + 1):
+                result = results[key]
+                result['rank'] = rank
+                rows.append(WinClaim(
+                    event_id=event_id,
+                    card_id=card_id,
+                    user_id=result['user_id'],
+                    pattern_name=result['win_details']['pattern_name'],
+                    win_details=result['win_details'],
+                    win_sequence=win_sequence,
+                    rank=rank,
+                    claimed_at=claimed_at,
+                    source=next(c.source for c in claims if (c.card_id, c.user_id) == key),
+                ))
+            WinClaim.objects.bulk_create(rows)
+            add_stats(event_id, winners=len(rows))
+            BingoCard.objects.filter(
+                id__in=[row.card_id for row in rows], is_winner=False
+            ).update(is_winner=True)
+            for row in rows:
+                results[(row.card_id, row.user_id)]['card'].is_winner = True
+
+    return [results[(claim.card_id, claim.user_id)] for claim in claims]
+
+
+class ClaimQueue:
+    """
+    Cola de reclamos de un evento dentro del proceso.
+    Los reclamos que llegan durante la ventana CLAIM_BATCH_WINDOW se adjudican juntos
+    con una sola llamada a adjudicate_claims.
+    """
+
+    def __init__(self, event_id, batch_window):
+        self.event_id = event_id
+        self.batch_window = batch_window
+        self._pending = {}
+        self._task = None
+
+    async def submit(self, claim):
+        """Encola un reclamo y espera su resultado"""
+        future = asyncio.get_running_loop().create_future()
+        key = (claim.card_id, claim.user_id)
+        if key in self._pending:
+            self._pending[key][1].append(future)
+        else:
+            self._pending[key] = (claim, [future])
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+        return await future
+
+    async def _drain(self):
+        await asyncio.sleep(self.batch_window)
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            await self._adjudicate(batch)
+        finally:
+            # Los reclamos que llegaron durante la adjudicación vieron esta tarea en curso
+            if self._pending:
+                self._task = asyncio.ensure_future(self._drain())
+
+    async def _adjudicate(self, batch):
+        claims = [claim for claim, _ in batch.values()]
+        try:
+            results = await database_sync_to_async(adjudicate_claims)(self.event_id, claims)
+        except Exception as e:
+            logger.error(f"Error adjudicando reclamos del evento {self.event_id}: {str(e)}")
+            for _, futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for (claim, futures), result in zip(batch.values(), results):
+            for future in futures:
+                if not future.done():
+                    future.set_result(result)
+
+
+_queues = {}
+
+
+def get_claim_queue(event_id):
+    """Una cola por evento y por proceso"""
+    queue = _queues.get(event_id)
+    if queue is None:
+        queue = ClaimQueue(event_id, settings.CLAIM_BATCH_WINDOW)
+        _queues[event_id] = queue
+    return queue
@@ -1,10 +1,19 @@
 import json
 import logging
+import time
+from datetime import datetime, timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.db import transaction
-from .models import Event, BingoCard, Number
-from .win_patterns import check_win_pattern
+from django.http.cookie import parse_cookie
+from core.db_router import pinned_until, replica_reads, user_pinned_until
+from core.query_budget import record_queries, report
+from .models import Event, BingoCard, Number, WinClaim
+from .claims import get_claim_queue, make_claim
+from .chat import get_chat_backend, get_chat_batcher, get_history_page
+from .card_jobs import user_group_name
+from .event_stats import add_stats
 from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
 from jwt.exceptions import InvalidTokenError, ExpiredSignatureError
@@ -60,6 +69,12 @@ class BingoConsumer(AsyncWebsocketConsumer):
         
         # If the user is authenticated, send their cards
         if self.user and self.user.is_authenticated:
+            # Personal group for progress of the user's card generation jobs
+            await self.channel_layer.group_add(
+                user_group_name(self.user.id),
+                self.channel_name
+            )
+
             cards = await self._get_user_cards()
             await self.send(text_data=json.dumps({
                 'type': 'user_cards',
@@ -71,18 +86,37 @@ class BingoConsumer(AsyncWebsocketConsumer):
         else:
             logger.info(f"Anonymous user connected to event {self.event_id}")
 
+        # Send the latest chat messages so late joiners see recent history
+        await self._send_chat_history()
+
     async def disconnect(self, close_code):
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        if getattr(self, 'user', None) and self.user.is_authenticated:
+            await self.channel_layer.group_discard(
+                user_group_name(self.user.id),
+                self.channel_name
+            )
         logger.info(f"User disconnected from event {self.event_id} with code {close_code}")
 
     async def receive(self, text_data):
         """
-        Handle messages received from WebSocket client
+        Handle messages received from WebSocket client, recording the SQL each one runs
         """
+        if not settings.SQL_INSTRUMENTATION:
+            await self._handle_message(text_data)
+            return
+
+        with record_queries() as recorder:
+            message_type = await self._handle_message(text_data)
+        report(f"WS {message_type} event={self.event_id}", recorder)
+
+    async def _handle_message(self, text_data):
+        """Dispatch a client message to its handler; returns the message type"""
+        message_type = None
         try:
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type')
@@ -102,6 +136,11 @@ class BingoConsumer(AsyncWebsocketConsumer):
             # Handler for player chat messages
             elif message_type == 'chat_message':
                 await self._handle_chat_message(text_data_json)
+
+            # Handler for paginated chat history requests
+            elif message_type == 'chat_history':
+                await self._send_chat_history(
+                    text_data_json.get('before'), text_data_json.get('limit'))
                 
             else:
                 logger.warning(f"Unknown message type: {message_type}")
@@ -109,6 +148,7 @@ class BingoConsumer(AsyncWebsocketConsumer):
             logger.error("Invalid JSON received")
         except Exception as e:
             logger.exception(f"Error handling WebSocket message: {str(e)}")
+        return message_type
 
     async def _handle_call_number(self, data):
         """Handle number calling from admin"""
@@ -166,10 +206,16 @@ class BingoConsumer(AsyncWebsocketConsumer):
             }))
             return
             
-        # Verify win
-        is_valid_win, result = await self._verify_win(card_id, self.user.id, winning_pattern)
+        # Queue the claim; simultaneous claims for this event are adjudicated in one batch
+        claim = make_claim(card_id, self.user.id, winning_pattern, WinClaim.SOURCE_WEBSOCKET)
+        try:
+            result = await get_claim_queue(self.event_id).submit(claim)
+        except Exception as e:
+            logger.error(f"Error verifying win: {str(e)}")
+            result = {'valid': False, 'message': str(e)}
         
-        if is_valid_win:
+        if result['valid'] and not result['duplicate']:
+            card = result['card']
             # Broadcast the win to all users
             await self.channel_layer.group_send(
                 self.room_group_name,
@@ -178,14 +224,20 @@ class BingoConsumer(AsyncWebsocketConsumer):
                     'user_id': self.user.id,
                     'username': self.user.email,  # Or use a display name field if available
                     'card_id': card_id,
-                    'card': result,
-                    'pattern': winning_pattern
+                    'card': {
+                        'id': str(card.id),
+                        'numbers': card.numbers,
+                        'hash': card.hash
+                    },
+                    'pattern': result['win_details']['pattern_name'],
+                    'win_sequence': result['win_sequence'],
+                    'rank': result['rank']
                 }
             )
         else:
             await self.send(text_data=json.dumps({
                 'type': 'error',
-                'message': result
+                'message': result['message']
             }))
 
     async def _handle_join_game(self):
@@ -216,17 +268,37 @@ class BingoConsumer(AsyncWebsocketConsumer):
             
         # Limit message length
         message = message[:200]
-        
-        # Broadcast to the group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'broadcast_chat_message',
-                'user_id': self.user.id,
-                'username': self.user.email,
-                'message': message
-            }
-        )
+
+        chat = get_chat_backend()
+        if not await chat.allow_message(self.event_id, self.user.id):
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Estás enviando mensajes demasiado rápido, espera un momento'
+            }))
+            return
+
+        # Store in the bounded history, then queue for the next batched broadcast
+        chat_message = await chat.append(self.event_id, {
+            'user_id': self.user.id,
+            'username': self.user.email,
+            'message': message,
+            'sent_at': datetime.now(timezone.utc).isoformat()
+        })
+        get_chat_batcher(self.channel_layer, self.room_group_name).add(chat_message)
+
+    async def _send_chat_history(self, before=None, limit=None):
+        """Send a page of chat history older than `before` to this client"""
+        try:
+            messages, next_before = await get_history_page(self.event_id, before, limit)
+        except Exception as e:
+            logger.error(f"Error getting chat history: {str(e)}")
+            return
+
+        await self.send(text_data=json.dumps({
+            'type': 'chat_history',
+            'messages': messages,
+            'next_before': next_before
+        }))
 
     # Broadcast handlers - these methods are called by the channel layer
 
@@ -245,7 +317,9 @@ class BingoConsumer(AsyncWebsocketConsumer):
             'username': event['username'],
             'card_id': event['card_id'],
             'card': event['card'],
-            'pattern': event['pattern']
+            'pattern': event['pattern'],
+            'win_sequence': event.get('win_sequence'),
+            'rank': event.get('rank')
         }))
 
     async def broadcast_player_joined(self, event):
@@ -265,25 +339,56 @@ class BingoConsumer(AsyncWebsocketConsumer):
             'message': event['message']
         }))
 
+    async def card_job_progress(self, event):
+        """Progress of one of the user's card generation jobs"""
+        await self.send(text_data=json.dumps({
+            'type': 'card_job_progress',
+            'job': event['job']
+        }))
+
+    async def broadcast_chat_batch(self, event):
+        """Broadcast a batch of chat messages as a single frame"""
+        messages = event['messages']
+        if len(messages) == 1:
+            # Keep the single-message frame for existing clients
+            await self.send(text_data=json.dumps(dict(messages[0], type='chat_message')))
+            return
+
+        await self.send(text_data=json.dumps({
+            'type': 'chat_batch',
+            'messages': messages
+        }))
+
     # Database helper methods using database_sync_to_async
 
+    def _snapshot_reads(self):
+        """
+        Snapshots may read from a replica unless the client wrote recently over HTTP.
+        The user's pin is checked on every snapshot; the cookie was sent only at handshake.
+        """
+        headers = dict(self.scope.get('headers', []))
+        cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin1'))
+        user_id = self.user.pk if self.user and self.user.is_authenticated else None
+        return replica_reads(max(pinned_until(cookies), user_pinned_until(user_id)) < time.time())
+
     @database_sync_to_async
     def _get_event_info(self, event_id):
         """Get event information and called numbers"""
         try:
-            event = Event.objects.get(id=event_id)
-            
-            # Get all called numbers for this event
-            called_numbers = Number.objects.filter(event_id=event_id).order_by('called_at')
-            
-            return {
-                'id': event.id,
-                'name': event.name,
-                'prize': str(event.prize),
-                'start_date': event.start.isoformat(),
-                'is_live': event.is_live,  # Include is_live status
-                'called_numbers': list(called_numbers.values('id', 'value', 'called_at'))
-            }
+            with self._snapshot_reads():
+                event = Event.objects.get(id=event_id)
+
+                # Get all called numbers for this event
+                called_numbers = Number.objects.filter(event_id=event_id).order_by('called_at')
+
+                return {
+                    'id': event.id,
+                    'name': event.name,
+                    'prize': str(event.prize),
+                    'start_date': event.start.isoformat(),
+                    'is_live': event.is_live,  # Include is_live status
+                    'called_numbers': list(called_numbers.values('id', 'value', 'called_at'))
+                }
         except Event.DoesNotExist:
             logger.error(f"Event {event_id} does not exist")
             return None
@@ -298,11 +403,18 @@ class BingoConsumer(AsyncWebsocketConsumer):
             return []
         
         try:
-            cards = BingoCard.objects.filter(
-                user=self.user,
-                event_id=self.event_id
-            ).values('id', 'numbers', 'is_winner', 'hash')
-            return list(cards)
+            with self._snapshot_reads():
+                cards = BingoCard.objects.filter(
+                    user=self.user,
+                    event_id=self.event_id
+                ).only('id', 'event_id', 'numbers', 'is_winner', 'hash', 'seed_index')
+                # Instances rather than values() so derived cards get their numbers
+                return [{
+                    'id': card.id,
+                    'numbers': card.numbers,
+                    'is_winner': card.is_winner,
+                    'hash': card.hash
+                } for card in cards]
         except Exception as e:
             logger.error(f"Error getting user cards: {str(e)}")
             return []
@@ -326,6 +438,7 @@ class BingoConsumer(AsyncWebsocketConsumer):
                     event_id=event_id,
                     value=number_value
                 )
+                add_stats(event_id, numbers_called=1)
                 
                 # Return the number details
                 return True, {
@@ -337,40 +450,6 @@ class BingoConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error calling number: {str(e)}")
             return False, str(e)
     
-    @database_sync_to_async
-    def _verify_win(self, card_id, user_id, pattern):
-        """Verify if a card has won with the given pattern"""
-        try:
-            # Get the card and ensure it belongs to the user
-            card = BingoCard.objects.get(id=card_id, user_id=user_id)
-            
-            # Get all called numbers for this event
-            called_numbers = set(Number.objects.filter(
-                event_id=card.event_id
-            ).values_list('value', flat=True))
-            
-            # Check if the pattern is completed with called numbers
-            is_winner = check_win_pattern(card.numbers, called_numbers, pattern)
-            
-            if is_winner:
-                # Mark the card as a winner if not already marked
-                if not card.is_winner:
-                    card.is_winner = True
-                    card.save()
-                
-                return True, {
-                    'id': card.id,
-                    'numbers': card.numbers,
-                    'hash': card.hash
-                }
-            else:
-                return False, "Invalid winning pattern or not all numbers have been called"
-        except BingoCard.DoesNotExist:
-            return False, "Card not found or doesn't belong to you"
-        except Exception as e:
-            logger.error(f"Error verifying win: {str(e)}")
-            return False, str(e)
-
     @database_sync_to_async
     def get_user_from_id(self, user_id):
         try:
@@ -0,0 +1,146 @@
+"""
+Outbox for card emails.
+
+Requests only insert an EmailDelivery row and answer right away. The outbox workers
+(send_email_outbox command) claim due deliveries in batches, render the PDF
+attachments and send the whole batch over one SMTP connection. A failed delivery is
+retried with exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from .card_pdf import cards_email_message, payload_records
+from .models import EmailDelivery
+
+logger = logging.getLogger(__name__)
+
+
+def queue_cards_email(user, event, cards, email, subject, message):
+    """Store the email in the outbox; it is rendered and sent by the outbox workers"""
+    return EmailDelivery.objects.create(
+        user=user,
+        event=event,
+        recipient=email,
+        subject=subject,
+        message=message,
+        cards=cards
+    )
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt: base * 2^(attempts - 1), capped"""
+    delay = settings.EMAIL_OUTBOX_RETRY_BASE * 2 ** max(0, attempts - 1)
+    return min(delay, settings.EMAIL_OUTBOX_RETRY_MAX)
+
+
+def claim_deliveries(limit=None):
+    """
+    Take up to `limit` due deliveries: pending ones whose next attempt has arrived, or
+    sending ones whose worker stopped before recording the result. SKIP LOCKED lets
+    several workers claim batches concurrently.
+    """
+    limit = settings.EMAIL_OUTBOX_BATCH_SIZE if limit is None else limit
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=settings.EMAIL_OUTBOX_STALE_AFTER)
+
+    with transaction.atomic():
+        deliveries = list(EmailDelivery.objects.select_for_update(skip_locked=True).filter(
+            Q(status=EmailDelivery.STATUS_PENDING, next_attempt_at__lte=now) |
+            Q(status=EmailDelivery.STATUS_SENDING, updated_at__lt=stale)
+        ).order_by('next_attempt_at')[:limit])
+        if not deliveries:
+            return []
+
+        EmailDelivery.objects.filter(pk__in=[d.pk for d in deliveries]).update(
+            status=EmailDelivery.STATUS_SENDING, updated_at=now)
+
+    return list(EmailDelivery.objects.select_related('event').filter(
+        pk__in=[d.pk for d in deliveries]).order_by('next_attempt_at'))
+
+
+def build_message(delivery):
+    return cards_email_message(
+        delivery.event, payload_records(delivery.cards, delivery.event),
+        delivery.recipient, delivery.subject, delivery.message)
+
+
+def mark_sent(delivery):
+    delivery.status = EmailDelivery.STATUS_SENT
+    delivery.attempts += 1
+    delivery.last_error = ''
+    delivery.sent_at = datetime.now(timezone.utc)
+    delivery.save(update_fields=['status', 'attempts', 'last_error', 'sent_at', 'updated_at'])
+
+
+def mark_failed(delivery, error):
+    """Schedule the next attempt with backoff, or give up after EMAIL_OUTBOX_MAX_ATTEMPTS"""
+    delivery.attempts += 1
+    delivery.last_error = error
+    if delivery.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        delivery.status = EmailDelivery.STATUS_FAILED
+    else:
+        delivery.status = EmailDelivery.STATUS_PENDING
+        delivery.next_attempt_at = datetime.now(timezone.utc) + timedelta(
+            seconds=retry_delay(delivery.attempts))
+    delivery.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at', 'updated_at'])
+    logger.warning(f"No se pudo enviar el email {delivery.id} (intento {delivery.attempts}): {error}")
+
+
+def send_batch(deliveries):
+    """
+    Render the attachments and send every delivery through one connection.
+    Each message is sent separately so one rejected recipient does not fail the batch.
+    Returns the number of emails sent.
+    """
+    messages = []
+    for delivery in deliveries:
+        try:
+            messages.append((delivery, build_message(delivery)))
+        except Exception as e:
+            logger.error(f"Error renderizando el email {delivery.id}: {str(e)}", exc_info=True)
+            mark_failed(delivery, str(e))
+
+    if not messages:
+        return 0
+
+    sent = 0
+    try:
+        connection = get_connection()
+        connection.open()
+    except Exception as e:
+        for delivery, _ in messages:
+            mark_failed(delivery, str(e))
+        return 0
+
+    try:
+        for delivery, message in messages:
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                mark_failed(delivery, str(e))
+            else:
+                mark_sent(delivery)
+                sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def run_worker(once=False, poll_interval=None):
+    """Send due emails until none are left (once) or forever, sleeping while the outbox is empty"""
+    poll_interval = settings.EMAIL_OUTBOX_POLL_INTERVAL if poll_interval is None else poll_interval
+    while True:
+        close_old_connections()
+        deliveries = claim_deliveries()
+        if not deliveries:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        send_batch(deliveries)
@@ -0,0 +1,205 @@
+"""
+Archival of finished events.
+
+Events that ended more than EVENT_ARCHIVE_RETENTION_DAYS ago have their called
+numbers, purchases and sold cards moved out of the hot tables into gzip-compressed
+JSON Lines files under EVENT_ARCHIVE_DIR/<event id>/, EVENT_ARCHIVE_CHUNK_SIZE rows
+per transaction: each chunk is appended to its file (one gzip member per chunk) and
+the rows are deleted in the same transaction. Unsold pool cards are deleted without
+being archived. The Event row, its EventStats and an EventArchive row with the draw
+sequence, the winners and the totals stay queryable.
+
+EVENT_ARCHIVE_DIR has no default: it must point to persistent storage (a mounted
+disk, not the service's ephemeral filesystem) and exist before anything is archived,
+since the archive files are the only copy of the moved rows.
+
+The EventArchive row is created before any row is moved, so an interrupted run is
+resumed by the next one. If a transaction fails after its chunk was written, the
+chunk is written again; iter_archived() skips the repeated rows.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+
+from .card_export import FORMAT_JSONL, iter_export
+from .event_stats import STAT_FIELDS, reconcile_chunk
+from .locks import LockTimeout, get_lock_manager
+from .models import BingoCard, CardPurchase, Event, EventArchive, EventStats, Number, WinClaim
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILES = {
+    'cards': 'cards.jsonl.gz',
+    'numbers': 'numbers.jsonl.gz',
+    'purchases': 'purchases.jsonl.gz',
+}
+
+# Hot tables emptied by the archival, for VACUUM after a run
+ARCHIVED_MODELS = (BingoCard, Number, CardPurchase, WinClaim)
+
+
+def archive_lock_name(event_id):
+    return f"archive:{event_id}"
+
+
+def archive_dir():
+    """
+    EVENT_ARCHIVE_DIR, checked before any row is deleted. Raises ImproperlyConfigured
+    if it is not set or is not an existing directory (an unmounted disk, for instance).
+    """
+    directory = settings.EVENT_ARCHIVE_DIR
+    if not directory:
+        raise ImproperlyConfigured(
+            "EVENT_ARCHIVE_DIR must be set to a directory on persistent storage to archive events")
+    if not os.path.isdir(directory):
+        raise ImproperlyConfigured(f"EVENT_ARCHIVE_DIR {directory} is not an existing directory")
+    return directory
+
+
+def archivable_events(now=None):
+    """Finished events past the retention window that are not archived yet"""
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=settings.EVENT_ARCHIVE_RETENTION_DAYS)
+    return Event.objects.filter(end__lt=cutoff, is_live=False).exclude(
+        archive__status=EventArchive.STATUS_COMPLETED).order_by('end')
+
+
+def _summary(event):
+    draw_sequence = list(Number.objects.filter(event=event).order_by('called_at').values_list('value', flat=True))
+    winners = [{
+        'card_id': str(claim['card_id']),
+        'correlative_id': claim['card__correlative_id'],
+        'user_id': claim['user_id'],
+        'pattern_name': claim['pattern_name'],
+        'win_sequence': claim['win_sequence'],
+        'rank': claim['rank'],
+        'claimed_at': claim['claimed_at'].isoformat(),
+    } for claim in WinClaim.objects.filter(event=event).order_by('rank').values(
+        'card_id', 'card__correlative_id', 'user_id', 'pattern_name', 'win_sequence', 'rank', 'claimed_at')]
+    # Wins from before WinClaim existed were only recorded on the card
+    winners += [{
+        'card_id': str(card['id']),
+        'correlative_id': card['correlative_id'],
+        'user_id': card['user_id'],
+        'pattern_name': None,
+        'win_sequence': None,
+        'rank': None,
+        'claimed_at': None,
+    } for card in BingoCard.objects.filter(event=event, is_winner=True, win_claim__isnull=True).order_by(
+        'created_at').values('id', 'correlative_id', 'user_id')]
+
+    # Exact totals from the base tables, which are about to be emptied
+    reconcile_chunk([event.id])
+    stats = EventStats.objects.filter(event=event).values(*STAT_FIELDS).get()
+    stats['revenue'] = str(stats['revenue'])
+    return draw_sequence, winners, stats
+
+
+def start_archive(event):
+    """EventArchive of the event, created with its summary if the archival had not started"""
+    with transaction.atomic():
+        archive = EventArchive.objects.select_for_update().filter(event=event).first()
+        if archive is not None:
+            return archive
+        draw_sequence, winners, stats = _summary(event)
+        return EventArchive.objects.create(
+            event=event, draw_sequence=draw_sequence, winners=winners, stats=stats,
+            location=os.path.join(archive_dir(), str(event.id)))
+
+
+def _append(path, data):
+    with open(path, 'ab') as file:
+        file.write(gzip.compress(data))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _encode_cards(ids):
+    return b''.join(iter_export(BingoCard.objects.filter(pk__in=ids).order_by('created_at'), FORMAT_JSONL))
+
+
+def _encoder(model):
+    def encode(ids):
+        rows = model.objects.filter(pk__in=ids).order_by('pk').values()
+        return ''.join(json.dumps(row, default=str, separators=(',', ':')) + '\n' for row in rows).encode()
+    return encode
+
+
+def _move(archive, queryset, kind, encode, counter, chunk_size):
+    """Append the rows of `queryset` to the archive file of `kind` and delete them, chunk by chunk"""
+    path = os.path.join(archive.location, ARCHIVE_FILES[kind]) if kind else None
+    moved = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                return moved
+            if path:
+                _append(path, encode(ids))
+            queryset.model.objects.filter(pk__in=ids).delete()
+            EventArchive.objects.filter(pk=archive.pk).update(**{counter: F(counter) + len(ids)})
+        moved += len(ids)
+
+
+def archive_event(event, chunk_size=None):
+    """
+    Move the rows of a finished event to its archive files and complete its EventArchive.
+    Raises LockTimeout if another process is archiving the event and ImproperlyConfigured
+    if EVENT_ARCHIVE_DIR is not usable (see archive_dir).
+    """
+    archive_dir()
+    chunk_size = chunk_size or settings.EVENT_ARCHIVE_CHUNK_SIZE
+    with get_lock_manager().lock(archive_lock_name(event.id)):
+        archive = start_archive(event)
+        if archive.status == EventArchive.STATUS_COMPLETED:
+            return archive
+        os.makedirs(archive.location, exist_ok=True)
+
+        _move(archive, Number.objects.filter(event=event), 'numbers',
+              _encoder(Number), 'numbers_archived', chunk_size)
+        _move(archive, CardPurchase.objects.filter(event=event), 'purchases',
+              _encoder(CardPurchase), 'purchases_archived', chunk_size)
+        # Deleting the cards also deletes their WinClaim rows, kept in archive.winners
+        _move(archive, BingoCard.objects.filter(event=event, user__isnull=False), 'cards',
+              _encode_cards, 'cards_archived', chunk_size)
+        _move(archive, BingoCard.objects.filter(event=event, user__isnull=True), None,
+              None, 'pool_cards_deleted', chunk_size)
+
+        EventArchive.objects.filter(pk=archive.pk).update(
+            status=EventArchive.STATUS_COMPLETED, archived_at=datetime.now(timezone.utc))
+        archive.refresh_from_db()
+
+    logger.info(f"Evento {event.id} archivado: {archive.cards_archived} cartones, "
+                f"{archive.numbers_archived} números, {archive.purchases_archived} compras")
+    return archive
+
+
+def archive_events(now=None, chunk_size=None):
+    """Archive every archivable event, skipping those another process is archiving; yields the archives"""
+    for event in archivable_events(now):
+        try:
+            yield archive_event(event, chunk_size)
+        except LockTimeout:
+            logger.info(f"Evento {event.id} ya se está archivando en otro proceso")
+
+
+def iter_archived(archive, kind):
+    """Rows of one archive file (see ARCHIVE_FILES) as dicts, in archival order"""
+    path = os.path.join(archive.location, ARCHIVE_FILES[kind])
+    if not os.path.exists(path):
+        return
+    seen = set()
+    with gzip.open(path, 'rt') as file:
+        for line in file:
+            row = json.loads(line)
+            # A chunk whose transaction failed after being written is written again
+            if row['id'] in seen:
+                continue
+            seen.add(row['id'])
+            yield row
@@ -0,0 +1,128 @@
+"""
+Per-event totals kept in EventStats.
+
+Every path that changes a total calls add_stats() inside its own transaction, so the
+row moves together with the base rows (CardPurchase, CardBatch, Number, WinClaim) and
+concurrent updates never lose an increment: they are single UPDATE ... SET x = x + n
+statements. reconcile() rebuilds rows from the base tables for events whose totals
+drifted (rows written by scripts, seeds or data fixes that bypass these paths).
+"""
+from datetime import datetime, timezone
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import CardBatch, CardPurchase, Event, EventStats, Number, WinClaim
+
+STAT_FIELDS = ('cards_sold', 'revenue', 'winners', 'numbers_called', 'unique_players')
+
+
+def add_stats(event_id, **deltas):
+    """Add `deltas` (STAT_FIELDS keyword arguments) to the event's totals"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    unknown = set(deltas) - set(STAT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown event stats: {', '.join(sorted(unknown))}")
+
+    values = {field: F(field) + delta for field, delta in deltas.items()}
+    values['updated_at'] = datetime.now(timezone.utc)
+    # No savepoint: a failure here rolls back the caller's transaction anyway
+    with transaction.atomic(savepoint=False):
+        if not EventStats.objects.filter(event_id=event_id).update(**values):
+            # First change of the event; a row created concurrently is left as it is
+            EventStats.objects.bulk_create([EventStats(event_id=event_id)], ignore_conflicts=True)
+            EventStats.objects.filter(event_id=event_id).update(**values)
+
+
+def get_stats(event_id):
+    """Totals of an event as a dict, zeros when nothing was recorded; None if the event does not exist"""
+    row = EventStats.objects.filter(event_id=event_id).values(
+        'event_id', *STAT_FIELDS, 'updated_at', 'reconciled_at').first()
+    if row is not None:
+        return row
+    if not Event.objects.filter(id=event_id).exists():
+        return None
+    return dict({field: 0 for field in STAT_FIELDS},
+                event_id=event_id, updated_at=None, reconciled_at=None)
+
+
+def _grouped(queryset, **aggregate):
+    return {row['event_id']: row for row in queryset.values('event_id').annotate(**aggregate)}
+
+
+def compute_stats(event_ids):
+    """Totals of the given events computed from the base tables, one grouped query per table"""
+    purchases = _grouped(CardPurchase.objects.filter(event_id__in=event_ids),
+                         cards_sold=Sum('cards_owned'), unique_players=Count('id'))
+    revenue = _grouped(CardBatch.objects.filter(event_id__in=event_ids), revenue=Sum('price_paid'))
+    numbers = _grouped(Number.objects.filter(event_id__in=event_ids), numbers_called=Count('id'))
+    winners = _grouped(WinClaim.objects.filter(event_id__in=event_ids), winners=Count('id'))
+
+    stats = {}
+    for event_id in event_ids:
+        purchase = purchases.get(event_id, {})
+        stats[event_id] = {
+            'cards_sold': purchase.get('cards_sold') or 0,
+            'unique_players': purchase.get('unique_players') or 0,
+            'revenue': revenue.get(event_id, {}).get('revenue') or 0,
+            'numbers_called': numbers.get(event_id, {}).get('numbers_called') or 0,
+            'winners': winners.get(event_id, {}).get('winners') or 0,
+        }
+    return stats
+
+
+def reconcile_chunk(event_ids):
+    """
+    Rebuild the totals of a chunk of events. The stats rows are locked before the base
+    tables are read, so add_stats() calls of concurrent transactions are applied either
+    before the rebuild (and counted by it) or after it.
+    Returns the ids whose stored totals were wrong.
+    """
+    now = datetime.now(timezone.utc)
+    with transaction.atomic():
+        # Also normalizes the ids and drops events that no longer exist; archived events
+        # no longer have their base rows, their totals are final
+        event_ids = list(Event.objects.filter(
+            id__in=event_ids, archive__isnull=True).values_list('id', flat=True))
+        EventStats.objects.bulk_create(
+            [EventStats(event_id=event_id) for event_id in event_ids], ignore_conflicts=True)
+        current = {row['event_id']: row for row in EventStats.objects.select_for_update().filter(
+            event_id__in=event_ids).values('event_id', *STAT_FIELDS)}
+
+        drifted = []
+        for event_id, totals in compute_stats(event_ids).items():
+            stored = current[event_id]
+            if any(stored[field] != totals[field] for field in STAT_FIELDS):
+                drifted.append(event_id)
+            EventStats.objects.filter(event_id=event_id).update(
+                **totals, updated_at=now, reconciled_at=now)
+    return drifted
+
+
+def _event_id_chunks(chunk_size):
+    last = None
+    while True:
+        events = Event.objects.order_by('id')
+        if last is not None:
+            events = events.filter(id__gt=last)
+        chunk = list(events.values_list('id', flat=True)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+def reconcile(event_ids=None, chunk_size=100):
+    """
+    Rebuild the totals of `event_ids` (default: every event, walked by id) in chunks
+    of `chunk_size` events, one transaction each. Yields (chunk, drifted ids).
+    """
+    if event_ids is None:
+        chunks = _event_id_chunks(chunk_size)
+    else:
+        event_ids = list(event_ids)
+        chunks = (event_ids[start:start + chunk_size] for start in range(0, len(event_ids), chunk_size))
+    for chunk in chunks:
+        yield chunk, reconcile_chunk(chunk)
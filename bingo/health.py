@@ -90,15 +90,17 @@ def health_check(request):
             db_settings['PASSWORD'] = '******'
         response['database']['settings'] = db_settings
         
-        # Check models
+        # Check models (totals from EventStats, one row per event, instead of full-table counts)
         try:
-            from bingo.models import Number, Event, BingoCard
+            from django.db.models import Count, Sum
+            from bingo.models import EventStats
             response['database']['models'] = {}
             
             try:
-                response['database']['models']['event_count'] = Event.objects.count()
-                response['database']['models']['card_count'] = BingoCard.objects.count()
-                response['database']['models']['number_count'] = Number.objects.count()
+                totals = EventStats.objects.aggregate(
+                    event_count=Count('pk'), card_count=Sum('cards_sold'), number_count=Sum('numbers_called'))
+                response['database']['models'].update(
+                    {key: value or 0 for key, value in totals.items()})
             except Exception as e:
                 error_details.append(f"Error querying models: {str(e)}")
                 response['database']['models']['error'] = str(e)
@@ -122,6 +124,20 @@ def health_check(request):
         error_details.append(f"Unexpected database error: {str(e)}")
         health_status = 'error'
     
+    # Connection pools of this process
+    try:
+        from core.db_pool import pool_stats
+        response['database']['pools'] = pool_stats()
+    except Exception as e:
+        error_details.append(f"Error getting pool metrics: {str(e)}")
+    
+    # Lock contention in this process
+    try:
+        from bingo.locks import get_lock_manager
+        response['locks'] = dict(get_lock_manager().metrics.snapshot(), backend=settings.LOCK_BACKEND)
+    except Exception as e:
+        error_details.append(f"Error getting lock metrics: {str(e)}")
+    
     # Update final status
     response['status'] = health_status
     if error_details:
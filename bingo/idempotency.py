@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint(request):
+    """sha256 of method, path and body; a key can only be replayed for the same request"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = {key: values for key, values in data.lists()}
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _begin(user, key, fingerprint):
+    """
+    Register the key as in progress for IDEMPOTENCY_IN_PROGRESS_LEASE seconds.
+    Returns (record, created); an expired record is replaced, and so is one for the
+    same request still in progress past its lease (the worker handling it died).
+    """
+    now = datetime.now(timezone.utc)
+    values = {
+        'request_fingerprint': fingerprint,
+        'status': IdempotencyKey.STATUS_IN_PROGRESS,
+        'response_status': None,
+        'response_body': None,
+        'expires_at': now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+        'in_progress_until': now + timedelta(seconds=settings.IDEMPOTENCY_IN_PROGRESS_LEASE),
+    }
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, **values), True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.get(user=user, key=key)
+    stuck = (record.status == IdempotencyKey.STATUS_IN_PROGRESS and record.in_progress_until is not None
+             and record.in_progress_until <= now and record.request_fingerprint == fingerprint)
+    if record.expires_at <= now or stuck:
+        replaced = IdempotencyKey.objects.filter(
+            Q(expires_at__lte=now) | Q(status=IdempotencyKey.STATUS_IN_PROGRESS, in_progress_until__lte=now,
+                                       request_fingerprint=fingerprint),
+            pk=record.pk).update(**values)
+        record.refresh_from_db()
+        if replaced:
+            return record, True
+    return record, False
+
+
+def _owned(record):
+    """The key row while `record` still holds it; a request whose lease was taken over no longer does"""
+    return IdempotencyKey.objects.filter(pk=record.pk, in_progress_until=record.in_progress_until)
+
+
+def _renew(record):
+    """Extend the lease of the key held by `record`; False once another request took it over"""
+    until = datetime.now(timezone.utc) + timedelta(seconds=settings.IDEMPOTENCY_IN_PROGRESS_LEASE)
+    if not _owned(record).update(in_progress_until=until):
+        return False
+    record.in_progress_until = until
+    return True
+
+
+@contextmanager
+def _heartbeat(record):
+    """
+    Renew the key's lease every third of IDEMPOTENCY_IN_PROGRESS_LEASE while the block
+    runs, so a retry only takes over the key of a request whose worker stopped renewing it.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.IDEMPOTENCY_IN_PROGRESS_LEASE / 3):
+                try:
+                    if not _renew(record):
+                        return
+                except Exception as e:
+                    # A missed renewal is retried on the next beat, before the lease ends
+                    logger.warning(f"Could not renew idempotency key {record.pk}: {str(e)}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"idempotency-lease:{record.pk}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        # The final writes below match on the lease the heartbeat last stored
+        thread.join()
+
+
+def _wait_for_completion(record):
+    """Concurrent duplicates wait for the first request instead of running again"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while record.status == IdempotencyKey.STATUS_IN_PROGRESS:
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+        try:
+            record.refresh_from_db(fields=['status', 'response_status', 'response_body'])
+        except IdempotencyKey.DoesNotExist:
+            # The first request failed and released the key
+            return None
+    return record
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """
+    Make a DRF action safe to retry with an Idempotency-Key header.
+
+    The first request with a key runs normally and its response is stored for
+    IDEMPOTENCY_KEY_TTL seconds; retries get the stored response without running the
+    action, and retries arriving while the first is still running wait for it.
+    429/5xx responses and exceptions release the key so the client can retry. The
+    key's lease is renewed while the action runs (see _heartbeat), so only a key whose
+    worker died and stopped renewing it is taken over by the next retry.
+    Requests without the header are not affected.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+
+        if len(key) > 255:
+            return Response({"error": f"{IDEMPOTENCY_HEADER} must be at most 255 characters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record, created = _begin(request.user, key, fingerprint)
+
+        if not created:
+            if record.request_fingerprint != fingerprint:
+                return Response({"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            completed = _wait_for_completion(record)
+            if completed is None:
+                return Response({"error": "A request with this Idempotency-Key is still in progress"},
+                                status=status.HTTP_409_CONFLICT)
+            return _replay(completed)
+
+        try:
+            with _heartbeat(record):
+                response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            _owned(record).delete()
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429 or not hasattr(response, 'data'):
+            _owned(record).delete()
+            return response
+
+        _owned(record).update(
+            status=IdempotencyKey.STATUS_COMPLETED,
+            response_status=response.status_code,
+            # Encoded like the JSON renderer does, so the replayed body matches the original
+            response_body=json.loads(json.dumps(response.data, cls=JSONEncoder)),
+            in_progress_until=None)
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys():
+    """Delete stored responses past their TTL; returns the number of rows removed"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=datetime.now(timezone.utc)).delete()
+    return deleted
@@ -0,0 +1,307 @@
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LockTimeout(Exception):
+    """No se pudo adquirir el lock dentro del tiempo de espera"""
+
+
+class LockLost(Exception):
+    """El lease del lock expiró o fue tomado por otro proceso (token de fencing obsoleto)"""
+
+
+class LockMetrics:
+    """Contadores de contención y tiempo de espera de los locks de este proceso"""
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._mutex:
+            self.acquired = 0
+            self.contended = 0
+            self.timeouts = 0
+            self.lost = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def record_acquire(self, wait, contended):
+        with self._mutex:
+            self.acquired += 1
+            self.contended += int(contended)
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_timeout(self, wait):
+        with self._mutex:
+            self.timeouts += 1
+            self.contended += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_lost(self):
+        with self._mutex:
+            self.lost += 1
+
+    def snapshot(self):
+        with self._mutex:
+            attempts = self.acquired + self.timeouts
+            return {
+                'acquired': self.acquired,
+                'contended': self.contended,
+                'timeouts': self.timeouts,
+                'lost': self.lost,
+                'contention_rate': round(self.contended / attempts, 4) if attempts else 0.0,
+                'avg_wait_ms': round(self.total_wait / attempts * 1000, 2) if attempts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+            }
+
+
+class Lock:
+    """
+    Lock adquirido. `token` es el token de fencing: crece en cada adquisición del mismo
+    nombre, así un titular cuyo lease expiró puede detectar que otro lo reemplazó.
+    Las escrituras protegidas guardan el token en la fila que escriben y solo se aplican
+    si la fila no tiene uno mayor (ver TestCoinBalance.fence); ensure_held() es solo una
+    verificación previa, el lease puede expirar entre ella y el COMMIT.
+    Los tokens nunca bajan de la hora actual en microsegundos, así siguen creciendo
+    aunque se reinicie el proceso o se pierda el contador de Redis.
+    """
+
+    def __init__(self, manager, name, owner, token, ttl):
+        self.manager = manager
+        self.name = name
+        self.owner = owner
+        self.token = token
+        self.ttl = ttl
+        self._stop_renewal = None
+
+    def renew(self, ttl=None):
+        """Extiende el lease; retorna False si el lock ya no pertenece a este titular"""
+        renewed = self.manager._renew(self.name, self.owner, self.token, ttl or self.ttl)
+        if not renewed:
+            self.manager.metrics.record_lost()
+        return renewed
+
+    def is_held(self):
+        return self.manager.current_token(self.name) == self.token
+
+    def ensure_held(self):
+        """Verifica que el lock sigue siendo de este titular (no protege por sí sola una escritura)"""
+        if not self.is_held():
+            raise LockLost(f"Lock {self.name} perdido (token {self.token})")
+
+    def start_renewal(self):
+        """Renueva el lease en segundo plano cada ttl/3 hasta liberar el lock"""
+        stop = threading.Event()
+        self._stop_renewal = stop
+
+        def renew_loop():
+            while not stop.wait(self.ttl / 3):
+                if not self.renew():
+                    logger.warning(f"No se pudo renovar el lock {self.name}")
+                    return
+
+        threading.Thread(target=renew_loop, name=f"lock-renewal:{self.name}", daemon=True).start()
+
+    def release(self):
+        if self._stop_renewal is not None:
+            self._stop_renewal.set()
+        return self.manager._release(self.name, self.owner, self.token)
+
+
+class BaseLockManager:
+    def __init__(self, default_ttl=30, poll_interval=0.05):
+        self.default_ttl = default_ttl
+        self.poll_interval = poll_interval
+        self.metrics = LockMetrics()
+
+    def acquire(self, name, ttl=None, timeout=0, auto_renew=False):
+        """
+        Adquiere el lock `name`, esperando hasta `timeout` segundos si está tomado.
+        Lanza LockTimeout si no se obtiene a tiempo.
+        """
+        ttl = ttl or self.default_ttl
+        owner = uuid.uuid4().hex
+        start = time.monotonic()
+        contended = False
+
+        while True:
+            token = self._try_acquire(name, owner, ttl)
+            if token is not None:
+                self.metrics.record_acquire(time.monotonic() - start, contended)
+                lock = Lock(self, name, owner, token, ttl)
+                if auto_renew:
+                    lock.start_renewal()
+                return lock
+
+            contended = True
+            waited = time.monotonic() - start
+            if waited >= timeout:
+                self.metrics.record_timeout(waited)
+                raise LockTimeout(f"Lock {name} ocupado")
+            time.sleep(min(self.poll_interval, timeout - waited))
+
+    @contextmanager
+    def lock(self, name, ttl=None, timeout=0, auto_renew=True):
+        lock = self.acquire(name, ttl=ttl, timeout=timeout, auto_renew=auto_renew)
+        try:
+            yield lock
+        finally:
+            lock.release()
+
+    def current_token(self, name):
+        raise NotImplementedError
+
+    def _try_acquire(self, name, owner, ttl):
+        raise NotImplementedError
+
+    def _renew(self, name, owner, token, ttl):
+        raise NotImplementedError
+
+    def _release(self, name, owner, token):
+        raise NotImplementedError
+
+
+class MemoryLockManager(BaseLockManager):
+    """
+    Locks dentro del proceso con la misma semántica que RedisLockManager (leases, fencing).
+    Para pruebas y desarrollo con un solo worker.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._mutex = threading.Lock()
+        self._holders = {}  # name -> (owner, token, expires_at)
+        self._fences = {}
+
+    def _current(self, name):
+        holder = self._holders.get(name)
+        if holder is not None and holder[2] <= time.monotonic():
+            del self._holders[name]
+            return None
+        return holder
+
+    def current_token(self, name):
+        with self._mutex:
+            holder = self._current(name)
+            return holder[1] if holder else None
+
+    def _try_acquire(self, name, owner, ttl):
+        with self._mutex:
+            if self._current(name) is not None:
+                return None
+            token = max(self._fences.get(name, 0) + 1, time.time_ns() // 1000)
+            self._fences[name] = token
+            self._holders[name] = (owner, token, time.monotonic() + ttl)
+            return token
+
+    def _renew(self, name, owner, token, ttl):
+        with self._mutex:
+            holder = self._current(name)
+            if holder is None or holder[:2] != (owner, token):
+                return False
+            self._holders[name] = (owner, token, time.monotonic() + ttl)
+            return True
+
+    def _release(self, name, owner, token):
+        with self._mutex:
+            holder = self._current(name)
+            if holder is None or holder[:2] != (owner, token):
+                return False
+            del self._holders[name]
+            return True
+
+
+class RedisLockManager(BaseLockManager):
+    """
+    Locks compartidos entre workers. Cada lock es una clave `lock:{name}` con valor
+    "{owner}:{token}" y TTL en milisegundos; `lock:{name}:fence` es el contador de tokens.
+    Adquirir, renovar y liberar son scripts Lua atómicos que comparan el titular.
+    """
+
+    ACQUIRE = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return false
+    end
+    local token = redis.call('INCR', KEYS[2])
+    local now = redis.call('TIME')
+    local floor = tonumber(now[1]) * 1000000 + tonumber(now[2])
+    if token < floor then
+        token = floor
+        redis.call('SET', KEYS[2], string.format('%d', token))
+    end
+    redis.call('SET', KEYS[1], ARGV[1] .. ':' .. string.format('%d', token), 'PX', ARGV[2])
+    return token
+    """
+
+    RENEW = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+
+    RELEASE = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url=None, **kwargs):
+        import redis
+
+        super().__init__(**kwargs)
+        self.client = redis.Redis.from_url(url or settings.LOCK_REDIS_URL)
+        self._acquire = self.client.register_script(self.ACQUIRE)
+        self._renew_script = self.client.register_script(self.RENEW)
+        self._release_script = self.client.register_script(self.RELEASE)
+
+    def _key(self, name):
+        return f"lock:{name}"
+
+    def current_token(self, name):
+        value = self.client.get(self._key(name))
+        if value is None:
+            return None
+        return int(value.decode().rsplit(':', 1)[1])
+
+    def _try_acquire(self, name, owner, ttl):
+        key = self._key(name)
+        token = self._acquire(keys=[key, f"{key}:fence"], args=[owner, int(ttl * 1000)])
+        return int(token) if token is not None else None
+
+    def _renew(self, name, owner, token, ttl):
+        return bool(self._renew_script(keys=[self._key(name)], args=[f"{owner}:{token}", int(ttl * 1000)]))
+
+    def _release(self, name, owner, token):
+        return bool(self._release_script(keys=[self._key(name)], args=[f"{owner}:{token}"]))
+
+
+def balance_lock_name(user_id):
+    """Lock compartido por todas las operaciones que modifican el saldo de un usuario"""
+    return f"balance:{user_id}"
+
+
+_manager = None
+
+
+def get_lock_manager():
+    """Devuelve el gestor de locks configurado en settings.LOCK_BACKEND ('memory' o 'redis')"""
+    global _manager
+    if _manager is None:
+        options = {'default_ttl': settings.LOCK_DEFAULT_TTL}
+        if settings.LOCK_BACKEND == 'redis':
+            _manager = RedisLockManager(**options)
+        else:
+            _manager = MemoryLockManager(**options)
+    return _manager
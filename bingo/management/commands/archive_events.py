@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from bingo.event_archive import ARCHIVED_MODELS, archivable_events, archive_dir, archive_event, archive_events
+from bingo.locks import LockTimeout
+from bingo.models import Event
+
+
+class Command(BaseCommand):
+    help = ('Move the cards, called numbers and purchases of events that ended more than '
+            'EVENT_ARCHIVE_RETENTION_DAYS ago to compressed JSON Lines files, keeping a summary '
+            'in EventArchive')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=str, help='Archive this event (UUID) even if it is inside the retention window')
+        parser.add_argument('--chunk-size', type=int, default=settings.EVENT_ARCHIVE_CHUNK_SIZE,
+                            help='Rows moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the events that would be archived')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='VACUUM ANALYZE the hot tables afterwards (PostgreSQL)')
+
+    def handle(self, *args, **options):
+        if options['event']:
+            try:
+                events = [Event.objects.get(id=options['event'])]
+            except (Event.DoesNotExist, ValidationError) as e:
+                raise CommandError(f"Event not found: {options['event']}") from e
+            if events[0].is_live or events[0].end > datetime.now(timezone.utc):
+                raise CommandError(f"Event {events[0].id} has not ended")
+        else:
+            events = list(archivable_events())
+
+        if options['dry_run']:
+            for event in events:
+                self.stdout.write(f"Event {event.id} ({event.name}, ended {event.end:%Y-%m-%d})")
+            self.stdout.write(f"{len(events)} events to archive")
+            return
+
+        try:
+            archive_dir()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e)) from e
+
+        if options['event']:
+            try:
+                archives = [archive_event(events[0], options['chunk_size'])]
+            except LockTimeout:
+                raise CommandError(f"Event {events[0].id} is being archived by another process")
+        else:
+            archives = archive_events(chunk_size=options['chunk_size'])
+
+        count = 0
+        for archive in archives:
+            count += 1
+            self.stdout.write(
+                f"Event {archive.event_id}: {archive.cards_archived} cards, {archive.numbers_archived} numbers, "
+                f"{archive.purchases_archived} purchases archived, {archive.pool_cards_deleted} pool cards deleted "
+                f"-> {archive.location}")
+        self.stdout.write(self.style.SUCCESS(f"Archived {count} events"))
+
+        if options['vacuum'] and count and connection.vendor == 'postgresql':
+            # Gives the space of the deleted rows back to live activity and refreshes planner stats
+            with connection.cursor() as cursor:
+                for model in ARCHIVED_MODELS:
+                    cursor.execute(f"VACUUM (ANALYZE) {connection.ops.quote_name(model._meta.db_table)}")
+            self.stdout.write("Vacuumed the hot tables")
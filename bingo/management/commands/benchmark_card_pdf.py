@@ -0,0 +1,45 @@
+import time
+import uuid
+from io import BytesIO
+from django.core.management.base import BaseCommand
+from bingo.card_generation import generate_grids
+from bingo.card_pdf import PDF_RENDERERS, PdfCard, write_cards_pdf
+from bingo.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Measure card PDF rendering speed (cards per second) of each renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=400, help='Cards per document')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per renderer, the best one is reported')
+        parser.add_argument('--renderer', choices=PDF_RENDERERS, action='append',
+                            help='Renderer to measure (repeatable); all of them by default')
+
+    def handle(self, *args, **options):
+        # Unsaved event and synthetic cards: only rendering is measured, no database access
+        event = Event(id=uuid.uuid4(), name='Benchmark', prize=0)
+        records = [PdfCard(str(uuid.uuid4()), f"BM-{i:06d}", grid)
+                   for i, grid in enumerate(generate_grids(options['cards']), start=1)]
+
+        results = {}
+        for renderer in options['renderer'] or PDF_RENDERERS:
+            best = None
+            for _ in range(options['repeat']):
+                output = BytesIO()
+                started = time.perf_counter()
+                pages = write_cards_pdf(records, event, output, renderer=renderer)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+
+            results[renderer] = len(records) / best
+            self.stdout.write(
+                f"{renderer}: {len(records)} cards, {pages} pages, {output.tell() / 1024:.0f} KiB "
+                f"in {best:.2f}s -> {results[renderer]:.0f} cards/s")
+
+        if len(results) > 1:
+            baseline = results[PDF_RENDERERS[0]]
+            for renderer, rate in results.items():
+                if renderer != PDF_RENDERERS[0]:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"{renderer} is {rate / baseline:.1f}x the {PDF_RENDERERS[0]} throughput"))
@@ -0,0 +1,150 @@
+import secrets
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from bingo.card_issuing import issue_cards, new_batch_metadata
+from bingo.models import (
+    BingoCard, DepositRequest, Event, Number, PaymentMethod, TestCoinBalance, WinningPattern,
+)
+from bingo.win_patterns import parse_card_numbers
+from core.query_budget import record_queries
+
+# (name, path, max queries); paths are formatted with the seeded ids
+ENDPOINT_BUDGETS = [
+    ('cards', '/api/cards/', 3),
+    ('events/stats', '/api/events/{event_id}/stats/', 2),
+    ('my_transactions', '/api/cards/my_transactions/', 2),
+    ('download_transaction_cards', '/api/cards/download_transaction_cards/?transaction_id={transaction_id}', 3),
+    ('download_pdf', '/api/cards/download_pdf/', 3),
+    ('verify_pattern', '/api/cards/{winning_card_id}/verify_pattern/?pattern=bingo', 6),
+    ('purchase', '/api/cards/purchase/', 20),
+    ('export', '/api/cards/export/?event_id={event_id}&output=jsonl', 3),
+    ('numbers/by_event', '/api/numbers/by_event/?event_id={event_id}', 2),
+    ('deposits', '/api/deposits/', 2),
+    ('deposits/my_deposits', '/api/deposits/my_deposits/', 2),
+    ('deposits/pending', '/api/deposits/pending/', 3),
+    ('winning-patterns', '/api/winning-patterns/', 2),
+    ('users', '/api/users/', 2),
+]
+
+# Endpoints requested with a POST: name -> body built from the seeded ids at request time
+ENDPOINT_BODIES = {
+    'download_pdf': lambda ids: {
+        'event_id': ids['event_id'],
+        'cards': [{'id': str(card_id), 'numbers': numbers} for card_id, numbers in BingoCard.objects.filter(
+            batch_id=ids['transaction_id']).values_list('id', 'numbers')],
+    },
+    'purchase': lambda ids: {'event_id': ids['event_id'], 'quantity': 5},
+}
+
+
+class Command(BaseCommand):
+    help = ('Request each listed endpoint with a small and a larger data set and fail if it '
+            'exceeds its query budget or its query count grows with the data (N+1). '
+            'Runs against the configured database inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small', type=int, default=2, help='Rows per kind in the first run')
+        parser.add_argument('--large', type=int, default=12, help='Rows per kind in the second run')
+        parser.add_argument('--endpoint', action='append', help='Only check these endpoint names')
+
+    def handle(self, *args, **options):
+        endpoints = [entry for entry in ENDPOINT_BUDGETS
+                     if not options['endpoint'] or entry[0] in options['endpoint']]
+        if not endpoints:
+            raise CommandError(f"Unknown endpoint, choose from: {', '.join(e[0] for e in ENDPOINT_BUDGETS)}")
+
+        with transaction.atomic():
+            user, ids = self.seed_base(options['large'])
+            self.seed_rows(user, ids, options['small'])
+            small = {name: self.measure(user, path.format(**ids), self.body(name, ids))
+                     for name, path, _ in endpoints}
+            self.seed_rows(user, ids, options['large'] - options['small'])
+            large = {name: self.measure(user, path.format(**ids), self.body(name, ids))
+                     for name, path, _ in endpoints}
+            transaction.set_rollback(True)
+
+        failures = []
+        for name, _, budget in endpoints:
+            (small_count, _), (large_count, repeated) = small[name], large[name]
+            problems = []
+            if large_count > budget:
+                problems.append(f"over budget {budget}")
+            if large_count > small_count:
+                problems.append(f"grows with data ({small_count} -> {large_count})")
+            if repeated:
+                problems.append(f"repeats {repeated[0][1]}x: {repeated[0][0][:120]}")
+
+            line = f"{name:30} {small_count:3} -> {large_count:3} queries (budget {budget})"
+            if problems:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"{line}  {'; '.join(problems)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if failures:
+            raise CommandError(f"Query budget exceeded by: {', '.join(failures)}")
+
+    def seed_base(self, batch_size):
+        user = get_user_model().objects.create_user(
+            email=f"budget-{secrets.token_hex(4)}@example.com", password=secrets.token_hex(8),
+            is_seller=True, is_staff=True)
+        event = Event.objects.create(
+            name='Query budget', prize=0, start=timezone.now(), end=timezone.now() + timedelta(hours=1))
+        TestCoinBalance.objects.create(user=user, balance=10 ** 6)
+        # A card whose first row is called, so verify_pattern looks up a winning pattern's display name
+        winning_card = issue_cards(event, user, 1, new_batch_metadata(1))[0]
+        for value in parse_card_numbers(winning_card.numbers)[:5]:
+            if value:
+                Number.objects.create(event=event, value=value)
+        metadata = new_batch_metadata(batch_size)
+        return user, {'event_id': str(event.id), 'transaction_id': metadata['transaction_id'],
+                      'winning_card_id': str(winning_card.id), 'metadata': metadata, 'event': event}
+
+    def seed_rows(self, user, ids, count):
+        event = ids['event']
+        issue_cards(event, user, count, ids['metadata'])
+        issue_cards(event, user, count, new_batch_metadata(count))
+        taken = set(Number.objects.filter(event=event).values_list('value', flat=True))
+        for value in [v for v in range(1, 76) if v not in taken][:count]:
+            Number.objects.create(event=event, value=value)
+        for _ in range(count):
+            method = PaymentMethod.objects.create(payment_method=f"budget-{secrets.token_hex(6)}")
+            DepositRequest.objects.create(
+                user=user, amount=10, unique_code=secrets.token_hex(5), reference='ref',
+                payment_method=str(method.id))
+            WinningPattern.objects.create(
+                name=f"budget_{secrets.token_hex(6)}", display_name='Budget', positions=[0, 1, 2, 3, 4],
+                created_by=user)
+            get_user_model().objects.create_user(
+                email=f"budget-{secrets.token_hex(6)}@example.com", password=secrets.token_hex(8))
+
+    def body(self, name, ids):
+        build = ENDPOINT_BODIES.get(name)
+        return build(ids) if build else None
+
+    def measure(self, user, path, body=None):
+        """
+        (query count, repeated fingerprints) of one authenticated request, body included;
+        a GET, or a POST of `body` when given
+        """
+        factory = APIRequestFactory()
+        request = factory.get(path) if body is None else factory.post(path, body, format='json')
+        force_authenticate(request, user=user)
+        match = resolve(path.split('?')[0])
+        with record_queries() as recorder:
+            response = match.func(request, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        if response.status_code >= 400:
+            raise CommandError(f"{path} answered {response.status_code}")
+        return recorder.count, recorder.repeated()
@@ -0,0 +1,39 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from bingo.card_export import EXPORT_FORMATS, FORMAT_CSV, cards_to_export, iter_export
+
+
+class Command(BaseCommand):
+    help = 'Stream the cards of an event or transaction to a CSV, JSON Lines or columnar file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', help='Event id')
+        parser.add_argument('--transaction', help='Transaction id (metadata.transaction_id)')
+        parser.add_argument('--user', type=int, help='Only cards owned by this user id')
+        parser.add_argument('--format', dest='export_format', choices=EXPORT_FORMATS, default=FORMAT_CSV)
+        parser.add_argument('--output', default='-', help='File to write, - for stdout')
+        parser.add_argument('--chunk-size', type=int, help='Cards per cursor round trip')
+
+    def handle(self, *args, **options):
+        if not options['event'] and not options['transaction']:
+            raise CommandError('--event or --transaction is required')
+
+        queryset = cards_to_export(options['event'], options['transaction'], options['user'])
+        chunks = iter_export(queryset, options['export_format'], options['chunk_size'])
+
+        started = time.perf_counter()
+        written = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        if options['output'] != '-':
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {written / 1024 / 1024:.1f} MiB to {options['output']} in {elapsed:.2f}s"))
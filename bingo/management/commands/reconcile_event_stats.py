@@ -0,0 +1,26 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from bingo.event_stats import reconcile
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the EventStats totals from CardPurchase, CardBatch, Number and WinClaim, '
+            'a chunk of events per transaction, and report the events whose totals had drifted')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', action='append', help='Only rebuild these events (UUID)')
+        parser.add_argument('--chunk-size', type=int, default=100, help='Events per transaction')
+
+    def handle(self, *args, **options):
+        total = drifted_total = 0
+        try:
+            for chunk, drifted in reconcile(options['event'], options['chunk_size']):
+                total += len(chunk)
+                drifted_total += len(drifted)
+                for event_id in drifted:
+                    self.stdout.write(self.style.WARNING(f"Event {event_id}: totals corrected"))
+        except ValidationError as e:
+            raise CommandError(f"Invalid event id: {e.messages[0]}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {total} events, {drifted_total} had drifted"))
@@ -0,0 +1,40 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from bingo.card_pool import refill_all_pools, refill_pool
+from bingo.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Keep the pre-generated card pool of upcoming events between the low and high watermarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=str, help='Only refill this event (UUID)')
+        parser.add_argument('--once', action='store_true', help='Run a single refill pass and exit')
+        parser.add_argument('--interval', type=float, default=settings.CARD_POOL_REFILL_INTERVAL,
+                            help='Seconds between refill passes')
+
+    def handle(self, *args, **options):
+        event_id = options['event']
+        if event_id:
+            try:
+                Event.objects.get(id=event_id)
+            except Event.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f"Event not found: {event_id}"))
+                return
+
+        while True:
+            if event_id:
+                added = {event_id: refill_pool(Event.objects.get(id=event_id))}
+            else:
+                added = refill_all_pools()
+
+            for refilled_event, count in added.items():
+                if count:
+                    self.stdout.write(f"Event {refilled_event}: added {count} cards to the pool")
+
+            if options['once']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bingo.card_jobs import run_worker_pool
+
+
+class Command(BaseCommand):
+    help = 'Run the worker pool that generates queued card batches (CardGenerationJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.CARD_JOB_WORKERS,
+                            help='Number of concurrent workers')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when there are no more queued jobs')
+        parser.add_argument('--poll-interval', type=float, default=settings.CARD_JOB_POLL_INTERVAL,
+                            help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Starting {workers} card job worker(s)")
+        run_worker_pool(workers, once=options['once'], poll_interval=options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS("Card job workers stopped"))
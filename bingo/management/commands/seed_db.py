@@ -6,6 +6,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from users.models import CustomUser
 from bingo.models import Event, BingoCard, Number, WinningPattern
+from bingo.card_generation import generate_grids
 import datetime
 
 # Try to import wallet-related models, but handle gracefully if they don't exist
@@ -59,53 +60,6 @@ class Command(BaseCommand):
         # Note: We're not deleting users by default to preserve user accounts
         self.stdout.write(self.style.SUCCESS('Data clearing completed'))
 
-    def generate_bingo_card(self):
-        """
-        Generate a proper Bingo card with numbers in the format:
-        ["B1", "B3", "I16", "N31", "N0", ...] where:
-        - B column: 1-15
-        - I column: 16-30
-        - N column: 31-45 (with free space in center)
-        - G column: 46-60
-        - O column: 61-75
-        
-        Numbers are arranged in column-first order to match the standard 5x5 grid:
-        0  5  10 15 20 (B column)
-        1  6  11 16 21 (I column)
-        2  7  12 17 22 (N column with free space at 12)
-        3  8  13 18 23 (G column)
-        4  9  14 19 24 (O column)
-        """
-        # Define column letters and ranges
-        columns = [
-            ('B', range(1, 16)),    # 1-15
-            ('I', range(16, 31)),   # 16-30
-            ('N', range(31, 46)),   # 31-45
-            ('G', range(46, 61)),   # 46-60
-            ('O', range(61, 76))    # 61-75
-        ]
-        
-        # Initialize empty list for card numbers (25 positions)
-        card_numbers = [""] * 25
-        
-        # Generate numbers for each column
-        for col_idx, (letter, number_range) in enumerate(columns):
-            # Select 5 random unique numbers from the column range
-            col_numbers = random.sample(list(number_range), 5)
-            
-            # Place numbers in the appropriate positions
-            for row_idx in range(5):
-                # Calculate position in the flat card array (col-first layout)
-                position = row_idx * 5 + col_idx
-                
-                # Handle free space in the middle (position 12)
-                if position == 12:  # Center position
-                    card_numbers[position] = "N0"  # Free space
-                else:
-                    card_numbers[position] = f"{letter}{col_numbers[row_idx]}"
-        
-        return card_numbers
-
     def create_default_patterns(self):
         """Create default winning patterns if they don't exist"""
         self.stdout.write('Creating default winning patterns...')
@@ -290,9 +244,7 @@ class Command(BaseCommand):
                     self.stdout.write(f'User {user.email} already has enough cards for event {event.name}')
                     continue
                 
-                for _ in range(cards_to_create):
-                    # Generate card numbers using the new method
-                    numbers = self.generate_bingo_card()
+                for numbers in generate_grids(cards_to_create).numbers():
                     
                     # Generate a unique hash for this card based on the numbers
                     card_hash = hashlib.md5(
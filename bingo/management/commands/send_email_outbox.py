@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bingo.email_outbox import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Render and send the queued card emails (EmailDelivery) in batches over one SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when there are no more due emails')
+        parser.add_argument('--poll-interval', type=float, default=settings.EMAIL_OUTBOX_POLL_INTERVAL,
+                            help='Seconds to wait when the outbox is empty')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Starting email outbox worker")
+        run_worker(once=options['once'], poll_interval=options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS("Email outbox worker stopped"))
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:43
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0012_bingocard_correlative_id_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WinClaim',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pattern_name', models.CharField(max_length=50)),
+                ('win_details', models.JSONField(default=dict)),
+                ('win_sequence', models.PositiveIntegerField()),
+                ('rank', models.PositiveIntegerField()),
+                ('source', models.CharField(choices=[('api', 'API'), ('websocket', 'WebSocket')], default='api', max_length=10)),
+                ('claimed_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('card', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='win_claim', to='bingo.bingocard')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='win_claims', to='bingo.event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='win_claims', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['event', 'rank'],
+                'indexes': [models.Index(fields=['event', 'win_sequence'], name='bingo_wincl_event_i_254a70_idx')],
+            },
+        ),
+    ]
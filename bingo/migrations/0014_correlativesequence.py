@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0013_winclaim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorrelativeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=20)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='correlative_sequences', to='bingo.event')),
+            ],
+            options={
+                'unique_together': {('event', 'prefix')},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+from bingo.win_patterns import card_fingerprint
+
+BATCH_SIZE = 2000
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """
+    Fill the fingerprint of existing cards in chunks.
+    Repeated grids inside an event keep a NULL fingerprint so the unique constraint can be created.
+    """
+    BingoCard = apps.get_model('bingo', 'BingoCard')
+
+    seen = set()
+    pending = []
+    queryset = BingoCard.objects.filter(fingerprint__isnull=True).order_by('event_id', 'created_at')
+    for card in queryset.only('id', 'event_id', 'numbers').iterator(chunk_size=BATCH_SIZE):
+        fingerprint = card_fingerprint(card.numbers)
+        key = (card.event_id, fingerprint)
+        if key in seen:
+            continue
+        seen.add(key)
+        card.fingerprint = fingerprint
+        pending.append(card)
+        if len(pending) >= BATCH_SIZE:
+            BingoCard.objects.bulk_update(pending, ['fingerprint'])
+            pending = []
+
+    if pending:
+        BingoCard.objects.bulk_update(pending, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0014_correlativesequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bingocard',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bingocard',
+            constraint=models.UniqueConstraint(fields=('event', 'fingerprint'), name='unique_card_fingerprint_per_event'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0015_bingocard_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bingocard',
+            index=models.Index(condition=models.Q(('user__isnull', True)), fields=['event', 'created_at'], name='bingo_card_pool_idx'),
+        ),
+    ]
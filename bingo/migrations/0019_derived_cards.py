@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0018_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bingocard',
+            name='seed_index',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='card_seed',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='bingocard',
+            name='hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='bingocard',
+            name='numbers',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='bingocard',
+            constraint=models.UniqueConstraint(fields=('event', 'seed_index'), name='unique_card_seed_index_per_event'),
+        ),
+    ]
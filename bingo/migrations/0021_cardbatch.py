@@ -0,0 +1,98 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:22
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def _batch_id(transaction_id):
+    try:
+        return uuid.UUID(str(transaction_id))
+    except ValueError:
+        return None
+
+
+def backfill_batches(apps, schema_editor):
+    """
+    Create a CardBatch for every metadata.transaction_id of existing seller cards and
+    link the cards to it. Two linear passes in chunks; the price is only known for
+    batches generated by a CardGenerationJob.
+    """
+    BingoCard = apps.get_model('bingo', 'BingoCard')
+    CardBatch = apps.get_model('bingo', 'CardBatch')
+    CardGenerationJob = apps.get_model('bingo', 'CardGenerationJob')
+
+    cards = BingoCard.objects.filter(
+        metadata__has_key='transaction_id', user__isnull=False, batch__isnull=True)
+
+    batches = {}
+    rows = cards.values_list('metadata', 'user_id', 'event_id', 'created_at').iterator(chunk_size=BATCH_SIZE)
+    for metadata, user_id, event_id, created_at in rows:
+        batch_id = _batch_id(metadata.get('transaction_id'))
+        if batch_id is None:
+            continue
+        batch = batches.get(batch_id)
+        if batch is None:
+            batches[batch_id] = CardBatch(
+                id=batch_id, seller_id=user_id, event_id=event_id,
+                size=metadata.get('batch_size') or 0, created_at=created_at)
+        else:
+            batch.created_at = min(batch.created_at, created_at)
+
+    jobs = CardGenerationJob.objects.filter(transaction_id__in=list(batches))
+    for job in jobs.only('transaction_id', 'unit_price', 'quantity').iterator(chunk_size=BATCH_SIZE):
+        batches[job.transaction_id].price_paid = job.unit_price * job.quantity
+    CardBatch.objects.bulk_create(batches.values(), batch_size=BATCH_SIZE)
+
+    pending = []
+    for card in cards.only('id', 'metadata').iterator(chunk_size=BATCH_SIZE):
+        batch_id = _batch_id(card.metadata.get('transaction_id'))
+        if batch_id not in batches:
+            continue
+        card.batch_id = batch_id
+        pending.append(card)
+        if len(pending) >= BATCH_SIZE:
+            BingoCard.objects.bulk_update(pending, ['batch'])
+            pending = []
+
+    if pending:
+        BingoCard.objects.bulk_update(pending, ['batch'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0020_emaildelivery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardBatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('size', models.PositiveIntegerField()),
+                ('price_paid', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_batches', to='bingo.event')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_batches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='bingocard',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cards', to='bingo.cardbatch'),
+        ),
+        migrations.AddIndex(
+            model_name='cardbatch',
+            index=models.Index(fields=['seller', '-created_at'], name='bingo_cardb_seller__4730d0_idx'),
+        ),
+        migrations.RunPython(backfill_batches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    """Totals of existing events from the base tables, one grouped query per table"""
+    Event = apps.get_model('bingo', 'Event')
+    EventStats = apps.get_model('bingo', 'EventStats')
+    sources = [
+        (apps.get_model('bingo', 'CardPurchase'), {'cards_sold': Sum('cards_owned'), 'unique_players': Count('id')}),
+        (apps.get_model('bingo', 'CardBatch'), {'revenue': Sum('price_paid')}),
+        (apps.get_model('bingo', 'Number'), {'numbers_called': Count('id')}),
+        (apps.get_model('bingo', 'WinClaim'), {'winners': Count('id')}),
+    ]
+
+    stats = {event_id: EventStats(event_id=event_id)
+             for event_id in Event.objects.values_list('id', flat=True)}
+    for model, aggregates in sources:
+        for row in model.objects.values('event_id').annotate(**aggregates):
+            for field in aggregates:
+                setattr(stats[row['event_id']], field, row[field] or 0)
+    EventStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0022_bingocard_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventStats',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='bingo.event')),
+                ('cards_sold', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('winners', models.PositiveIntegerField(default=0)),
+                ('numbers_called', models.PositiveSmallIntegerField(default=0)),
+                ('unique_players', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0023_eventstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventArchive',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='bingo.event')),
+                ('status', models.CharField(choices=[('archiving', 'Archivando'), ('completed', 'Archivado')], default='archiving', max_length=10)),
+                ('draw_sequence', models.JSONField(default=list)),
+                ('winners', models.JSONField(default=list)),
+                ('stats', models.JSONField(default=dict)),
+                ('location', models.CharField(max_length=500)),
+                ('cards_archived', models.PositiveIntegerField(default=0)),
+                ('numbers_archived', models.PositiveIntegerField(default=0)),
+                ('purchases_archived', models.PositiveIntegerField(default=0)),
+                ('pool_cards_deleted', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('archived_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0024_eventarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcoinbalance',
+            name='fence',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0025_testcoinbalance_fence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cardgenerationjob',
+            name='attempt',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0026_cardgenerationjob_attempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='in_progress_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+from bingo.card_derivation import derive_grid
+from bingo.win_patterns import grid_fingerprint
+
+BATCH_SIZE = 2000
+
+
+def backfill_derived_fingerprints(apps, schema_editor):
+    """
+    Store the fingerprint of derived cards, derived from the event seed and the card index.
+    A grid already issued in the event keeps a NULL fingerprint, as in 0015.
+    """
+    BingoCard = apps.get_model('bingo', 'BingoCard')
+    Event = apps.get_model('bingo', 'Event')
+
+    seeds = dict(Event.objects.filter(card_seed__isnull=False).values_list('id', 'card_seed'))
+    queryset = BingoCard.objects.filter(
+        fingerprint__isnull=True, seed_index__isnull=False).order_by('event_id', 'seed_index')
+    pending = []
+    for card in queryset.only('id', 'event_id', 'seed_index').iterator(chunk_size=BATCH_SIZE):
+        card.fingerprint = grid_fingerprint(derive_grid(seeds[card.event_id], card.seed_index))
+        pending.append(card)
+        if len(pending) >= BATCH_SIZE:
+            _save(BingoCard, pending)
+            pending = []
+    _save(BingoCard, pending)
+
+
+def _save(BingoCard, cards):
+    taken = set(BingoCard.objects.filter(
+        fingerprint__in=[card.fingerprint for card in cards]
+    ).values_list('event_id', 'fingerprint'))
+    unique = []
+    for card in cards:
+        key = (card.event_id, card.fingerprint)
+        if key not in taken:
+            taken.add(key)
+            unique.append(card)
+    BingoCard.objects.bulk_update(unique, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bingo', '0027_idempotencykey_in_progress_until'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_derived_fingerprints, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,22 @@
-from django.db import models, transaction
+from django.db import IntegrityError, connection, models, transaction
 from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
+import json
 import uuid
 import string
 import random
+import secrets
+
+from .card_derivation import derive_card_numbers
+from .locks import LockLost
+from .win_patterns import card_fingerprint
 
 User = settings.AUTH_USER_MODEL
 
+# Las semillas no cambian una vez asignadas: se guardan por proceso
+_card_seeds = {}
+
 
 class Event(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -22,10 +32,31 @@ class Event(models.Model):
         'WinningPattern', blank=True, related_name='events')
     disabled_patterns = models.ManyToManyField(
         'WinningPattern', blank=True, related_name='disabled_in_events')
+    # Semilla de los cartones derivados del evento (ver bingo.card_derivation)
+    card_seed = models.BigIntegerField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def ensure_card_seed(self):
+        """Asigna la semilla de cartones derivados la primera vez; nunca cambia después"""
+        if self.card_seed is None:
+            Event.objects.filter(pk=self.pk, card_seed__isnull=True).update(
+                card_seed=secrets.randbits(63))
+            self.card_seed = Event.objects.values_list('card_seed', flat=True).get(pk=self.pk)
+        _card_seeds[self.pk] = self.card_seed
+        return self.card_seed
+
+    @classmethod
+    def card_seed_for(cls, event_id):
+        """Semilla del evento, None si aún no tiene cartones derivados"""
+        seed = _card_seeds.get(event_id)
+        if seed is None:
+            seed = cls.objects.filter(pk=event_id).values_list('card_seed', flat=True).first()
+            if seed is not None:
+                _card_seeds[event_id] = seed
+        return seed
+
     def should_be_live(self):
         """
         Determina si un evento debe estar en línea basándose en la hora actual
@@ -63,31 +94,113 @@ class Event(models.Model):
         return updated_events
 
 
+class CardBatch(models.Model):
+    """
+    Lote de cartones generado por un vendedor. El id es el transaction_id que los
+    cartones del lote llevan en metadata y con el que se descargan; `price_paid` es
+    NULL en los lotes reconstruidos desde metadata, cuyo cobro no quedó registrado.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    seller = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='card_batches')
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, related_name='card_batches')
+    size = models.PositiveIntegerField()
+    price_paid = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['seller', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.seller_id}: {self.size} cartones ({self.id})"
+
+    @staticmethod
+    def id_for(metadata):
+        """Id del lote al que pertenecen los cartones con esta metadata, o None"""
+        return (metadata or {}).get('transaction_id')
+
+
 class BingoCard(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
-    numbers = models.JSONField()
+    batch = models.ForeignKey(
+        CardBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='cards')
+    # NULL en cartones derivados: los números se calculan de (semilla del evento, seed_index)
+    numbers = models.JSONField(null=True, blank=True)
     is_winner = models.BooleanField(default=False)
-    hash = models.CharField(max_length=64, unique=True)
+    hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     # Agregar campo correlativo para identificar cartones de forma secuencial por evento
     correlative_id = models.CharField(
         max_length=20, null=True, blank=True, db_index=True)
     # Agregar campo de metadatos para almacenar información adicional como el ID de transacción
     metadata = models.JSONField(default=dict, blank=True, null=True)
+    # Huella canónica de la cuadrícula (ver win_patterns.card_fingerprint)
+    fingerprint = models.CharField(max_length=50, null=True, blank=True)
+    # Índice del cartón derivado dentro del evento (ver bingo.card_derivation)
+    seed_index = models.PositiveBigIntegerField(null=True, blank=True)
 
     class Meta:
         # Asegurar que el correlative_id sea único por evento
         unique_together = [['event', 'correlative_id']]
+        constraints = [
+            # Un mismo cartón no puede repetirse dentro de un evento
+            models.UniqueConstraint(
+                fields=['event', 'fingerprint'], name='unique_card_fingerprint_per_event'),
+            models.UniqueConstraint(
+                fields=['event', 'seed_index'], name='unique_card_seed_index_per_event'),
+        ]
+        indexes = [
+            # Cartones pre-generados sin dueño (pool de inventario por evento)
+            models.Index(fields=['event', 'created_at'], name='bingo_card_pool_idx',
+                         condition=models.Q(user__isnull=True)),
+            # Páginas del listado de cartones del usuario (cursor sobre created_at)
+            models.Index(fields=['user', '-created_at'], name='bingo_card_user_created_idx'),
+        ]
 
     @classmethod
-    def generate_correlative_id(cls, event):
+    def from_db(cls, db, field_names, values):
+        card = super().from_db(db, field_names, values)
+        # Los cartones derivados se leen igual que los guardados
+        if card.__dict__.get('seed_index') is not None and 'numbers' in card.__dict__:
+            card.derive_numbers()
+        return card
+
+    @property
+    def is_derived(self):
+        return self.seed_index is not None
+
+    def derive_numbers(self):
+        if self.numbers is None:
+            self.numbers = derive_card_numbers(Event.card_seed_for(self.event_id), self.seed_index)
+        return self.numbers
+
+    def save(self, *args, **kwargs):
+        if self.is_derived:
+            # Los números derivados nunca se escriben en la base de datos
+            numbers, self.numbers = self.numbers, None
+            try:
+                super().save(*args, **kwargs)
+            finally:
+                self.numbers = numbers
+            return
+
+        if self.fingerprint is None and self.numbers:
+            self.fingerprint = card_fingerprint(self.numbers)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def correlative_prefix(cls, event):
         """
-        Genera un ID correlativo único para un cartón de bingo.
-        El formato es: {primeras_2_letras}{ultimas_2_letras}{mes}{año}-{secuencia}
+        Prefijo del ID correlativo de un evento.
+        El formato es: {primeras_2_letras}{ultimas_2_letras}{mes}{año}
 
-        Por ejemplo: CHMD42025-0001, CHMD42025-0002, etc.
+        Por ejemplo: CHMD42025
         """
         # Extraer iniciales del evento (primeras 2 letras y últimas 2 letras)
         event_name = event.name.strip()
@@ -113,27 +226,118 @@ class BingoCard(models.Model):
         month = str(today.month).zfill(1)  # Mes con un dígito
         year = str(today.year)[-4:]  # Los 4 dígitos del año
 
-        prefix += f"{month}{year}"
+        return prefix + f"{month}{year}"
+
+    @classmethod
+    def reserve_correlative_ids(cls, event, count):
+        """
+        Reserva `count` IDs correlativos consecutivos para un evento en una sola operación.
+        El formato es: {prefijo}-{secuencia}, por ejemplo: CHMD42025-0001, CHMD42025-0002, etc.
+        """
+        prefix = cls.correlative_prefix(event)
+        first = CorrelativeSequence.reserve(event, prefix, count)
+        # Formatear el correlativo con ceros a la izquierda (4 dígitos)
+        return [f"{prefix}-{seq:04d}" for seq in range(first, first + count)]
+
+    @classmethod
+    def generate_correlative_id(cls, event):
+        """
+        Genera un ID correlativo único para un cartón de bingo.
+        El formato es: {primeras_2_letras}{ultimas_2_letras}{mes}{año}-{secuencia}
+
+        Por ejemplo: CHMD42025-0001, CHMD42025-0002, etc.
+        """
+        return cls.reserve_correlative_ids(event, 1)[0]
+
+    @classmethod
+    def claim_from_pool(cls, event, user, count, metadata=None):
+        """
+        Asigna al usuario hasta `count` cartones pre-generados del evento (user NULL)
+        con un solo UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED LIMIT n),
+        así compras concurrentes nunca esperan ni toman el mismo cartón.
+        Retorna los cartones asignados, que pueden ser menos de `count` si el pool no alcanza.
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        skip_locked = "FOR UPDATE SKIP LOCKED" if connection.features.has_select_for_update_skip_locked else ""
+        sql = (f"UPDATE {table} SET user_id = %s, metadata = %s, batch_id = %s "
+               f"WHERE id IN (SELECT id FROM {table} WHERE event_id = %s AND user_id IS NULL "
+               f"ORDER BY created_at LIMIT %s {skip_locked}) RETURNING id")
+        user_id = cls._meta.get_field('user').target_field.get_db_prep_value(user.pk, connection)
+        event_id = Event._meta.pk.get_db_prep_value(event.pk, connection)
+        batch_id = CardBatch._meta.pk.get_db_prep_value(CardBatch.id_for(metadata), connection)
+
+        # Un solo UPDATE: no necesita savepoint dentro de la transacción de la compra
+        with transaction.atomic(savepoint=False):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [user_id, json.dumps(metadata or {}), batch_id, event_id, count])
+                ids = [cls._meta.pk.to_python(row[0]) for row in cursor.fetchall()]
+
+        if not ids:
+            return []
+        return list(cls.objects.filter(id__in=ids).order_by('correlative_id'))
+
+
+class CorrelativeSequence(models.Model):
+    """
+    Contador de IDs correlativos por evento y prefijo.
+    Reemplaza la búsqueda del último correlativo en BingoCard por un UPDATE atómico,
+    de modo que compras concurrentes nunca obtienen el mismo número.
+    """
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, related_name='correlative_sequences')
+    prefix = models.CharField(max_length=20)
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['event', 'prefix']
+
+    def __str__(self):
+        return f"{self.prefix}: {self.last_value}"
+
+    @classmethod
+    def reserve(cls, event, prefix, count=1):
+        """
+        Reserva `count` valores consecutivos con un solo UPDATE ... RETURNING.
+        Retorna el primer valor del rango reservado.
+        La fila del contador queda bloqueada hasta que confirme la transacción que la
+        actualiza: fuera de una transacción es solo este UPDATE, por eso las compras
+        reservan antes de abrir la suya.
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        event_id = Event._meta.pk.get_db_prep_value(event.pk, connection)
+        sql = (f"UPDATE {table} SET last_value = last_value + %s "
+               f"WHERE event_id = %s AND prefix = %s RETURNING last_value")
 
-        # Obtener el último correlativo para este evento con el nuevo formato
         with transaction.atomic():
-            last_card = cls.objects.filter(
-                event=event,
-                correlative_id__startswith=f"{prefix}-"
-            ).order_by('-correlative_id').first()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [count, event_id, prefix])
+                row = cursor.fetchone()
+                if row is None:
+                    # Primera reserva para este prefijo: crear el contador y reintentar
+                    cls._create_sequence(event, prefix)
+                    cursor.execute(sql, [count, event_id, prefix])
+                    row = cursor.fetchone()
 
-            if last_card and last_card.correlative_id:
-                # Extraer el número de secuencia del último correlativo
-                try:
-                    last_seq = int(last_card.correlative_id.split('-')[1])
-                    next_seq = last_seq + 1
-                except (ValueError, IndexError):
-                    next_seq = 1
-            else:
-                next_seq = 1
+        return row[0] - count + 1
 
-            # Formatear el correlativo con ceros a la izquierda (4 dígitos)
-            return f"{prefix}-{next_seq:04d}"
+    @classmethod
+    def _create_sequence(cls, event, prefix):
+        """Crea el contador partiendo del mayor correlativo existente (cartones anteriores a esta tabla)"""
+        last_value = 0
+        for correlative_id in BingoCard.objects.filter(
+            event=event, correlative_id__startswith=f"{prefix}-"
+        ).values_list('correlative_id', flat=True).iterator():
+            try:
+                last_value = max(last_value, int(correlative_id.split('-')[1]))
+            except (ValueError, IndexError):
+                continue
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(event=event, prefix=prefix, last_value=last_value)
+        except IntegrityError:
+            # Otro proceso lo creó al mismo tiempo
+            pass
 
 
 class Wallet(models.Model):
@@ -163,6 +367,8 @@ class TestCoinBalance(models.Model):
         User, on_delete=models.CASCADE, related_name='test_coins')
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     last_updated = models.DateTimeField(auto_now=True)
+    # Token de fencing del último lock del saldo (locks.balance_lock_name) con que se escribió
+    fence = models.BigIntegerField(default=0)
 
     class Meta:
         db_table = 'test_coin_balance'
@@ -174,30 +380,49 @@ class TestCoinBalance(models.Model):
         return f"{self.user.email}: {self.balance} coins"
 
     @classmethod
-    @transaction.atomic
-    def deduct_coins(cls, user_id, amount):
-        """Safely deduct coins with optimistic concurrency control"""
-        # Select for update to prevent race conditions
-        balance = cls.objects.select_for_update().get(user_id=user_id)
+    def deduct_coins(cls, user_id, amount, fence=None):
+        """
+        Descuenta `amount` con un solo UPDATE condicional a que el saldo alcance.
 
-        # Convert amount to Decimal to ensure proper decimal arithmetic
+        `fence` es el token del lock del saldo con que se escribe: el UPDATE solo se aplica
+        si ningún titular más nuevo escribió la fila (fence <= token), así un titular cuyo
+        lease expiró entre la verificación y el COMMIT no puede escribir después de su
+        reemplazo. En ese caso lanza LockLost.
+        """
         from decimal import Decimal, ROUND_DOWN
 
-        # Normalize both values to 2 decimal places to avoid precision issues
-        amount = Decimal(str(amount)).quantize(
-            Decimal('0.01'), rounding=ROUND_DOWN)
-        current_balance = Decimal(str(balance.balance)).quantize(
-            Decimal('0.01'), rounding=ROUND_DOWN)
+        # Normalize the amount to 2 decimal places to avoid precision issues
+        amount = Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
 
-        # Compare the normalized values
-        if current_balance < amount:
-            return False, f"No tienes saldo suficiente. Necesitas tener {amount:.2f}, y tu saldo es {current_balance:.2f}."
+        rows = cls.objects.filter(user_id=user_id, balance__gte=amount)
+        values = {'balance': F('balance') - amount, 'last_updated': timezone.now()}
+        if fence is not None:
+            rows = rows.filter(fence__lte=fence)
+            values['fence'] = fence
+        updated = rows.update(**values)
 
-        # Update the balance using the normalized amount
-        balance.balance = current_balance - amount
-        balance.save()
-        balance.refresh_from_db()
-        return True, balance
+        balance = cls.objects.get(user_id=user_id)
+        if updated:
+            return True, balance
+        if fence is not None and balance.fence > fence:
+            raise LockLost(f"Saldo de {user_id} escrito con un token más nuevo que {fence}")
+        current_balance = Decimal(str(balance.balance)).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+        return False, f"No tienes saldo suficiente. Necesitas tener {amount:.2f}, y tu saldo es {current_balance:.2f}."
+
+    @classmethod
+    def credit_coins(cls, user_id, amount, fence=None):
+        """
+        Acredita `amount` (p. ej. un reembolso) con un solo UPDATE, cercado con `fence`
+        igual que deduct_coins: lanza LockLost si un titular más nuevo escribió el saldo.
+        """
+        rows = cls.objects.filter(user_id=user_id)
+        values = {'balance': F('balance') + amount, 'last_updated': timezone.now()}
+        if fence is not None:
+            rows = rows.filter(fence__lte=fence)
+            values['fence'] = fence
+        if not rows.update(**values) and fence is not None and cls.objects.filter(
+                user_id=user_id, fence__gt=fence).exists():
+            raise LockLost(f"Saldo de {user_id} escrito con un token más nuevo que {fence}")
 
 
 class DepositRequest(models.Model):
@@ -246,14 +471,22 @@ class DepositRequest(models.Model):
 
     @classmethod
     @transaction.atomic
-    def approve(cls, deposit_id, staff_user):
-        """Approve deposit and update user balance"""
+    def approve(cls, deposit_id, staff_user, fence=None):
+        """
+        Approve deposit and update user balance.
+        `fence` is the token of the balance lock, see TestCoinBalance.deduct_coins.
+        """
         deposit = cls.objects.select_for_update().get(id=deposit_id, status='pending')
 
         # Update balance
         balance, created = TestCoinBalance.objects.select_for_update().get_or_create(
             user=deposit.user, defaults={"balance": 0}
         )
+        if fence is not None:
+            # The row stays locked until commit, so a newer holder writes after this check
+            if balance.fence > fence:
+                raise LockLost(f"Saldo de {deposit.user_id} escrito con un token más nuevo que {fence}")
+            balance.fence = fence
         balance.balance += deposit.amount
         balance.save()
 
@@ -303,6 +536,238 @@ class WinningPattern(models.Model):
         return self.display_name
 
 
+class WinClaim(models.Model):
+    """
+    Reclamo de victoria adjudicado para un cartón.
+    Guarda el número de llamada con el que el cartón completó el patrón (win_sequence)
+    y el orden de adjudicación dentro del evento (rank).
+    """
+    SOURCE_API = 'api'
+    SOURCE_WEBSOCKET = 'websocket'
+    SOURCE_CHOICES = (
+        (SOURCE_API, 'API'),
+        (SOURCE_WEBSOCKET, 'WebSocket'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, related_name='win_claims')
+    card = models.OneToOneField(
+        BingoCard, on_delete=models.CASCADE, related_name='win_claim')
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='win_claims')
+    pattern_name = models.CharField(max_length=50)
+    win_details = models.JSONField(default=dict)
+    win_sequence = models.PositiveIntegerField()
+    rank = models.PositiveIntegerField()
+    source = models.CharField(
+        max_length=10, choices=SOURCE_CHOICES, default=SOURCE_API)
+    claimed_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['event', 'rank']
+        indexes = [
+            models.Index(fields=['event', 'win_sequence']),
+        ]
+
+    def __str__(self):
+        return f"{self.card_id} - {self.pattern_name} (llamada {self.win_sequence})"
+
+
+class CardGenerationJob(models.Model):
+    """
+    Lote grande de cartones generado en segundo plano (ver bingo.card_jobs).
+    El costo se cobra al crear el trabajo; los cartones se generan por partes en
+    transacciones separadas y `cards_generated` registra el avance para reanudar.
+    Todos los cartones del lote llevan metadata.transaction_id = transaction_id.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_RUNNING, 'En proceso'),
+        (STATUS_COMPLETED, 'Completado'),
+        (STATUS_FAILED, 'Fallido'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='card_generation_jobs')
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, related_name='card_generation_jobs')
+    quantity = models.PositiveIntegerField()
+    cards_generated = models.PositiveIntegerField(default=0)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True, default='')
+    # Crece cada vez que un worker toma el trabajo; solo el worker del último intento registra avance
+    attempt = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.cards_generated}/{self.quantity} ({self.status})"
+
+    @property
+    def progress(self):
+        return round(self.cards_generated / self.quantity * 100, 1) if self.quantity else 100.0
+
+
+class IdempotencyKey(models.Model):
+    """
+    Resultado de una petición con cabecera Idempotency-Key (ver bingo.idempotency).
+    Los reintentos con la misma clave reciben la respuesta guardada en lugar de repetir
+    el cobro o la emisión de cartones.
+    """
+    STATUS_IN_PROGRESS = 'in_progress'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = (
+        (STATUS_IN_PROGRESS, 'En proceso'),
+        (STATUS_COMPLETED, 'Completado'),
+    )
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # sha256 del método, la ruta y el cuerpo de la petición original
+    request_fingerprint = models.CharField(max_length=64)
+    status = models.CharField(
+        max_length=12, choices=STATUS_CHOICES, default=STATUS_IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    # Lease de la petición en curso: vencido, otra petición con la clave la reemplaza
+    # (el proceso que la atendía murió sin completarla ni liberarla)
+    in_progress_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['user', 'key']
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key} ({self.status})"
+
+
+class EmailDelivery(models.Model):
+    """
+    Email de cartones en la bandeja de salida (ver bingo.email_outbox). La petición solo
+    guarda la fila; un worker renderiza el PDF y lo envía después, reintentando con
+    espera creciente (`next_attempt_at`) hasta EMAIL_OUTBOX_MAX_ATTEMPTS intentos.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_SENDING, 'Enviando'),
+        (STATUS_SENT, 'Enviado'),
+        (STATUS_FAILED, 'Fallido'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='email_deliveries')
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, related_name='email_deliveries')
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    message = models.TextField(blank=True, default='')
+    # Cartones tal como llegaron en la petición (formato de payload_records)
+    cards = models.JSONField(default=list)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient}: {len(self.cards)} cartones ({self.status})"
+
+
+class EventStats(models.Model):
+    """
+    Totales de un evento mantenidos de forma incremental (ver bingo.event_stats) con
+    expresiones F en la misma transacción que la compra, la llamada o el reclamo que
+    los cambia. El comando reconcile_event_stats los reconstruye desde las tablas base.
+    """
+    event = models.OneToOneField(
+        Event, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    # Suma de CardPurchase.cards_owned
+    cards_sold = models.PositiveIntegerField(default=0)
+    # Suma de CardBatch.price_paid
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    winners = models.PositiveIntegerField(default=0)
+    numbers_called = models.PositiveSmallIntegerField(default=0)
+    # Jugadores con CardPurchase en el evento
+    unique_players = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.event_id}: {self.cards_sold} cartones, {self.winners} ganadores"
+
+
+class EventArchive(models.Model):
+    """
+    Resumen compacto de un evento terminado cuyos cartones, números llamados y compras
+    se movieron de las tablas activas a archivos JSONL comprimidos (ver
+    bingo.event_archive). Conserva la secuencia de llamadas, los ganadores y los totales
+    para poder consultarlos sin las filas originales.
+    """
+    STATUS_ARCHIVING = 'archiving'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = (
+        (STATUS_ARCHIVING, 'Archivando'),
+        (STATUS_COMPLETED, 'Archivado'),
+    )
+
+    event = models.OneToOneField(
+        Event, on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_ARCHIVING)
+    # Valores de los números en orden de llamada
+    draw_sequence = models.JSONField(default=list)
+    # Reclamos adjudicados (WinClaim) en orden de rank, con el correlativo del cartón
+    winners = models.JSONField(default=list)
+    # Totales de EventStats al archivar
+    stats = models.JSONField(default=dict)
+    # Directorio con cards.jsonl.gz, numbers.jsonl.gz y purchases.jsonl.gz
+    location = models.CharField(max_length=500)
+    cards_archived = models.PositiveIntegerField(default=0)
+    numbers_archived = models.PositiveIntegerField(default=0)
+    purchases_archived = models.PositiveIntegerField(default=0)
+    # Cartones del pool que nunca se vendieron: se borran sin archivar
+    pool_cards_deleted = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    archived_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.event_id}: {self.cards_archived} cartones archivados ({self.status})"
+
+
 class SystemConfig(models.Model):
     """System configuration settings"""
     card_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.20,
@@ -0,0 +1,301 @@
+"""
+PDFs de cartones ya renderizados, direccionados por contenido.
+
+La clave de un PDF es el sha256 de todo lo que se imprime (ids, correlativos y números de
+los cartones, evento, renderer y versión del layout), así que una re-descarga de la misma
+transacción se sirve del almacén sin volver a renderizar y cualquier cambio en los
+cartones produce otra clave. Las respuestas llevan ETag, Last-Modified y soportan Range.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+from django.utils.module_loading import import_string
+
+from core.streaming import async_chunks, is_asgi_request, streaming_content
+
+from .card_pdf import PDF_LAYOUT_VERSION, RENDERER_PLATYPUS, card_records, write_pdf
+from .models import BingoCard, CardBatch
+
+logger = logging.getLogger(__name__)
+
+# PDF guardado: `modified` es el timestamp en que se renderizó; `file` es el archivo ya
+# abierto (ver FileSystemArtifactStore.open), que sigue legible aunque evict() lo borre
+Artifact = namedtuple('Artifact', ['digest', 'path', 'size', 'modified', 'file'], defaults=[None])
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def artifact_digest(records, event, renderer):
+    """sha256 del contenido impreso; no incluye la fecha de generación del pie de página"""
+    digest = hashlib.sha256(json.dumps(
+        [PDF_LAYOUT_VERSION, renderer, str(event.id), event.name]).encode())
+    for record in records:
+        digest.update(f"\n{record.id}|{record.correlative_id}|{','.join(map(str, record.grid))}".encode())
+    return digest.hexdigest()
+
+
+class FileSystemArtifactStore:
+    """
+    Almacén en un directorio local con tope de tamaño. Cada lectura marca el atime del
+    archivo y, al superar `max_bytes`, se borran primero los menos usados (LRU).
+    El tamaño del directorio se lleva en un total acumulado, así que solo se recorre
+    cuando el total supera el tope; el recorrido corrige además lo que hayan guardado
+    o borrado otros procesos.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or settings.CARD_PDF_ARTIFACT_DIR
+        self.max_bytes = settings.CARD_PDF_ARTIFACT_MAX_BYTES if max_bytes is None else max_bytes
+        self._evict_lock = threading.Lock()
+        # Bytes en el directorio; None hasta el primer recorrido
+        self._total = None
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], f"{digest}.pdf")
+
+    def get(self, digest):
+        """Artifact guardado con esa clave, o None"""
+        path = self._path(digest)
+        try:
+            stat = os.stat(path)
+            # atime = último uso (para el LRU); mtime = momento del render (Last-Modified)
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            return None
+        return Artifact(digest, path, stat.st_size, stat.st_mtime)
+
+    def open(self, digest):
+        """
+        Artifact con su archivo abierto para leerlo, o None. Quien lo recibe cierra
+        `artifact.file`; un evict() posterior ya no puede quitárselo.
+        """
+        path = self._path(digest)
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        stat = os.fstat(file.fileno())
+        try:
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            pass
+        return Artifact(digest, path, stat.st_size, stat.st_mtime, file)
+
+    def save(self, digest, write):
+        """
+        Guarda el PDF que `write(file)` escribe y lo devuelve abierto (ver open). Se
+        escribe en un temporal del mismo directorio y se renombra, así que nadie lee un
+        PDF a medias, y se abre antes de aplicar el tope de tamaño.
+        """
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                write(output)
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+        artifact = self.open(digest)
+        with self._evict_lock:
+            if self._total is not None:
+                self._total += artifact.size
+        self.evict()
+        return artifact
+
+    def evict(self):
+        """
+        Borra los PDFs menos usados hasta quedar bajo `max_bytes`; devuelve cuántos borró.
+        Sin recorrer el directorio mientras el total acumulado no supere el tope.
+        """
+        with self._evict_lock:
+            if self._total is not None and self._total <= self.max_bytes:
+                return 0
+
+            files = []
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    if not name.endswith('.pdf'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_atime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self._total = total
+            return removed
+
+
+_store = None
+
+
+def get_artifact_store():
+    """Almacén configurado en settings.CARD_PDF_ARTIFACT_STORE (ruta a la clase)"""
+    global _store
+    if _store is None:
+        _store = import_string(settings.CARD_PDF_ARTIFACT_STORE)()
+    return _store
+
+
+def cached_pdf(records, event, renderer=RENDERER_PLATYPUS):
+    """
+    Artifact del PDF de esos cartones, con el archivo abierto (quien lo recibe lo cierra);
+    se renderiza y guarda solo la primera vez
+    """
+    store = get_artifact_store()
+    digest = artifact_digest(records, event, renderer)
+    artifact = store.open(digest)
+    if artifact is None:
+        artifact = store.save(digest, lambda output: write_pdf(records, event, output, renderer))
+    return artifact
+
+
+def transaction_batch(user_id, transaction_id):
+    """CardBatch de la transacción del vendedor con su evento, o None"""
+    try:
+        return CardBatch.objects.select_related('event').get(id=transaction_id, seller_id=user_id)
+    except (CardBatch.DoesNotExist, ValidationError):
+        return None
+
+
+def transaction_cards(batch):
+    """Cartones del lote, en el orden en que se imprimen"""
+    return BingoCard.objects.filter(batch=batch).order_by('created_at')
+
+
+def warm_transaction_pdf(user_id, transaction_id, renderer=RENDERER_PLATYPUS):
+    """Renderiza y guarda el PDF de la transacción para que la primera descarga ya lo encuentre"""
+    batch = transaction_batch(user_id, transaction_id)
+    if batch is None:
+        return None
+    artifact = cached_pdf(card_records(transaction_cards(batch)), batch.event, renderer)
+    artifact.file.close()
+    return artifact
+
+
+def warm_transaction_pdf_async(user_id, transaction_id):
+    """warm_transaction_pdf en un hilo aparte, sin demorar la respuesta que lo dispara"""
+    if not settings.CARD_PDF_ARTIFACT_WARM:
+        return None
+
+    def target():
+        try:
+            warm_transaction_pdf(user_id, transaction_id)
+        except Exception as e:
+            logger.warning(f"No se pudo precalentar el PDF de la transacción {transaction_id}: {str(e)}")
+        finally:
+            close_old_connections()
+
+    thread = threading.Thread(target=target, name=f"pdf-warm-{transaction_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _parse_range(header, size):
+    """(inicio, fin) inclusivos de un único rango 'bytes=', None si no aplica, False si no es satisfacible"""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Varios rangos o unidades desconocidas: se sirve el archivo completo
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _file_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def artifact_response(request, artifact, filename):
+    """
+    Respuesta para descargar el artifact: 304/412 según If-None-Match/If-Modified-Since,
+    206 con Content-Range para un Range de un solo tramo, o el archivo completo.
+    Se lee de `artifact.file`, que la respuesta cierra.
+    """
+    etag = f'"{artifact.digest}"'
+    last_modified = int(artifact.modified)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+    }
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        artifact.file.close()
+        for header, value in headers.items():
+            conditional[header] = value
+        return conditional
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and request.headers.get('If-Range', etag) in (etag, headers['Last-Modified']):
+        byte_range = _parse_range(range_header, artifact.size)
+
+    if byte_range is False:
+        artifact.file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{artifact.size}"
+    elif byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            streaming_content(request, _file_range(artifact.file, start, end - start + 1)),
+            status=206, content_type='application/pdf')
+        response['Content-Range'] = f"bytes {start}-{end}/{artifact.size}"
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    else:
+        response = FileResponse(artifact.file, as_attachment=True,
+                                filename=filename, content_type='application/pdf')
+        if is_asgi_request(request):
+            # FileResponse keeps the headers and closes the file; only the blocks are read asynchronously
+            response.streaming_content = async_chunks(response.streaming_content)
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
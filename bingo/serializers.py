@@ -1,7 +1,11 @@
 from rest_framework import serializers
 
+from core.serializers import FieldProjectionMixin
 from users.serializers import UserSerializer
-from .models import DepositRequest, Event, BingoCard, Number, PaymentMethod, RatesConfig, SystemConfig, TestCoinBalance, CardPurchase, WinningPattern
+from django.conf import settings
+from django.urls import reverse
+
+from .models import DepositRequest, Event, BingoCard, Number, PaymentMethod, RatesConfig, SystemConfig, TestCoinBalance, CardPurchase, WinningPattern, CardGenerationJob, EmailDelivery, EventArchive
 from decimal import Decimal
 
 
@@ -11,7 +15,7 @@ class EventSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class BingoCardSerializer(serializers.ModelSerializer):
+class BingoCardSerializer(FieldProjectionMixin, serializers.ModelSerializer):
     class Meta:
         model = BingoCard
         fields = ['id', 'event', 'numbers', 'is_winner',
@@ -20,7 +24,7 @@ class BingoCardSerializer(serializers.ModelSerializer):
         read_only_fields = ['hash']
 
 
-class NumberSerializer(serializers.ModelSerializer):
+class NumberSerializer(FieldProjectionMixin, serializers.ModelSerializer):
     class Meta:
         model = Number
         fields = '__all__'
@@ -47,6 +51,30 @@ class CardPurchaseRequestSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=1, max_value=20)
 
 
+class CardGenerationJobRequestSerializer(serializers.Serializer):
+    event_id = serializers.UUIDField()
+    quantity = serializers.IntegerField(
+        min_value=1, max_value=settings.CARD_JOB_MAX_QUANTITY)
+
+
+class CardGenerationJobSerializer(serializers.ModelSerializer):
+    progress = serializers.FloatField(read_only=True)
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CardGenerationJob
+        fields = ['id', 'event', 'quantity', 'cards_generated', 'progress', 'status',
+                  'transaction_id', 'unit_price', 'error', 'download_url',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        # Los cartones del lote se descargan como cualquier transacción del vendedor
+        if obj.status != CardGenerationJob.STATUS_COMPLETED:
+            return None
+        return f"{reverse('bingocard-download-transaction-cards')}?transaction_id={obj.transaction_id}"
+
+
 class CardPurchaseResponseSerializer(serializers.Serializer):
     success = serializers.BooleanField()
     new_balance = serializers.IntegerField()
@@ -77,9 +105,12 @@ class BingoClaimResponseSerializer(serializers.Serializer):
     event_id = serializers.UUIDField(required=False)
     called_numbers = serializers.ListField(
         child=serializers.IntegerField(), required=False)
+    win_sequence = serializers.IntegerField(required=False)
+    rank = serializers.IntegerField(required=False)
+    duplicate = serializers.BooleanField(required=False)
 
 
-class WinningPatternSerializer(serializers.ModelSerializer):
+class WinningPatternSerializer(FieldProjectionMixin, serializers.ModelSerializer):
     class Meta:
         model = WinningPattern
         fields = ['id', 'name', 'display_name', 'positions',
@@ -110,7 +141,7 @@ class WinningPatternCreateSerializer(WinningPatternSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class DepositRequestSerializer(serializers.ModelSerializer):
+class DepositRequestSerializer(FieldProjectionMixin, serializers.ModelSerializer):
     status_display = serializers.CharField(
         source='get_status_display', read_only=True)
     user = UserSerializer(read_only=True)  # Include the full user data
@@ -164,6 +195,27 @@ class EmailCardsSerializer(serializers.Serializer):
         required=False, default="Aquí están los cartones de bingo generados para el evento.")
 
 
+class EmailDeliverySerializer(serializers.ModelSerializer):
+    cards_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = EmailDelivery
+        fields = ['id', 'event', 'recipient', 'subject', 'cards_count', 'status', 'attempts',
+                  'next_attempt_at', 'last_error', 'created_at', 'sent_at']
+        read_only_fields = fields
+
+    def get_cards_count(self, obj):
+        return len(obj.cards)
+
+
+class EventArchiveSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EventArchive
+        fields = ['event', 'status', 'draw_sequence', 'winners', 'stats', 'cards_archived',
+                  'numbers_archived', 'purchases_archived', 'pool_cards_deleted', 'started_at', 'archived_at']
+        read_only_fields = fields
+
+
 class PaymentMethodSerializer(serializers.ModelSerializer):
     class Meta:
         model = PaymentMethod
@@ -1,3 +1,1292 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.utils import timezone
+from core.db_pool import ConnectionPool, configure_pools, pool_stats
+from core.db_router import PIN_COOKIE, ReplicaPinningMiddleware, ReplicaRouter, user_pinned_until
+from core.query_budget import QueryBudgetExceeded, query_budget
+
+from .card_export import cards_to_export, iter_columnar_groups, iter_export
+from .card_derivation import derive_card_numbers, derive_grid
+from .card_generation import generate_grids
+from .card_issuing import (
+    build_cards, build_derived_cards, grid_to_numbers, insert_cards, issue_cards, new_batch_metadata,
+    purchase_cards,
+)
+from .card_pdf import PdfReader, PdfWriter, card_records, draw_canvas_card, iter_pdf, write_pdf
+from .pdf_artifacts import FileSystemArtifactStore
+from .card_jobs import claim_next_job, process_job, submit_job
+from .event_archive import archivable_events, archive_event, iter_archived
+from .event_stats import add_stats, reconcile
+from .idempotency import _begin, _renew
+from .email_outbox import claim_deliveries, queue_cards_email, run_worker as run_outbox_worker
+from .card_pool import pool_size, refill_pool
+from .chat import ChatBatcher, MemoryChatBackend
+from .consumers import BingoConsumer
+from .locks import LockLost, LockTimeout, MemoryLockManager
+from .claims import ClaimQueue, adjudicate_claims, called_bitmap, find_win_sequence, make_claim
+from .models import (
+    BingoCard, CardBatch, CardGenerationJob, CardPurchase, CorrelativeSequence, DepositRequest, EmailDelivery, Event,
+    EventArchive, EventStats, IdempotencyKey, Number, PaymentMethod, TestCoinBalance, WinClaim,
+)
+from .win_patterns import card_fingerprint, parse_card_numbers
+
+User = get_user_model()
+
+
+class ChatHistoryTests(SimpleTestCase):
+    def setUp(self):
+        self.chat = MemoryChatBackend(history_size=5, rate_limit=2, rate_window=60)
+
+    def test_history_keeps_last_messages(self):
+        """Test that the ring buffer only keeps the last N messages"""
+        for i in range(8):
+            async_to_sync(self.chat.append)('event', {'message': f'msg {i}'})
+
+        messages = async_to_sync(self.chat.history)('event', limit=50)
+        self.assertEqual([m['seq'] for m in messages], [4, 5, 6, 7, 8])
+
+    def test_history_pagination(self):
+        """Test paginating backwards with the before cursor"""
+        for i in range(5):
+            async_to_sync(self.chat.append)('event', {'message': f'msg {i}'})
+
+        page = async_to_sync(self.chat.history)('event', limit=2)
+        self.assertEqual([m['seq'] for m in page], [4, 5])
+        older = async_to_sync(self.chat.history)('event', before=4, limit=2)
+        self.assertEqual([m['seq'] for m in older], [2, 3])
+
+    def test_rate_limit_per_user(self):
+        """Test that each user is limited independently"""
+        allow = async_to_sync(self.chat.allow_message)
+        self.assertTrue(allow('event', 1))
+        self.assertTrue(allow('event', 1))
+        self.assertFalse(allow('event', 1))
+        self.assertTrue(allow('event', 2))
+
+    def test_message_added_during_send_is_flushed(self):
+        """Test that a message added while a batch is being sent goes out in the next batch"""
+        sent = []
+
+        async def scenario():
+            class SlowLayer:
+                async def group_send(self, group, message):
+                    sent.append([m['message'] for m in message['messages']])
+                    if len(sent) == 1:
+                        batcher.add({'message': 'late'})
+                        await asyncio.sleep(0.01)
+
+            batcher = ChatBatcher(SlowLayer(), 'chat', flush_interval=0.01)
+            batcher.add({'message': 'first'})
+            await asyncio.sleep(0.1)
+
+        async_to_sync(scenario)()
+        self.assertEqual(sent, [['first'], ['late']])
+
+
+def auth_headers(user):
+    """Bearer token headers for clients that cannot force_authenticate (AsyncClient)"""
+    return {'Authorization': f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+
+def make_card_numbers(grid):
+    """Build the stored ["B1", ...] format from a row-major list of 25 integers"""
+    return ["N0" if value == 0 else f"{'BINGO'[pos % 5]}{value}"
+            for pos, value in enumerate(grid)]
+
+
+# Row-major grid; the first row is 1, 16, 31, 46, 61
+SAMPLE_GRID = [
+    1, 16, 31, 46, 61,
+    2, 17, 32, 47, 62,
+    3, 18, 0, 48, 63,
+    4, 19, 34, 49, 64,
+    5, 20, 35, 50, 65,
+]
+
+
+def grid_batches(grids):
+    """generate_grids replacement that hands out `grids` in order, as many as requested"""
+    pending = list(grids)
+    return lambda count: [pending.pop(0) for _ in range(count)]
+
+
+class ClaimAdjudicationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='player@example.com', password='pass1234')
+        self.event = Event.objects.create(
+            name='Claims Event', prize=100, start=timezone.now(), end=timezone.now())
+
+    def _card(self, grid, suffix):
+        return BingoCard.objects.create(
+            event=self.event, user=self.user, numbers=make_card_numbers(grid), hash=f"hash-{suffix}")
+
+    def _call(self, *values):
+        for value in values:
+            Number.objects.create(event=self.event, value=value)
+
+    def test_find_win_sequence_uses_last_needed_call(self):
+        """Test that the win sequence is the call that completed the pattern"""
+        call_order = [99, 1, 16, 31, 46, 61]
+        sequence = {value: i for i, value in enumerate(call_order, start=1)}
+        win = find_win_sequence(
+            SAMPLE_GRID, {'row_1': [0, 1, 2, 3, 4]}, called_bitmap(call_order), sequence)
+        self.assertEqual(win, ('row_1', [0, 1, 2, 3, 4], 6))
+
+    def test_patterns_outside_the_grid_or_without_numbers_never_win(self):
+        """Test that out-of-range positions do not match and a free-cell-only pattern is skipped"""
+        call_order = [1, 16, 31, 46, 61]
+        sequence = {value: i for i, value in enumerate(call_order, start=1)}
+        patterns = {'outside': [25, 30], 'partly_outside': [0, 1, 2, 3, 4, 25], 'free': [12]}
+        self.assertIsNone(find_win_sequence(SAMPLE_GRID, patterns, called_bitmap(call_order), sequence))
+
+    def test_duplicate_claims_are_adjudicated_once(self):
+        """Test that repeated claims for the same card produce a single WinClaim"""
+        card = self._card(SAMPLE_GRID, 'a')
+        self._call(1, 16, 31, 46, 61)
+
+        claims = [make_claim(card.id, self.user.id), make_claim(card.id, self.user.id)]
+        results = adjudicate_claims(self.event.id, claims)
+        self.assertTrue(all(r['valid'] for r in results))
+        self.assertEqual(WinClaim.objects.filter(card=card).count(), 1)
+
+        again = adjudicate_claims(self.event.id, [make_claim(card.id, self.user.id)])[0]
+        self.assertTrue(again['duplicate'])
+        card.refresh_from_db()
+        self.assertTrue(card.is_winner)
+
+    def test_earlier_completion_ranks_first(self):
+        """Test that ties are resolved by the call at which each card completed"""
+        late = self._card(SAMPLE_GRID, 'late')
+        early_grid = list(SAMPLE_GRID)
+        early_grid[4] = 66  # row 1 no longer needs 61
+        early_grid[9] = 67
+        early = self._card(early_grid, 'early')
+        self._call(1, 16, 31, 46, 66, 61)
+
+        results = adjudicate_claims(self.event.id, [
+            make_claim(late.id, self.user.id),
+            make_claim(early.id, self.user.id),
+        ])
+        self.assertEqual([r['win_sequence'] for r in results], [6, 5])
+        self.assertEqual([r['rank'] for r in results], [2, 1])
+
+    def test_spanish_and_unknown_pattern_names(self):
+        """Test that Spanish display names map to their pattern and unknown names never win"""
+        card = self._card(SAMPLE_GRID, 'names')
+        self._call(1, 16, 31, 46, 61)
+
+        unknown = adjudicate_claims(self.event.id, [make_claim(card.id, self.user.id, 'fila magica')])[0]
+        self.assertFalse(unknown['valid'])
+        column = adjudicate_claims(self.event.id, [make_claim(card.id, self.user.id, 'Linea vertical 1')])[0]
+        self.assertFalse(column['valid'])
+        row = adjudicate_claims(self.event.id, [make_claim(card.id, self.user.id, 'Linea horizontal 1')])[0]
+        self.assertTrue(row['valid'])
+        self.assertEqual(row['win_details']['pattern_name'], 'row_1')
+
+    def test_incomplete_card_is_rejected(self):
+        """Test that a card without a completed pattern is not marked as winner"""
+        card = self._card(SAMPLE_GRID, 'b')
+        self._call(1, 16)
+
+        result = adjudicate_claims(self.event.id, [make_claim(card.id, self.user.id)])[0]
+        self.assertFalse(result['valid'])
+        self.assertFalse(WinClaim.objects.exists())
+
+
+class ClaimQueueTests(SimpleTestCase):
+    def test_claim_submitted_during_adjudication_is_resolved(self):
+        """Test that a claim arriving while a batch is adjudicated gets its own batch"""
+        batches = []
+
+        def slow_adjudicate(event_id, claims):
+            batches.append([claim.card_id for claim in claims])
+            time.sleep(0.05)
+            return [{'card_id': claim.card_id} for claim in claims]
+
+        async def scenario():
+            queue = ClaimQueue('event', batch_window=0.01)
+            first = asyncio.ensure_future(queue.submit(make_claim('card-1', 1)))
+            await asyncio.sleep(0.03)  # first batch is being adjudicated
+            second = await asyncio.wait_for(queue.submit(make_claim('card-2', 2)), timeout=2)
+            return await first, second
+
+        with mock.patch('bingo.claims.adjudicate_claims', slow_adjudicate):
+            first, second = async_to_sync(scenario)()
+        self.assertEqual((first['card_id'], second['card_id']), ('card-1', 'card-2'))
+        self.assertEqual(batches, [['card-1'], ['card-2']])
+
+
+class CorrelativeSequenceTests(TestCase):
+    def setUp(self):
+        self.event = Event.objects.create(
+            name='Sequence Event', prize=100, start=timezone.now(), end=timezone.now())
+
+    def test_reserve_contiguous_ranges(self):
+        """Test that consecutive reservations never overlap"""
+        first = BingoCard.reserve_correlative_ids(self.event, 3)
+        second = BingoCard.reserve_correlative_ids(self.event, 2)
+        prefix = BingoCard.correlative_prefix(self.event)
+        self.assertEqual(first, [f"{prefix}-0001", f"{prefix}-0002", f"{prefix}-0003"])
+        self.assertEqual(second, [f"{prefix}-0004", f"{prefix}-0005"])
+
+    def test_sequence_continues_from_existing_cards(self):
+        """Test that a new sequence starts after correlatives issued before it existed"""
+        prefix = BingoCard.correlative_prefix(self.event)
+        BingoCard.objects.create(
+            event=self.event, numbers=[], hash='legacy', correlative_id=f"{prefix}-0041")
+
+        self.assertEqual(BingoCard.generate_correlative_id(self.event), f"{prefix}-0042")
+
+
+class CardPurchaseTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', password='pass1234')
+        self.event = Event.objects.create(
+            name='Purchase Event', prize=100, start=timezone.now(), end=timezone.now())
+        TestCoinBalance.objects.create(user=self.user, balance=10)
+
+    def test_purchase_issues_cards_and_charges(self):
+        """Test that a batch purchase stores every card with its correlative and charges once"""
+        metadata = new_batch_metadata(3)
+        success, result = purchase_cards(self.user, self.event, 3, 2, metadata)
+        self.assertTrue(success)
+        self.assertEqual(result['balance'].balance, 4)
+        self.assertEqual(result['card_purchase'].cards_owned, 3)
+
+        cards = BingoCard.objects.filter(event=self.event, user=self.user)
+        self.assertEqual(cards.count(), 3)
+        self.assertEqual(len({card.correlative_id for card in cards}), 3)
+        self.assertTrue(all(card.metadata['transaction_id'] == metadata['transaction_id'] for card in cards))
+        batch = CardBatch.objects.get(id=metadata['transaction_id'])
+        self.assertEqual((batch.seller, batch.size, batch.price_paid), (self.user, 3, 6))
+        self.assertEqual(batch.cards.count(), 3)
+
+    def test_insufficient_balance_issues_nothing(self):
+        """Test that a rejected purchase leaves no cards and no purchase record"""
+        success, message = purchase_cards(self.user, self.event, 6, 2)
+        self.assertFalse(success)
+        self.assertIn('saldo', message)
+        self.assertFalse(BingoCard.objects.exists())
+        self.assertFalse(CardPurchase.objects.exists())
+
+
+    def test_stale_lock_holder_cannot_charge(self):
+        """Test that a purchase under an expired lease is rejected once a newer holder wrote the balance"""
+        locks = MemoryLockManager(default_ttl=30)
+        stale = locks.acquire('balance:buyer', ttl=0.01)
+        time.sleep(0.02)
+        current = locks.acquire('balance:buyer')
+
+        self.assertTrue(purchase_cards(self.user, self.event, 1, 2, lock=current)[0])
+        with self.assertRaises(LockLost):
+            purchase_cards(self.user, self.event, 1, 2, lock=stale)
+        balance = TestCoinBalance.objects.get(user=self.user)
+        self.assertEqual((balance.balance, balance.fence), (8, current.token))
+        self.assertEqual(BingoCard.objects.filter(user=self.user).count(), 1)
+
+
+class CardFingerprintTests(TestCase):
+    def setUp(self):
+        self.event = Event.objects.create(
+            name='Fingerprint Event', prize=100, start=timezone.now(), end=timezone.now())
+
+    def test_fingerprint_ignores_stored_format(self):
+        """Test that the same grid stored as strings or as BINGO columns has one fingerprint"""
+        columns = {letter: SAMPLE_GRID[col::5] for col, letter in enumerate("BINGO")}
+        self.assertEqual(card_fingerprint(make_card_numbers(SAMPLE_GRID)), card_fingerprint(columns))
+        self.assertEqual(grid_to_numbers(SAMPLE_GRID), make_card_numbers(SAMPLE_GRID))
+
+    def test_generator_skips_issued_and_repeated_grids(self):
+        """Test that grids already in the event or repeated in the batch are regenerated"""
+        BingoCard.objects.create(event=self.event, numbers=make_card_numbers(SAMPLE_GRID), hash='issued')
+        other_grid = list(SAMPLE_GRID)
+        other_grid[0] = 6
+
+        grids = [SAMPLE_GRID, other_grid, other_grid, SAMPLE_GRID, list(reversed(SAMPLE_GRID))]
+        with mock.patch('bingo.card_issuing.generate_grids', side_effect=grid_batches(grids)):
+            cards = build_cards(self.event, None, 2)
+
+        fingerprints = [card.fingerprint for card in cards]
+        self.assertEqual(len(set(fingerprints)), 2)
+        self.assertNotIn(card_fingerprint(make_card_numbers(SAMPLE_GRID)), fingerprints)
+
+
+    def test_bulk_generated_grids_are_valid(self):
+        """Test that every bulk grid has 5 distinct numbers per column in range and the free space"""
+        batch = generate_grids(500)
+        self.assertEqual(len(batch), 500)
+        for grid in batch:
+            self.assertEqual(grid[12], 0)
+            for col in range(5):
+                values = [v for v in grid[col::5] if v]
+                self.assertEqual(len(set(values)), 4 if col == 2 else 5)
+                self.assertTrue(all(col * 15 < v <= col * 15 + 15 for v in values))
+        self.assertEqual(next(batch.numbers()), grid_to_numbers(next(iter(batch))))
+
+
+class CardPoolTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='pool@example.com', password='pass1234')
+        self.event = Event.objects.create(
+            name='Pool Event', prize=100, start=timezone.now(), end=timezone.now())
+        TestCoinBalance.objects.create(user=self.user, balance=100)
+
+    def test_refill_respects_watermarks(self):
+        """Test that the pool is topped up to the high watermark only below the low one"""
+        self.assertEqual(refill_pool(self.event, low_watermark=2, high_watermark=5), 5)
+        self.assertEqual(refill_pool(self.event, low_watermark=2, high_watermark=5), 0)
+        self.assertEqual(pool_size(self.event), 5)
+
+    def test_purchase_claims_pool_cards_first(self):
+        """Test that purchases take pooled cards and generate only the shortfall"""
+        refill_pool(self.event, low_watermark=1, high_watermark=3)
+        pooled = set(BingoCard.objects.filter(event=self.event).values_list('id', flat=True))
+
+        metadata = new_batch_metadata(4)
+        success, result = purchase_cards(self.user, self.event, 4, 1, metadata)
+        self.assertTrue(success)
+        self.assertEqual(pool_size(self.event), 0)
+        self.assertEqual(len(pooled & {card.id for card in result['cards']}), 3)
+        self.assertEqual(BingoCard.objects.filter(user=self.user, batch_id=metadata['transaction_id']).count(), 4)
+
+    def test_correlatives_reserved_before_purchase_transaction(self):
+        """Test that the shortfall correlatives are reserved outside the purchase transaction"""
+        refill_pool(self.event, low_watermark=1, high_watermark=2)
+        depths = []
+        reserve = CorrelativeSequence.reserve.__func__
+
+        def recording_reserve(cls, *args, **kwargs):
+            depths.append(len(connection.atomic_blocks))
+            return reserve(cls, *args, **kwargs)
+
+        outer = len(connection.atomic_blocks)
+        with mock.patch.object(CorrelativeSequence, 'reserve', classmethod(recording_reserve)):
+            success, result = purchase_cards(self.user, self.event, 5, 1)
+        self.assertTrue(success)
+        self.assertEqual(depths, [outer])
+        self.assertEqual(len({card.correlative_id for card in result['cards']}), 5)
+
+    def test_rejected_purchase_returns_cards_to_pool(self):
+        """Test that cards claimed by a purchase without balance go back to the pool"""
+        refill_pool(self.event, low_watermark=1, high_watermark=3)
+
+        # Balance spent by a concurrent request after the pre-check
+        with mock.patch('bingo.models.TestCoinBalance.deduct_coins', return_value=(False, 'sin saldo')):
+            success, message = purchase_cards(self.user, self.event, 2, 1)
+        self.assertFalse(success)
+        self.assertEqual(pool_size(self.event), 3)
+        self.assertFalse(BingoCard.objects.filter(user=self.user).exists())
+
+
+class LockManagerTests(SimpleTestCase):
+    def setUp(self):
+        self.locks = MemoryLockManager(default_ttl=30, poll_interval=0.01)
+
+    def test_fencing_tokens_increase(self):
+        """Test that each acquisition of the same lock gets a larger token"""
+        first = self.locks.acquire('balance:1')
+        first.release()
+        second = self.locks.acquire('balance:1')
+        self.assertGreater(second.token, first.token)
+        self.assertTrue(second.is_held())
+
+    def test_blocking_acquire_times_out(self):
+        """Test that a held lock makes other callers wait and then fail"""
+        self.locks.acquire('balance:1')
+        with self.assertRaises(LockTimeout):
+            self.locks.acquire('balance:1', timeout=0.05)
+        metrics = self.locks.metrics.snapshot()
+        self.assertEqual(metrics['timeouts'], 1)
+        self.assertGreaterEqual(metrics['max_wait_ms'], 50)
+
+    def test_expired_lease_is_detected(self):
+        """Test that a holder whose lease expired cannot renew or pass the fencing check"""
+        stale = self.locks.acquire('balance:1', ttl=0.01)
+        time.sleep(0.02)
+        current = self.locks.acquire('balance:1')
+
+        self.assertFalse(stale.renew())
+        with self.assertRaises(LockLost):
+            stale.ensure_held()
+        self.assertFalse(stale.release())
+        self.assertTrue(current.is_held())
+
+
+class CardGenerationJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='seller@example.com', password='pass1234')
+        self.event = Event.objects.create(
+            name='Job Event', prize=100, start=timezone.now(), end=timezone.now())
+        TestCoinBalance.objects.create(user=self.user, balance=100)
+
+    @mock.patch('bingo.card_jobs.publish_progress')
+    def test_job_generates_cards_in_chunks(self, publish_progress):
+        """Test that a queued job is charged upfront and generated chunk by chunk"""
+        success, result = submit_job(self.user, self.event, 7, 1)
+        self.assertTrue(success)
+        self.assertEqual(result['balance'].balance, 93)
+        self.assertFalse(BingoCard.objects.exists())
+
+        with self.settings(CARD_JOB_CHUNK_SIZE=3):
+            process_job(claim_next_job())
+
+        job = CardGenerationJob.objects.get()
+        self.assertEqual((job.status, job.cards_generated), (CardGenerationJob.STATUS_COMPLETED, 7))
+        self.assertEqual(BingoCard.objects.filter(
+            metadata__transaction_id=str(job.transaction_id)).count(), 7)
+        self.assertEqual(CardPurchase.objects.get(user=self.user).cards_owned, 7)
+        # Start, one push per chunk (3 + 3 + 1) and completion
+        self.assertEqual(publish_progress.call_count, 5)
+        self.assertIsNone(claim_next_job())
+
+    @mock.patch('bingo.card_jobs.publish_progress')
+    def test_failed_job_refunds_missing_cards(self, publish_progress):
+        """Test that a failing job refunds only the cards it did not generate"""
+        submit_job(self.user, self.event, 5, 2)
+
+        with self.settings(CARD_JOB_CHUNK_SIZE=2), \
+                mock.patch('bingo.card_jobs.insert_cards', side_effect=[None, RuntimeError('boom')]):
+            process_job(claim_next_job())
+
+        job = CardGenerationJob.objects.get()
+        self.assertEqual((job.status, job.cards_generated), (CardGenerationJob.STATUS_FAILED, 2))
+        self.assertEqual(TestCoinBalance.objects.get(user=self.user).balance, 96)
+        # Revenue keeps only the generated cards
+        self.assertEqual(CardBatch.objects.get(id=job.transaction_id).price_paid, 4)
+        self.assertEqual(EventStats.objects.get(event=self.event).revenue, 4)
+        self.assertEqual(list(reconcile([self.event.id]))[0][1], [])
+
+
+    @mock.patch('bingo.card_jobs.publish_progress')
+    def test_failed_setup_refunds_the_job(self, publish_progress):
+        """Test that a job failing before its first chunk is refunded in full"""
+        submit_job(self.user, self.event, 3, 2)
+        with mock.patch('bingo.card_jobs.record_batch', side_effect=RuntimeError('boom')):
+            process_job(claim_next_job())
+
+        self.assertEqual(CardGenerationJob.objects.get().status, CardGenerationJob.STATUS_FAILED)
+        balance = TestCoinBalance.objects.get(user=self.user)
+        self.assertEqual(balance.balance, 100)
+        # The refund is written under the balance lock, with its token
+        self.assertGreater(balance.fence, 0)
+
+    @mock.patch('bingo.card_jobs.publish_progress')
+    def test_refund_is_fenced_by_the_balance_lock(self, publish_progress):
+        """Test that a refund is not written over a newer balance lock holder and the job is left to retry"""
+        submit_job(self.user, self.event, 3, 2)
+        TestCoinBalance.objects.filter(user=self.user).update(fence=10 ** 18)
+        with mock.patch('bingo.card_jobs.record_batch', side_effect=RuntimeError('boom')):
+            process_job(claim_next_job())
+
+        self.assertEqual(CardGenerationJob.objects.get().status, CardGenerationJob.STATUS_RUNNING)
+        self.assertEqual(TestCoinBalance.objects.get(user=self.user).balance, 94)
+
+    @mock.patch('bingo.card_jobs.publish_progress')
+    def test_reclaimed_job_is_not_processed_twice(self, publish_progress):
+        """Test that a worker whose job was claimed again by another one records nothing"""
+        submit_job(self.user, self.event, 4, 1)
+        stale = claim_next_job()
+        CardGenerationJob.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        current = claim_next_job()
+        self.assertEqual(current.attempt, stale.attempt + 1)
+
+        with self.settings(CARD_JOB_CHUNK_SIZE=2):
+            process_job(stale)
+            self.assertFalse(BingoCard.objects.exists())
+            process_job(current)
+
+        job = CardGenerationJob.objects.get()
+        self.assertEqual((job.status, job.cards_generated), (CardGenerationJob.STATUS_COMPLETED, 4))
+        self.assertEqual(BingoCard.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(CardPurchase.objects.get(user=self.user).cards_owned, 4)
+        self.assertEqual(TestCoinBalance.objects.get(user=self.user).balance, 96)
+
+class DerivedCardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='printer@example.com', password='pass1234')
+        self.event = Event.objects.create(
+            name='Print Event', prize=100, start=timezone.now(), end=timezone.now())
+
+    def test_derived_cards_store_only_the_index(self):
+        """Test that derived cards read back their numbers without storing them"""
+        cards = insert_cards(self.event, build_derived_cards(self.event, self.user, 3))
+        seed = Event.objects.get(pk=self.event.pk).card_seed
+
+        self.assertEqual(set(BingoCard.objects.filter(event=self.event).values_list('numbers', flat=True)), {None})
+        for card in BingoCard.objects.filter(event=self.event):
+            self.assertEqual(card.numbers, derive_card_numbers(seed, card.seed_index))
+            self.assertEqual(card.fingerprint, card_fingerprint(card.numbers))
+            self.assertEqual(card.numbers, cards[[c.pk for c in cards].index(card.pk)].numbers)
+        self.assertEqual(len({card_fingerprint(card.numbers) for card in cards}), 3)
+
+    def test_stored_grids_skip_derived_cards(self):
+        """Test that a generated grid matching a derived card of the event is regenerated"""
+        derived = insert_cards(self.event, build_derived_cards(self.event, None, 1))[0]
+        taken = list(derive_grid(self.event.card_seed, derived.seed_index))
+
+        with mock.patch('bingo.card_issuing.generate_grids', side_effect=grid_batches([taken, SAMPLE_GRID])):
+            cards = build_cards(self.event, None, 1)
+
+        self.assertEqual(cards[0].numbers, make_card_numbers(SAMPLE_GRID))
+
+    def test_derived_grid_issued_concurrently_is_replaced(self):
+        """Test that the unique fingerprint rejects a derived grid another issuance stored meanwhile"""
+        cards = build_derived_cards(self.event, self.user, 2)
+        taken = derive_card_numbers(self.event.card_seed, cards[0].seed_index)
+        BingoCard.objects.create(event=self.event, numbers=taken, hash='hash-concurrent')
+
+        with mock.patch('bingo.card_issuing.generate_grids', side_effect=grid_batches([SAMPLE_GRID])):
+            insert_cards(self.event, cards)
+
+        fingerprints = list(BingoCard.objects.filter(event=self.event).values_list('fingerprint', flat=True))
+        self.assertEqual(len(set(fingerprints)), 3)
+        self.assertEqual((cards[0].seed_index, cards[0].numbers), (None, make_card_numbers(SAMPLE_GRID)))
+        self.assertIsNotNone(cards[1].seed_index)
+
+    @mock.patch('bingo.card_jobs.publish_progress')
+    def test_large_jobs_use_derived_cards(self, publish_progress):
+        """Test that jobs above CARD_DERIVED_STORAGE_MIN_BATCH generate derived cards"""
+        TestCoinBalance.objects.create(user=self.user, balance=10)
+        submit_job(self.user, self.event, 4, 1)
+
+        with self.settings(CARD_DERIVED_STORAGE_MIN_BATCH=4, CARD_JOB_CHUNK_SIZE=3):
+            process_job(claim_next_job())
+
+        job = CardGenerationJob.objects.get()
+        cards = BingoCard.objects.filter(user=self.user, seed_index__isnull=False)
+        self.assertEqual(cards.filter(batch_id=job.transaction_id).count(), 4)
+        # The batch row holds the metadata, the cards do not repeat it
+        self.assertEqual(list(cards.values_list('metadata', flat=True)), [{}] * 4)
+
+
+class CardPdfTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='pdf@example.com', password='pass1234', is_seller=True)
+        self.event = Event.objects.create(
+            name='PDF Event', prize=100, start=timezone.now(), end=timezone.now())
+        self.metadata = new_batch_metadata(6)
+        self.cards = issue_cards(self.event, self.user, 5, self.metadata)
+        self.cards += insert_cards(self.event, build_derived_cards(self.event, self.user, 1, self.metadata))
+
+    def test_records_are_read_in_one_query(self):
+        """Test that stored and derived cards become PDF records with a single query"""
+        with self.assertNumQueries(1):
+            records = card_records(BingoCard.objects.filter(event=self.event).order_by('created_at'))
+        by_id = {record.id: record for record in records}
+        for card in self.cards:
+            record = by_id[str(card.id)]
+            self.assertEqual(record.correlative_id, card.correlative_id)
+            self.assertEqual(record.grid, parse_card_numbers(card.numbers))
+
+    def test_transaction_download_does_not_query_per_card(self):
+        """Test that the transaction PDF costs the same queries for any number of cards"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f"/api/cards/download_transaction_cards/?transaction_id={self.metadata['transaction_id']}"
+        with self.assertNumQueries(2):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        pdf = b''.join(response.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        # 6 cards, 4 per page
+        self.assertEqual(pdf.count(b'/Type /Page\n'), 2)
+
+    def test_my_transactions_is_one_query(self):
+        """Test that the seller's transactions are listed from CardBatch in a single query"""
+        issue_cards(self.event, self.user, 2, new_batch_metadata(2))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = client.get('/api/cards/my_transactions/')
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual({row['event_name'] for row in response.data}, {'PDF Event'})
+        self.assertEqual(response.data[1]['transaction_id'], self.metadata['transaction_id'])
+        self.assertEqual(response.data[1]['batch_size'], 6)
+
+    def test_canvas_renderer_is_selectable(self):
+        """Test that the direct-canvas layout is chosen with ?renderer= and unknown ones are rejected"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f"/api/cards/download_transaction_cards/?transaction_id={self.metadata['transaction_id']}"
+
+        with mock.patch('bingo.card_pdf.draw_canvas_card', wraps=draw_canvas_card) as draw_card:
+            response = client.get(f"{url}&renderer=canvas")
+            pdf = b''.join(response.streaming_content)
+        self.assertEqual(draw_card.call_count, 6)
+        self.assertEqual(pdf.count(b'/Type /Page\n'), 2)
+        self.assertEqual(client.get(f"{url}&renderer=svg").status_code, 400)
+
+    @skipUnless(PdfWriter, "pypdf is not installed")
+    def test_parallel_render_keeps_page_numbers(self):
+        """Test that ranges rendered in worker processes merge with continuous page numbers"""
+        records = card_records(BingoCard.objects.filter(event=self.event)) * 3
+        output = BytesIO()
+        consumed = []
+
+        def stream():
+            for record in records:
+                consumed.append(record)
+                yield record
+
+        merged_after = []
+
+        def read_range(data):
+            merged_after.append(len(consumed))
+            return PdfReader(data)
+
+        with self.settings(CARD_PDF_WORKERS=2, CARD_PDF_PARALLEL_MIN_CARDS=4, CARD_PDF_RANGE_PAGES=1), \
+                mock.patch('bingo.card_pdf.PdfReader', side_effect=read_range):
+            pages = write_pdf(stream(), self.event, output)
+
+        # With two ranges per worker in flight, the first range is merged before the last cards are read
+        self.assertLess(merged_after[0], len(records))
+        reader = PdfReader(BytesIO(output.getvalue()))
+        self.assertEqual((pages, len(reader.pages)), (5, 5))
+        for number, page in enumerate(reader.pages, start=1):
+            self.assertIn(f"Página {number}", page.extract_text())
+
+    async def test_download_streams_asynchronously_under_asgi(self):
+        """Test that under ASGI the card PDF download is sent range by range, not buffered by Django"""
+        headers = await sync_to_async(auth_headers)(self.user)
+        cards = [{'id': str(card.id), 'numbers': card.numbers} for card in self.cards[:5]]
+        response = await AsyncClient().post(
+            '/api/cards/download_pdf/', {'event_id': str(self.event.id), 'cards': cards},
+            content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        pdf = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        if PdfReader:
+            self.assertEqual(len(PdfReader(BytesIO(pdf)).pages), 2)
+
+    @skipUnless(PdfWriter, "pypdf is not installed")
+    def test_pdf_is_streamed_range_by_range(self):
+        """Test that the first range is sent before the last cards are read and the ranges form one PDF"""
+        records = card_records(BingoCard.objects.filter(event=self.event)) * 3
+        consumed = []
+
+        def stream():
+            for record in records:
+                consumed.append(record)
+                yield record
+
+        with self.settings(CARD_PDF_RANGE_PAGES=1):
+            chunks = iter_pdf(stream(), self.event)
+            pdf = next(chunks) + next(chunks)
+            self.assertLess(len(consumed), len(records))
+            pdf += b''.join(chunks)
+            single = b''.join(iter_pdf(iter(records[:2]), self.event))
+
+        reader = PdfReader(BytesIO(pdf), strict=True)
+        self.assertEqual(len(reader.pages), 5)
+        for number, page in enumerate(reader.pages, start=1):
+            self.assertIn(f"Página {number}", page.extract_text())
+        # The logo is written once for all the ranges
+        self.assertEqual(pdf.count(b'/Subtype /Image'), single.count(b'/Subtype /Image'))
+
+
+class PdfArtifactTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='reprint@example.com', password='pass1234', is_seller=True)
+        self.event = Event.objects.create(
+            name='Reprint Event', prize=100, start=timezone.now(), end=timezone.now())
+        self.metadata = new_batch_metadata(3)
+        issue_cards(self.event, self.user, 3, self.metadata)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        store_patch = mock.patch('bingo.pdf_artifacts._store', FileSystemArtifactStore(self.directory.name))
+        store_patch.start()
+        self.addCleanup(store_patch.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/cards/download_transaction_cards/?transaction_id={self.metadata['transaction_id']}"
+
+    def test_redownload_is_served_from_the_store(self):
+        """Test that a transaction PDF is rendered once and then served with validators and ranges"""
+        with mock.patch('bingo.pdf_artifacts.write_pdf', wraps=write_pdf) as render:
+            first = self.client.get(self.url)
+            pdf = b''.join(first.streaming_content)
+            second = self.client.get(self.url)
+            b''.join(second.streaming_content)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        partial = self.client.get(self.url, HTTP_RANGE='bytes=0-3')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), pdf[:4])
+        self.assertEqual(partial['Content-Range'], f"bytes 0-3/{len(pdf)}")
+
+    async def test_downloads_stream_asynchronously_under_asgi(self):
+        """Test that under ASGI full and ranged downloads are read block by block"""
+        headers = await sync_to_async(auth_headers)(self.user)
+        full = await AsyncClient().get(self.url, headers=headers)
+        self.assertTrue(full.is_async)
+        pdf = b''.join([chunk async for chunk in full.streaming_content])
+
+        partial = await AsyncClient().get(self.url, headers={**headers, 'Range': 'bytes=4-9'})
+        self.assertEqual(partial.status_code, 206)
+        self.assertTrue(partial.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in partial.streaming_content]), pdf[4:10])
+
+    def test_store_evicts_least_recently_used(self):
+        """Test that the size cap removes the artifacts used least recently first"""
+        store = FileSystemArtifactStore(self.directory.name, max_bytes=20)
+        for age, digest in enumerate(['aa01', 'bb02', 'cc03']):
+            store.save(digest, lambda output: output.write(b'x' * 10)).file.close()
+            os.utime(store.get(digest).path, (1000 - age, 1000))
+        store.get('cc03')  # Most recently used
+        # The cap kept two artifacts on each save; bb02 is now the least recently used
+        store.save('dd04', lambda output: output.write(b'x' * 10)).file.close()
+        self.assertIsNone(store.get('bb02'))
+        self.assertIsNotNone(store.get('cc03'))
+
+    def test_store_walks_the_directory_only_over_the_cap(self):
+        """Test that saves under the size cap keep a running total instead of walking the directory"""
+        store = FileSystemArtifactStore(self.directory.name, max_bytes=30)
+        with mock.patch('bingo.pdf_artifacts.os.walk', wraps=os.walk) as walk:
+            for digest in ['aa01', 'bb02', 'cc03']:
+                store.save(digest, lambda output: output.write(b'x' * 10)).file.close()
+            self.assertEqual(walk.call_count, 1)
+            store.save('dd04', lambda output: output.write(b'x' * 10)).file.close()
+            self.assertEqual(walk.call_count, 2)
+
+    def test_evicted_artifact_is_still_served(self):
+        """Test that an artifact evicted after it was looked up is still downloaded whole"""
+        first = b''.join(self.client.get(self.url).streaming_content)
+        store = FileSystemArtifactStore(self.directory.name, max_bytes=0)
+        original_open = FileSystemArtifactStore.open
+
+        def open_then_evict(self, digest):
+            artifact = original_open(self, digest)
+            store.evict()
+            return artifact
+
+        with mock.patch.object(FileSystemArtifactStore, 'open', open_then_evict):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), first)
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='mailer@example.com', password='pass1234', is_seller=True)
+        self.event = Event.objects.create(
+            name='Mail Event', prize=100, start=timezone.now(), end=timezone.now())
+        cards = issue_cards(self.event, self.user, 2, new_batch_metadata(2))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            'email': 'buyer@example.com',
+            'event_id': str(self.event.id),
+            'cards': [{'id': str(card.id), 'numbers': card.numbers} for card in cards],
+        }
+
+    def test_email_is_queued_and_sent_by_the_worker(self):
+        """Test that email_cards answers before sending and the worker delivers the PDF"""
+        response = self.client.post('/api/cards/email_cards/', self.payload, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(mail.outbox), 0)
+        status_url = response.data['status_url']
+        self.assertEqual(self.client.get(status_url).data['status'], EmailDelivery.STATUS_PENDING)
+
+        run_outbox_worker(once=True)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+        self.assertTrue(mail.outbox[0].attachments[0][1].startswith(b'%PDF'))
+        delivery = self.client.get(status_url).data
+        self.assertEqual(delivery['status'], EmailDelivery.STATUS_SENT)
+        self.assertEqual(delivery['attempts'], 1)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_BASE=60)
+    def test_failed_send_is_retried_with_backoff(self):
+        """Test that a failed send is rescheduled and given up after the last attempt"""
+        delivery = queue_cards_email(self.user, self.event, self.payload['cards'],
+                                     'buyer@example.com', 'Cartones', '')
+        with mock.patch('bingo.email_outbox.get_connection', side_effect=ConnectionError('smtp down')):
+            run_outbox_worker(once=True)
+            delivery.refresh_from_db()
+            self.assertEqual(delivery.status, EmailDelivery.STATUS_PENDING)
+            self.assertEqual(delivery.attempts, 1)
+            self.assertGreater(delivery.next_attempt_at, timezone.now() + timedelta(seconds=50))
+            # Not due yet: the worker leaves it alone
+            self.assertEqual(claim_deliveries(), [])
+
+            EmailDelivery.objects.filter(pk=delivery.pk).update(next_attempt_at=timezone.now())
+            run_outbox_worker(once=True)
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, EmailDelivery.STATUS_FAILED)
+        self.assertEqual(delivery.last_error, 'smtp down')
+
+
+class CardExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='auditor@example.com', password='pass1234', is_seller=True)
+        self.event = Event.objects.create(
+            name='Export Event', prize=100, start=timezone.now(), end=timezone.now())
+        self.metadata = new_batch_metadata(3)
+        self.cards = issue_cards(self.event, self.user, 2, self.metadata)
+        self.cards += insert_cards(self.event, build_derived_cards(self.event, self.user, 1, self.metadata))
+        other = User.objects.create_user(email='other@example.com', password='pass1234')
+        issue_cards(self.event, other, 1, new_batch_metadata(1))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, output, **params):
+        response = self.client.get('/api/cards/export/', {'event_id': str(self.event.id), 'output': output, **params})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_formats_contain_the_same_cards(self):
+        """Test that csv, jsonl and columnar exports agree and only include the user's cards"""
+        expected = {str(card.id): parse_card_numbers(card.numbers) for card in self.cards}
+
+        rows = list(csv.DictReader(StringIO(self.export('csv').decode())))
+        self.assertEqual({row['id']: [int(v) for v in row['grid'].split()] for row in rows}, expected)
+
+        lines = [json.loads(line) for line in self.export('jsonl').decode().splitlines()]
+        self.assertEqual({line['id']: line['grid'] for line in lines}, expected)
+        self.assertEqual({line['transaction_id'] for line in lines}, {self.metadata['transaction_id']})
+
+        groups = list(iter_columnar_groups(BytesIO(self.export('columnar'))))
+        columns = {name: sum((group[name] for group in groups), []) for name in groups[0]}
+        self.assertEqual(dict(zip(columns['id'], columns['grid'])), expected)
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        """Test that under ASGI the export is an async iterator instead of a list Django buffers"""
+        headers = await sync_to_async(auth_headers)(self.user)
+        response = await AsyncClient().get(
+            '/api/cards/export/', {'event_id': str(self.event.id), 'output': 'jsonl'}, headers=headers)
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertCountEqual([json.loads(line)['id'] for line in lines], [str(card.id) for card in self.cards])
+
+    def test_export_streams_in_chunks(self):
+        """Test that the export is produced one cursor chunk at a time"""
+        chunks = list(iter_export(cards_to_export(self.event.id), 'columnar', chunk_size=2))
+        # Header, two row groups (2 + 2 cards) and footer
+        self.assertEqual(len(chunks), 4)
+        groups = list(iter_columnar_groups(BytesIO(b''.join(chunks))))
+        self.assertEqual([len(group['id']) for group in groups], [2, 2])
+
+
+class ListPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='pager@example.com', password='pass1234')
+        self.event = Event.objects.create(
+            name='Pages Event', prize=100, start=timezone.now(), end=timezone.now())
+        self.cards = issue_cards(self.event, self.user, 5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cards_are_paginated_by_cursor_with_projection(self):
+        """Test that the cards list pages by cursor and serializes only the requested fields"""
+        response = self.client.get('/api/cards/', {'page_size': 2, 'fields': 'id,correlative_id,is_winner'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'correlative_id', 'is_winner'})
+
+        seen = []
+        page = response.data
+        while True:
+            seen += [card['id'] for card in page['results']]
+            if not page['next']:
+                break
+            # A card issued between pages does not shift the cursor
+            issue_cards(self.event, self.user, 1)
+            page = self.client.get(page['next']).data
+        self.assertCountEqual(seen, [str(card.id) for card in self.cards])
+
+    def test_unknown_projection_field_is_rejected(self):
+        """Test that ?fields= with a field the serializer does not have is a 400"""
+        response = self.client.get('/api/cards/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='budget@example.com', password='pass1234', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_queries_fail_the_budget(self):
+        """Test that a query repeated in a loop is reported as a possible N+1"""
+        event = Event.objects.create(name='Loop', prize=1, start=timezone.now(), end=timezone.now())
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(10):
+                for _ in range(6):
+                    Event.objects.get(id=event.id)
+
+    @override_settings(SQL_INSTRUMENTATION_HEADERS=True)
+    def test_pending_deposits_fit_the_budget(self):
+        """Test that payment method details of pending deposits are loaded in one query"""
+        for i in range(6):
+            method = PaymentMethod.objects.create(payment_method=f"method-{i}")
+            DepositRequest.objects.create(user=self.user, amount=10, unique_code=f"CODE{i}",
+                                          reference='ref', payment_method=str(method.id))
+        with query_budget(3):
+            response = self.client.get('/api/deposits/pending/')
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(response['X-DB-Repeated'], '0')
+        self.assertLessEqual(int(response['X-DB-Queries']), 3)
+
+    def test_purchase_fits_the_budget(self):
+        """Test that a purchase runs a fixed number of queries whatever the quantity and pool state"""
+        event = Event.objects.create(name='Budget', prize=1, start=timezone.now(), end=timezone.now())
+        TestCoinBalance.objects.create(user=self.user, balance=100)
+        self.client.post('/api/cards/purchase/', {'event_id': str(event.id), 'quantity': 1}, format='json')
+
+        with query_budget(20):
+            response = self.client.post('/api/cards/purchase/', {'event_id': str(event.id), 'quantity': 20},
+                                        format='json')
+        self.assertEqual(len(response.data['cards']), 20)
+
+        refill_pool(event, low_watermark=10, high_watermark=10)
+        with query_budget(13):
+            response = self.client.post('/api/cards/purchase/', {'event_id': str(event.id), 'quantity': 10},
+                                        format='json')
+        self.assertEqual(pool_size(event), 0)
+
+    def test_endpoint_budgets_command(self):
+        """Test that the listed endpoints stay within budget as the data grows"""
+        out = StringIO()
+        call_command('check_query_budgets', small=1, large=3, stdout=out)
+        for name in ('deposits/pending', 'download_pdf', 'verify_pattern', 'purchase'):
+            self.assertIn(name, out.getvalue())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_PIN_WINDOW=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        caches[settings.DATABASE_PIN_CACHE].clear()
+
+    def _request(self, method='get', cookies=None, write=False, headers=None):
+        """Run a request through the middleware; returns (read aliases, response)"""
+        router = ReplicaRouter()
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Event))
+            if write:
+                router.db_for_write(Event)
+                reads.append(router.db_for_read(Event))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/api/events/', headers=headers)
+        request.COOKIES.update(cookies or {})
+        return reads, ReplicaPinningMiddleware(view)(request)
+
+    def test_safe_reads_go_to_replica(self):
+        """Test that GET reads use a replica and outside a request the primary is used"""
+        reads, response = self._request()
+        self.assertEqual(reads, ['replica'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(ReplicaRouter().db_for_read(Event), 'default')
+
+    def test_write_pins_client_to_primary(self):
+        """Test that after a write the request and the next ones within the window read the primary"""
+        reads, response = self._request(write=True)
+        self.assertEqual(reads, ['replica', 'default'])
+        cookie = response.cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+        reads, _ = self._request(cookies={PIN_COOKIE: cookie.value})
+        self.assertEqual(reads, ['default'])
+        reads, _ = self._request(cookies={PIN_COOKIE: str(time.time() - 1)})
+        self.assertEqual(reads, ['replica'])
+
+    def test_unsafe_methods_use_primary(self):
+        """Test that POST requests never read from a replica"""
+        reads, response = self._request(method='post')
+        self.assertEqual(reads, ['default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_user_without_cookie(self):
+        """Test that a JWT user's write pins their later requests and websocket snapshots server-side"""
+        user, other = User(id=901), User(id=902)
+        self._request(method='post', headers=auth_headers(user))
+        self.assertGreater(user_pinned_until(user.id), time.time())
+
+        # Cross-site clients do not send the cookie back
+        reads, _ = self._request(headers=auth_headers(user))
+        self.assertEqual(reads, ['default'])
+        reads, _ = self._request(headers=auth_headers(other))
+        self.assertEqual(reads, ['replica'])
+
+        consumer = BingoConsumer()
+        consumer.scope = {'headers': []}
+        for consumer.user, replica_allowed in ((user, False), (other, True)):
+            with consumer._snapshot_reads() as scope:
+                self.assertEqual(scope.replica_allowed, replica_allowed)
+
+
+class DatabasePoolTests(SimpleTestCase):
+    @skipUnless(ConnectionPool, 'psycopg_pool is not installed')
+    def test_pools_replace_persistent_connections(self):
+        """Test that PostgreSQL databases get a bounded pool and other engines are left alone"""
+        databases = {
+            'default': {'ENGINE': 'django.db.backends.postgresql', 'CONN_MAX_AGE': 600, 'OPTIONS': {'sslmode': 'prefer'}},
+            'local': {'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 60},
+        }
+        pooled = configure_pools(databases, min_size=1, max_size=4, timeout=3, max_idle=60, max_lifetime=600)
+
+        self.assertEqual(pooled, ['default'])
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 0)
+        self.assertIs(databases['default']['CONN_HEALTH_CHECKS'], True)
+        self.assertNotIn('CONN_HEALTH_CHECKS', databases['local'])
+        self.assertEqual(databases['default']['OPTIONS']['sslmode'], 'prefer')
+        self.assertEqual(databases['default']['OPTIONS']['pool']['max_size'], 4)
+        self.assertEqual(databases['default']['OPTIONS']['pool']['timeout'], 3)
+        self.assertEqual(databases['local']['CONN_MAX_AGE'], 60)
+
+    def test_pool_stats_of_unpooled_database(self):
+        """Test that databases without a pool are reported as such"""
+        self.assertIsNone(pool_stats()['default'])
+
+
+class EventStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='stats@example.com', password='pass1234')
+        self.event = Event.objects.create(
+            name='Stats Event', prize=100, start=timezone.now(), end=timezone.now())
+        TestCoinBalance.objects.create(user=self.user, balance=20)
+
+    def _stats(self):
+        return EventStats.objects.get(event=self.event)
+
+    def test_purchase_call_and_claim_update_totals(self):
+        """Test that purchases, calls and claims keep the totals in step with the base tables"""
+        purchase_cards(self.user, self.event, 2, 2, new_batch_metadata(2))
+        purchase_cards(self.user, self.event, 1, 2, new_batch_metadata(1))
+        card = BingoCard.objects.create(
+            event=self.event, user=self.user, numbers=make_card_numbers(SAMPLE_GRID), hash='hash-stats')
+        for value in (1, 16, 31, 46, 61):
+            Number.objects.create(event=self.event, value=value)
+            add_stats(self.event.id, numbers_called=1)
+        adjudicate_claims(self.event.id, [make_claim(card.id, self.user.id)])
+
+        stats = self._stats()
+        self.assertEqual((stats.cards_sold, stats.revenue, stats.unique_players), (3, 6, 1))
+        self.assertEqual((stats.numbers_called, stats.winners), (5, 1))
+
+        [(chunk, drifted)] = list(reconcile([self.event.id]))
+        self.assertEqual(drifted, [])
+        self.assertIsNotNone(self._stats().reconciled_at)
+
+    def test_purchase_updates_totals_once(self):
+        """Test that a purchase locks the stats row with a single update right before committing"""
+        with mock.patch('bingo.card_issuing.add_stats', wraps=add_stats) as tracked:
+            purchase_cards(self.user, self.event, 2, 2, new_batch_metadata(2))
+        tracked.assert_called_once_with(self.event.id, cards_sold=2, unique_players=1, revenue=4)
+
+    def test_reconcile_command_fixes_drift(self):
+        """Test that totals changed outside the tracked paths are rebuilt from the base tables"""
+        Number.objects.create(event=self.event, value=7)
+        add_stats(self.event.id, winners=4)
+
+        out = StringIO()
+        call_command('reconcile_event_stats', chunk_size=1, stdout=out)
+        self.assertIn('totals corrected', out.getvalue())
+        stats = self._stats()
+        self.assertEqual((stats.numbers_called, stats.winners), (1, 0))
+
+    def test_stats_endpoint_is_one_query(self):
+        """Test that the stats endpoint reads the aggregate row only"""
+        admin = User.objects.create_user(email='stats-admin@example.com', password='pass1234', is_staff=True)
+        purchase_cards(self.user, self.event, 2, 2, new_batch_metadata(2))
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        with query_budget(1):
+            response = client.get(f'/api/events/{self.event.id}/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cards_sold'], 2)
+        self.assertEqual(client.get('/api/events/not-a-uuid/stats/').status_code, 404)
+
+
+class EventArchiveTests(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        override = override_settings(EVENT_ARCHIVE_DIR=self.tempdir.name, EVENT_ARCHIVE_RETENTION_DAYS=30)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(email='archive@example.com', password='pass1234')
+        TestCoinBalance.objects.create(user=self.user, balance=20)
+        ended = timezone.now() - timedelta(days=40)
+        self.event = Event.objects.create(
+            name='Old Event', prize=100, start=ended - timedelta(hours=2), end=ended)
+        self.recent = Event.objects.create(
+            name='Recent Event', prize=100, start=timezone.now(), end=timezone.now())
+
+    def test_finished_event_is_moved_to_archive(self):
+        """Test that an old event leaves the hot tables and keeps a queryable summary"""
+        purchase_cards(self.user, self.event, 2, 2, new_batch_metadata(2))
+        card = BingoCard.objects.create(
+            event=self.event, user=self.user, numbers=make_card_numbers(SAMPLE_GRID), hash='hash-archive')
+        pool_grid = list(SAMPLE_GRID)
+        pool_grid[4] = 66
+        BingoCard.objects.create(event=self.event, numbers=make_card_numbers(pool_grid), hash='hash-pool')
+        for value in (1, 16, 31, 46, 61):
+            Number.objects.create(event=self.event, value=value)
+        adjudicate_claims(self.event.id, [make_claim(card.id, self.user.id)])
+        Number.objects.create(event=self.recent, value=5)
+
+        self.assertEqual(list(archivable_events()), [self.event])
+        call_command('archive_events', chunk_size=2, stdout=StringIO())
+
+        self.assertFalse(BingoCard.objects.filter(event=self.event).exists())
+        self.assertFalse(Number.objects.filter(event=self.event).exists())
+        self.assertFalse(CardPurchase.objects.filter(event=self.event).exists())
+        self.assertTrue(Number.objects.filter(event=self.recent).exists())
+
+        archive = EventArchive.objects.get(event=self.event)
+        self.assertEqual(archive.status, EventArchive.STATUS_COMPLETED)
+        self.assertEqual(archive.draw_sequence, [1, 16, 31, 46, 61])
+        self.assertEqual([w['card_id'] for w in archive.winners], [str(card.id)])
+        self.assertEqual((archive.stats['cards_sold'], archive.stats['revenue']), (2, '4.00'))
+        self.assertEqual((archive.cards_archived, archive.numbers_archived, archive.pool_cards_deleted), (3, 5, 1))
+
+        cards = list(iter_archived(archive, 'cards'))
+        self.assertEqual(len(cards), 3)
+        self.assertIn(SAMPLE_GRID, [row['grid'] for row in cards])
+        self.assertCountEqual([row['value'] for row in iter_archived(archive, 'numbers')], [1, 16, 31, 46, 61])
+        self.assertEqual(list(archivable_events()), [])
+
+        admin = User.objects.create_user(email='archive-admin@example.com', password='pass1234', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get(f'/api/events/{self.event.id}/archive/')
+        self.assertEqual(response.data['winners'][0]['rank'], 1)
+
+    def test_winners_without_claims_are_kept(self):
+        """Test that cards marked as winners before WinClaim existed are in the winners summary"""
+        card = BingoCard.objects.create(
+            event=self.event, user=self.user, numbers=make_card_numbers(SAMPLE_GRID), hash='hash-legacy',
+            is_winner=True)
+
+        call_command('archive_events', stdout=StringIO())
+
+        winners = EventArchive.objects.get(event=self.event).winners
+        self.assertEqual([(w['card_id'], w['user_id'], w['rank']) for w in winners],
+                         [(str(card.id), self.user.id, None)])
+
+    def test_dry_run_and_live_events(self):
+        """Test that a dry run moves nothing and events that did not end are refused"""
+        Number.objects.create(event=self.event, value=9)
+        out = StringIO()
+        call_command('archive_events', dry_run=True, stdout=out)
+        self.assertIn('1 events to archive', out.getvalue())
+        self.assertTrue(Number.objects.filter(event=self.event).exists())
+
+        self.recent.end = timezone.now() + timedelta(hours=1)
+        self.recent.save()
+        with self.assertRaises(CommandError):
+            call_command('archive_events', event=str(self.recent.id), stdout=StringIO())
+
+    def test_archiving_requires_a_persistent_directory(self):
+        """Test that nothing is archived or deleted while EVENT_ARCHIVE_DIR is unset or missing"""
+        Number.objects.create(event=self.event, value=9)
+        missing = os.path.join(self.tempdir.name, 'not-mounted')
+        for directory in (None, missing):
+            with self.settings(EVENT_ARCHIVE_DIR=directory):
+                with self.assertRaises(CommandError):
+                    call_command('archive_events', stdout=StringIO())
+                with self.assertRaises(ImproperlyConfigured):
+                    archive_event(self.event)
+        self.assertFalse(os.path.exists(missing))
+        self.assertFalse(EventArchive.objects.exists())
+        self.assertTrue(Number.objects.filter(event=self.event).exists())
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='retry@example.com', password='pass1234')
+        self.event = Event.objects.create(
+            name='Retry Event', prize=100, start=timezone.now(), end=timezone.now())
+        TestCoinBalance.objects.create(user=self.user, balance=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _purchase(self, key, quantity=2):
+        return self.client.post('/api/cards/purchase/', {'event_id': str(self.event.id), 'quantity': quantity},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_original_response(self):
+        """Test that a retried purchase returns the stored response and charges once"""
+        first = self._purchase('key-1')
+        retry = self._purchase('key-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(BingoCard.objects.filter(user=self.user).count(), 2)
+
+    def test_key_reused_for_different_request(self):
+        """Test that a key cannot be replayed for a different body"""
+        self._purchase('key-2')
+        response = self._purchase('key-2', quantity=3)
+        self.assertEqual(response.status_code, 422)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.05)
+    def test_stuck_request_is_taken_over_after_its_lease(self):
+        """Test that a key left in progress by a dead worker blocks retries only until its lease ends"""
+        self._purchase('key-3')
+        record = IdempotencyKey.objects.get(key='key-3')
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status=IdempotencyKey.STATUS_IN_PROGRESS, response_body=None,
+            in_progress_until=timezone.now() + timedelta(seconds=30))
+        self.assertEqual(self._purchase('key-3').status_code, 409)
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(in_progress_until=timezone.now() - timedelta(seconds=1))
+        retry = self._purchase('key-3')
+        self.assertEqual(retry.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', retry)
+        record.refresh_from_db()
+        self.assertEqual((record.status, record.in_progress_until), (IdempotencyKey.STATUS_COMPLETED, None))
+
+    @override_settings(IDEMPOTENCY_IN_PROGRESS_LEASE=0.1)
+    def test_running_request_renews_its_lease(self):
+        """Test that the lease is renewed while the request runs and a renewed key is not taken over"""
+        renewals = []
+        purchase = purchase_cards
+
+        def slow_purchase(*args, **kwargs):
+            time.sleep(0.3)
+            return purchase(*args, **kwargs)
+
+        # The heartbeat thread has its own connection, which cannot see the test transaction
+        with mock.patch('bingo.views.purchase_cards', side_effect=slow_purchase), \
+                mock.patch('bingo.idempotency._renew', side_effect=lambda record: renewals.append(record) or True):
+            self.assertEqual(self._purchase('key-4').status_code, 200)
+        self.assertGreaterEqual(len(renewals), 2)
+
+        record = IdempotencyKey.objects.get(key='key-4')
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status=IdempotencyKey.STATUS_IN_PROGRESS, in_progress_until=timezone.now() - timedelta(seconds=1))
+        record.refresh_from_db()
+        self.assertTrue(_renew(record))
+        self.assertFalse(_begin(self.user, 'key-4', record.request_fingerprint)[1])
@@ -5,14 +5,16 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.db.models import Q, Max
-from .models import Event, BingoCard, Number, PaymentMethod, TestCoinBalance, CardPurchase, WinningPattern, DepositRequest, SystemConfig, RatesConfig
+from .models import Event, BingoCard, CardBatch, Number, PaymentMethod, TestCoinBalance, CardPurchase, WinningPattern, DepositRequest, SystemConfig, RatesConfig, CardGenerationJob, EmailDelivery, EventArchive
 from .serializers import (
     EventSerializer, BingoCardSerializer, NumberSerializer, PaymentMethodCreateUpdateSerializer, PaymentMethodSerializer,
     TestCoinBalanceSerializer, CardPurchaseSerializer,
     CardPurchaseRequestSerializer, BingoClaimRequestSerializer, BingoClaimResponseSerializer,
     WinningPatternSerializer, DepositRequestSerializer, DepositRequestCreateSerializer,
     DepositConfirmSerializer, DepositAdminActionSerializer, CardPriceUpdateSerializer, SystemConfigSerializer,
-    EmailCardsSerializer, RatesConfigSerializer, RatesUpdateSerializer
+    EmailCardsSerializer, RatesConfigSerializer, RatesUpdateSerializer,
+    CardGenerationJobSerializer, CardGenerationJobRequestSerializer, EmailDeliverySerializer,
+    EventArchiveSerializer
 )
 import random
 import logging
@@ -23,18 +25,31 @@ import json
 from django.db import transaction
 from django.core.cache import cache
 import uuid
-from django.http import HttpResponse
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Spacer, Paragraph, PageBreak, Image
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from io import BytesIO
-from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
+from django.urls import reverse
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from django.utils.html import strip_tags
 from django.conf import settings
+from core.pagination import paginated_response
+from core.streaming import streaming_content
 from .permissions import IsSellerPermission
+from .claims import adjudicate_claims, make_claim
+from .card_issuing import new_batch_metadata, purchase_cards
+from .locks import LockTimeout, balance_lock_name, get_lock_manager
+from .card_jobs import submit_job
+from .email_outbox import queue_cards_email
+from .event_stats import add_stats, get_stats
+from .idempotency import idempotent
+from .card_pdf import (
+    PDF_RENDERERS, RENDERER_PLATYPUS, card_records, cards_pdf_response, payload_records,
+)
+from .card_export import (
+    CONTENT_TYPES, EXPORT_FORMATS, FILE_EXTENSIONS, FORMAT_CSV, cards_to_export, iter_export,
+)
+from .pdf_artifacts import (
+    artifact_response, cached_pdf, transaction_batch, transaction_cards, warm_transaction_pdf_async,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +57,7 @@ logger = logging.getLogger(__name__)
 class EventViewSet(viewsets.ModelViewSet):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
+    cursor_ordering = '-created_at'
 
     def perform_create(self, serializer):
         try:
@@ -123,6 +139,26 @@ class EventViewSet(viewsets.ModelViewSet):
         serializer = WinningPatternSerializer(patterns, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def stats(self, request, pk=None):
+        """Cards sold, revenue, winners, numbers called and unique players, read from EventStats"""
+        try:
+            stats = get_stats(pk)
+        except DjangoValidationError:
+            stats = None
+        if stats is None:
+            return Response({'error': 'Event not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(stats)
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def archive(self, request, pk=None):
+        """Summary of an archived event: draw sequence, winners and totals"""
+        try:
+            archive = EventArchive.objects.get(event_id=pk)
+        except (EventArchive.DoesNotExist, DjangoValidationError):
+            return Response({'error': 'Event not archived'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(EventArchiveSerializer(archive).data)
+
     @action(detail=True, methods=['post'])
     def set_patterns(self, request, pk=None):
         """Set the allowed patterns for this event"""
@@ -207,6 +243,7 @@ class BingoCardViewSet(viewsets.ModelViewSet):
     serializer_class = BingoCardSerializer
     permission_classes = [IsAuthenticated]
     queryset = BingoCard.objects.all()  # Add this line for router registration
+    cursor_ordering = '-created_at'
 
     def get_queryset(self):
         """Ensure users can only see their own cards"""
@@ -251,6 +288,7 @@ class BingoCardViewSet(viewsets.ModelViewSet):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    @idempotent
     def purchase(self, request):
         """Purchase bingo cards for an event using test coins"""
         serializer = CardPurchaseRequestSerializer(data=request.data)
@@ -266,92 +304,29 @@ class BingoCardViewSet(viewsets.ModelViewSet):
         except Event.DoesNotExist:
             return Response({"error": "Event not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Get cost per card from system configuration
-        from decimal import Decimal
-        cost_per_card = Decimal(str(SystemConfig.get_card_price()))
-        total_cost = cost_per_card * quantity
-
-        # Use a Redis lock to prevent race conditions
-        lock_id = f"purchase_lock:{user.id}"
-        lock_timeout = 60  # 1 minute timeout
-
-        # Try to acquire the lock
-        lock_acquired = cache.add(lock_id, "locked", lock_timeout)
-        if not lock_acquired:
+        # Distributed lock on the user's balance, shared by every worker
+        try:
+            lock = get_lock_manager().acquire(
+                balance_lock_name(user.id), timeout=settings.LOCK_ACQUIRE_TIMEOUT, auto_renew=True)
+        except LockTimeout:
             return Response({"error": "Otra compra está en progreso"},
                             status=status.HTTP_429_TOO_MANY_REQUESTS)
 
         try:
-            # Transaction to ensure atomicity
-            with transaction.atomic():
-                # Get or create test coin balance
-                balance, created = TestCoinBalance.objects.get_or_create(
-                    user=user)
-
-                # Convertir los valores a Decimal para comparación precisa
-                balance_decimal = Decimal(
-                    str(balance.balance)).quantize(Decimal('0.01'))
-                total_cost = Decimal(str(total_cost)).quantize(Decimal('0.01'))
-
-                if balance_decimal < total_cost:
-                    return Response({
-                        "success": False,
-                        "message": f"No tienes saldo suficiente. Necesitas tener {total_cost:.2f}, y tu saldo es {balance_decimal:.2f}."
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                # Deduct coins with F() to prevent race conditions
-                success, result = TestCoinBalance.deduct_coins(
-                    user.id, total_cost)
-                if not success:
-                    return Response({
-                        "success": False,
-                        "message": result
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                # Get or create card purchase record
-                card_purchase, created = CardPurchase.objects.get_or_create(
-                    user=user,
-                    event=event,
-                    defaults={"cards_owned": 0}
-                )
-
-                # Update cards owned
-                card_purchase.cards_owned += quantity
-                card_purchase.save()
-
-                # Generate unique bingo cards
-                cards = []
-                for _ in range(quantity):
-                    # Generate a unique card
-                    card_numbers = self._generate_bingo_card_numbers()
-
-                    # Create a unique hash for the card
-                    card_hash = hashlib.sha256(
-                        f"{user.id}-{event.id}-{json.dumps(card_numbers)}-{uuid.uuid4()}".encode(
-                        )
-                    ).hexdigest()
-
-                    # Generar un correlative_id único para esta tarjeta
-                    correlative_id = BingoCard.generate_correlative_id(event)
-
-                    # Create the card
-                    card = BingoCard.objects.create(
-                        event=event,
-                        user=user,
-                        numbers=card_numbers,
-                        is_winner=False,
-                        hash=card_hash,
-                        correlative_id=correlative_id
-                    )
-                    cards.append(card)
-
-                # Return the response
+            success, result = purchase_cards(
+                user, event, quantity, SystemConfig.get_card_price(), lock=lock)
+            if not success:
                 return Response({
-                    "success": True,
-                    "new_balance": result.balance,
-                    "cards": BingoCardSerializer(cards, many=True).data,
-                    "message": f"Successfully purchased {quantity} cards"
-                })
+                    "success": False,
+                    "message": result
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                "success": True,
+                "new_balance": result['balance'].balance,
+                "cards": BingoCardSerializer(result['cards'], many=True).data,
+                "message": f"Successfully purchased {quantity} cards"
+            })
 
         except Exception as e:
             logger.error(
@@ -361,52 +336,7 @@ class BingoCardViewSet(viewsets.ModelViewSet):
                 "message": f"Falló al comprar cartones: {str(e)}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         finally:
-            # Release the lock
-            cache.delete(lock_id)
-
-    def _generate_bingo_card_numbers(self):
-        """
-        Generate a valid bingo card with numbers in the correct range for each column.
-        Card format: ["B1", "B3", "I16", "N31", "N0", ...] (25 elements)
-
-        Numbers are arranged in column-first order to match the standard 5x5 grid:
-        0  5  10 15 20 (B column)
-        1  6  11 16 21 (I column)
-        2  7  12 17 22 (N column with free space at 12)
-        3  8  13 18 23 (G column)
-        4  9  14 19 24 (O column)
-        """
-        # B: 1-15, I: 16-30, N: 31-45, G: 46-60, O: 61-75
-        columns = {
-            'B': list(range(1, 16)),    # 1-15
-            'I': list(range(16, 31)),   # 16-30
-            'N': list(range(31, 46)),   # 31-45
-            'G': list(range(46, 61)),   # 46-60
-            'O': list(range(61, 76))    # 61-75
-        }
-
-        # Shuffle each column's numbers
-        for col in columns.keys():
-            random.shuffle(columns[col])
-
-        # Initialize empty card
-        card_numbers = [""] * 25
-
-        # Populate card by column
-        for col_idx, letter in enumerate("BINGO"):
-            col_values = columns[letter][:5]  # Get 5 numbers for this column
-
-            # Place numbers in the grid
-            for row_idx in range(5):
-                position = row_idx * 5 + col_idx
-
-                # Handle the free space in the middle (position 12)
-                if position == 12:  # Center cell
-                    card_numbers[position] = "N0"  # Free space
-                else:
-                    card_numbers[position] = f"{letter}{col_values[row_idx]}"
-
-        return card_numbers
+            lock.release()
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
     def claim(self, request):
@@ -434,31 +364,22 @@ class BingoCardViewSet(viewsets.ModelViewSet):
                 response_serializer.is_valid(raise_exception=True)
                 return Response(response_serializer.data, status=status.HTTP_404_NOT_FOUND)
 
-            # Get all called numbers for this event
-            called_numbers = set(Number.objects.filter(
-                event_id=card.event_id
-            ).values_list('value', flat=True))
-
-            # Check if the pattern is completed with called numbers
-            from .win_patterns import check_win_pattern
-            # Check the specified pattern or 'bingo' if none provided
-            is_winner, win_details = check_win_pattern(
-                card.numbers, called_numbers, pattern_name)
-
-            if is_winner:
-                # Mark the card as a winner if not already marked
-                if not card.is_winner:
-                    card.is_winner = True
-                    card.save()
+            # Adjudicate through the claim pipeline so simultaneous claims are ordered
+            result = adjudicate_claims(
+                card.event_id, [make_claim(card.id, user.id, pattern_name)])[0]
 
+            if result['valid']:
                 # Serialize card separately first
-                card_data = BingoCardSerializer(card).data
+                card_data = BingoCardSerializer(result['card']).data
 
                 response_data = {
                     "success": True,
-                    "message": f"¡Felicidades! Has ganado con el patrón '{win_details['pattern_name']}'",
+                    "message": result['message'],
                     "card": card_data,  # Use pre-serialized data
-                    "winning_pattern": win_details
+                    "winning_pattern": result['win_details'],
+                    "win_sequence": result['win_sequence'],
+                    "rank": result['rank'],
+                    "duplicate": result['duplicate']
                 }
                 response_serializer = BingoClaimResponseSerializer(
                     data=response_data)
@@ -467,7 +388,7 @@ class BingoCardViewSet(viewsets.ModelViewSet):
             else:
                 response_data = {
                     "success": False,
-                    "message": "No has ganado con el patrón especificado",
+                    "message": result['message'],
                 }
                 response_serializer = BingoClaimResponseSerializer(
                     data=response_data)
@@ -518,20 +439,7 @@ class BingoCardViewSet(viewsets.ModelViewSet):
             from .win_patterns import check_win_pattern
             is_winner, win_details = check_win_pattern(
                 card.numbers, set(called_numbers), pattern_name)
-
-            # Get the pattern display name from the database
-            pattern_display_name = None
-            if win_details and 'pattern_name' in win_details:
-                try:
-                    pattern = WinningPattern.objects.get(
-                        name=win_details['pattern_name'])
-                    pattern_display_name = pattern.display_name
-                except WinningPattern.DoesNotExist:
-                    pattern_display_name = win_details['pattern_name'].replace(
-                        '_', ' ').title()
-
-            if win_details and pattern_display_name:
-                win_details['display_name'] = pattern_display_name
+            # win_details already carries the pattern's display name from the database
 
             return Response({
                 "success": is_winner,
@@ -675,6 +583,7 @@ class BingoCardViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsSellerPermission])
+    @idempotent
     def generate_bulk(self, request):
         """Generate multiple bingo cards for sellers and assign them to the seller's account"""
         quantity = request.data.get('quantity', 1)
@@ -686,7 +595,7 @@ class BingoCardViewSet(viewsets.ModelViewSet):
             return Response({"error": "event_id is required"}, status=status.HTTP_400_BAD_REQUEST)
 
         if not isinstance(quantity, int) or quantity < 1 or quantity > 100:
-            return Response({"error": "quantity must be a number between 1 and 100"},
+            return Response({"error": "quantity must be a number between 1 and 100, use /api/card-jobs/ for larger batches"},
                             status=status.HTTP_400_BAD_REQUEST)
 
         try:
@@ -694,111 +603,43 @@ class BingoCardViewSet(viewsets.ModelViewSet):
         except Event.DoesNotExist:
             return Response({"error": "Event not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Get cost per card from system configuration
-        from decimal import Decimal
-        cost_per_card = Decimal(str(SystemConfig.get_card_price()))
-        total_cost = cost_per_card * quantity
-
-        # Use a Redis lock to prevent race conditions
-        lock_id = f"seller_generate_lock:{user.id}"
-        lock_timeout = 60  # 1 minute timeout
-
-        # Try to acquire the lock
-        lock_acquired = cache.add(lock_id, "locked", lock_timeout)
-        if not lock_acquired:
+        # Distributed lock on the user's balance, shared by every worker
+        try:
+            lock = get_lock_manager().acquire(
+                balance_lock_name(user.id), timeout=settings.LOCK_ACQUIRE_TIMEOUT, auto_renew=True)
+        except LockTimeout:
             return Response({"error": "Another generation is in progress"},
                             status=status.HTTP_429_TOO_MANY_REQUESTS)
 
         try:
-            # Transaction to ensure atomicity
-            with transaction.atomic():
-                # Get or create test coin balance
-                balance, created = TestCoinBalance.objects.get_or_create(
-                    user=user)
+            # Store metadata about this transaction on every card of the batch
+            metadata = new_batch_metadata(quantity)
+            success, result = purchase_cards(
+                user, event, quantity, SystemConfig.get_card_price(), metadata, lock=lock)
+            if not success:
+                return Response({
+                    "success": False,
+                    "message": result
+                }, status=status.HTTP_400_BAD_REQUEST)
 
-                # Convertir los valores a Decimal para comparación precisa
-                balance_decimal = Decimal(
-                    str(balance.balance)).quantize(Decimal('0.01'))
-                total_cost = Decimal(str(total_cost)).quantize(Decimal('0.01'))
+            cards = [{
+                'id': str(card.id),
+                'numbers': card.numbers,
+                'event_id': str(event_id)
+            } for card in result['cards']]
 
-                if balance_decimal < total_cost:
-                    return Response({
-                        "success": False,
-                        "message": f"Insufficient test coins. Need {total_cost:.2f}, have {balance_decimal:.2f}."
-                    }, status=status.HTTP_400_BAD_REQUEST)
+            # Render the batch PDF now so the seller's first download is served from the store
+            warm_transaction_pdf_async(user.id, metadata['transaction_id'])
 
-                # Deduct coins with F() to prevent race conditions
-                success, result = TestCoinBalance.deduct_coins(
-                    user.id, total_cost)
-                if not success:
-                    return Response({
-                        "success": False,
-                        "message": result
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                # Get or create card purchase record
-                card_purchase, created = CardPurchase.objects.get_or_create(
-                    user=user,
-                    event=event,
-                    defaults={"cards_owned": 0}
-                )
-
-                # Update cards owned
-                card_purchase.cards_owned += quantity
-                card_purchase.save()
-
-                # Create a transaction ID for this batch of cards
-                transaction_id = str(uuid.uuid4())
-
-                # Generate unique bingo cards and save them to the database
-                cards = []
-                db_cards = []
-                for _ in range(quantity):
-                    # Generate a unique card
-                    card_numbers = self._generate_bingo_card_numbers()
-
-                    # Create a unique hash for the card
-                    card_hash = hashlib.sha256(
-                        f"{user.id}-{event.id}-{json.dumps(card_numbers)}-{uuid.uuid4()}".encode(
-                        )
-                    ).hexdigest()
-
-                    # Generar un correlative_id único para esta tarjeta
-                    correlative_id = BingoCard.generate_correlative_id(event)
-
-                    # Create the card with transaction_id
-                    card = BingoCard.objects.create(
-                        event=event,
-                        user=user,
-                        numbers=card_numbers,
-                        is_winner=False,
-                        hash=card_hash,
-                        correlative_id=correlative_id,
-                        # Store metadata about this transaction
-                        metadata={
-                            'transaction_id': transaction_id,
-                            'generated_at': datetime.now(timezone.utc).isoformat(),
-                            'batch_size': quantity
-                        }
-                    )
-                    db_cards.append(card)
-
-                    # Add to the response data list
-                    cards.append({
-                        'id': str(card.id),
-                        'numbers': card_numbers,
-                        'event_id': str(event_id)
-                    })
-
-                # Return the response with transaction ID
-                return Response({
-                    "success": True,
-                    "new_balance": result.balance,
-                    "cards": cards,
-                    "cards_owned": card_purchase.cards_owned,
-                    "transaction_id": transaction_id,
-                    "message": f"Successfully generated {quantity} cards. Cost: {total_cost} coins."
-                })
+            # Return the response with transaction ID
+            return Response({
+                "success": True,
+                "new_balance": result['balance'].balance,
+                "cards": cards,
+                "cards_owned": result['card_purchase'].cards_owned,
+                "transaction_id": metadata['transaction_id'],
+                "message": f"Successfully generated {quantity} cards. Cost: {result['total_cost']} coins."
+            })
 
         except Exception as e:
             logger.error(
@@ -808,8 +649,7 @@ class BingoCardViewSet(viewsets.ModelViewSet):
                 "message": f"Card generation failed: {str(e)}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         finally:
-            # Release the lock
-            cache.delete(lock_id)
+            lock.release()
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsSellerPermission])
     def download_pdf(self, request):
@@ -822,6 +662,12 @@ class BingoCardViewSet(viewsets.ModelViewSet):
             return Response({"error": "cards and event_id are required"},
                             status=status.HTTP_400_BAD_REQUEST)
 
+        # 'platypus' (default) or 'canvas', the faster direct-drawing layout
+        renderer = data.get('renderer') or request.query_params.get('renderer') or RENDERER_PLATYPUS
+        if renderer not in PDF_RENDERERS:
+            return Response({"error": f"renderer must be one of: {', '.join(PDF_RENDERERS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
         # Handle different possible nested structures of cards data
         if isinstance(cards_data, dict):
             # If cards_data is a dict with a 'cards' key (nested structure)
@@ -842,18 +688,13 @@ class BingoCardViewSet(viewsets.ModelViewSet):
         # Log for debugging
         logger.info(f"Generating PDF for {len(cards)} cards")
 
-        # Generate PDF with extracted cards
-        pdf = self._generate_cards_pdf(cards, event)
-
-        # Create response with PDF
-        response = HttpResponse(pdf, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="bingo_cards_{event.name}.pdf"'
-
-        return response
+        # Stream the PDF with extracted cards
+        return cards_pdf_response(request, payload_records(cards, event), event,
+                                  f"bingo_cards_{event.name}.pdf", renderer)
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsSellerPermission])
     def email_cards(self, request):
-        """Send generated cards to an email"""
+        """Queue generated cards for delivery to an email; returns 202 with the delivery id"""
         serializer = EmailCardsSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -869,59 +710,15 @@ class BingoCardViewSet(viewsets.ModelViewSet):
         except Event.DoesNotExist:
             return Response({"error": "Event not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Generate PDF with cards
-        pdf = self._generate_cards_pdf(cards, event)
-
-        # Create HTML content with safe handling of potentially missing attributes
-        event_date_str = getattr(event, 'date', None) or getattr(
-            event, 'event_date', None) or ''
-        if hasattr(event_date_str, 'strftime'):
-            event_date_str = event_date_str.strftime('%Y-%m-%d %H:%M')
-
-        # Safely get event description or use empty string
-        event_description = getattr(event, 'description', '') or getattr(
-            event, 'event_description', '') or ''
-
-        html_message = render_to_string(
-            'email/bingo_cards_email.html',
-            {
-                'event_name': event.name,
-                'event_date': event_date_str,
-                'event_description': event_description,
-                'message': message,
-                'cards_count': len(cards)
-            }
-        )
-
-        # Send email with PDF attached
-        try:
-            email_message = EmailMessage(
-                subject=subject,
-                body=html_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[email]
-            )
-
-            # Set HTML content type
-            email_message.content_subtype = "html"
-
-            # Attach the PDF
-            email_message.attach(
-                f'bingo_cards_{event.name}.pdf', pdf, 'application/pdf')
-            email_message.send()
-
-            return Response({
-                "success": True,
-                "message": f"Bingo cards sent to {email} successfully"
-            })
-
-        except Exception as e:
-            logger.error(
-                f"Error sending bingo cards email: {str(e)}", exc_info=True)
-            return Response({
-                "success": False,
-                "message": f"Failed to send email: {str(e)}"
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # The PDF is rendered and sent by the outbox workers (send_email_outbox)
+        delivery = queue_cards_email(request.user, event, cards, email, subject, message)
+        return Response({
+            "success": True,
+            "delivery_id": delivery.id,
+            "status": delivery.status,
+            "status_url": reverse('email-deliveries-detail', args=[delivery.id]),
+            "message": f"Bingo cards queued for delivery to {email}"
+        }, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsSellerPermission])
     def download_transaction_cards(self, request):
@@ -932,358 +729,67 @@ class BingoCardViewSet(viewsets.ModelViewSet):
             return Response({"error": "transaction_id parameter is required"},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        # Get cards associated with this transaction
-        cards = BingoCard.objects.filter(
-            user=request.user,
-            metadata__transaction_id=transaction_id
-        )
+        renderer = request.query_params.get('renderer', RENDERER_PLATYPUS)
+        if renderer not in PDF_RENDERERS:
+            return Response({"error": f"renderer must be one of: {', '.join(PDF_RENDERERS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        if not cards.exists():
+        # The batch and its event in one query, then the cards through the batch index
+        batch = transaction_batch(request.user.id, transaction_id)
+        records = card_records(transaction_cards(batch)) if batch else []
+        if not records:
             return Response({"error": "No cards found for this transaction"},
                             status=status.HTTP_404_NOT_FOUND)
 
-        # Get event from the first card (all cards in a transaction are for the same event)
-        event = cards.first().event
+        # Rendered once per content digest, re-downloads are served from the artifact store
+        artifact = cached_pdf(records, batch.event, renderer)
+        return artifact_response(request, artifact, f"bingo_cards_transaction_{transaction_id[:8]}.pdf")
 
-        # Format cards for PDF generation - include ID and numbers
-        cards_data = [{'id': str(card.id), 'numbers': card.numbers}
-                      for card in cards]
-
-        # Generate PDF with cards
-        pdf = self._generate_cards_pdf(cards_data, event)
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the cards of an event and/or transaction as csv, jsonl or columnar
+        (?output=). Staff export every card; other users only their own.
+        """
+        event_id = request.query_params.get('event_id')
+        transaction_id = request.query_params.get('transaction_id')
+        if not event_id and not transaction_id:
+            return Response({"error": "event_id or transaction_id parameter is required"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        # Create response with PDF
-        response = HttpResponse(pdf, content_type='application/pdf')
-        response[
-            'Content-Disposition'] = f'attachment; filename="bingo_cards_transaction_{transaction_id[:8]}.pdf"'
+        export_format = request.query_params.get('output', FORMAT_CSV)
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": f"output must be one of: {', '.join(EXPORT_FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            queryset = cards_to_export(
+                event_id, transaction_id,
+                user_id=None if request.user.is_staff else request.user.id)
+        except DjangoValidationError:
+            return Response({"error": "Invalid event_id or transaction_id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(streaming_content(request, iter_export(queryset, export_format)),
+                                         content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = content_disposition_header(
+            True, f"cards_{(event_id or transaction_id)[:8]}.{FILE_EXTENSIONS[export_format]}")
         return response
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsSellerPermission])
     def my_transactions(self, request):
         """Get all card generation transactions for the seller"""
-        # Get all cards with transaction IDs
-        cards = BingoCard.objects.filter(
-            user=request.user,
-            metadata__transaction_id__isnull=False
-        )
-
-        # Group by transaction_id
-        transactions_dict = {}
-        for card in cards:
-            transaction_id = card.metadata.get('transaction_id')
-            if transaction_id not in transactions_dict:
-                # Store first occurrence of each transaction
-                transactions_dict[transaction_id] = {
-                    'transaction_id': transaction_id,
-                    'generated_at': card.metadata.get('generated_at'),
-                    'batch_size': card.metadata.get('batch_size'),
-                    'event_name': card.event.name
-                }
-
-        # Convert to list and sort
-        result = list(transactions_dict.values())
-        result.sort(key=lambda x: x['generated_at'], reverse=True)
-
-        return Response(result)
-
-    def _generate_cards_pdf(self, cards, event):
-        """Genera un PDF con los cartones de bingo en un grid 2x2 por página"""
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=letter,
-            topMargin=0.3*inch,  # Reducir márgenes
-            bottomMargin=0.3*inch,
-            leftMargin=0.3*inch,
-            rightMargin=0.3*inch
-        )
-
-        # Si cards es un string (JSON), convertirlo
-        if isinstance(cards, str):
-            cards = json.loads(cards)
-
-        cards_per_page = 4  # Grid de 2x2
-        elements = []
-
-        # Encabezado más compacto
-        elements.append(self._create_header(event))
-        # Reducir el espacio después del encabezado
-        elements.append(Spacer(1, 0.1*inch))
-
-        # Procesar los cartones en grupos de 4 (por página)
-        for page_start in range(0, len(cards), cards_per_page):
-            # Obtener los cartones para esta página (hasta 4)
-            page_cards = cards[page_start:page_start+cards_per_page]
-
-            # Crear una tabla de 2x2 para esta página con menos padding
-            grid_data = []
-
-            # Primera fila (cartones 0 y 1)
-            row1 = []
-            # Segunda fila (cartones 2 y 3)
-            row2 = []
-
-            # Para cada posición en el grid 2x2
-            for i in range(min(cards_per_page, len(page_cards))):
-                card = page_cards[i]
-                card_id = page_start + i + 1  # Número de cartón para mostrar
-
-                # Extraer los números del cartón según su estructura
-                if isinstance(card, dict) and 'numbers' in card:
-                    card_numbers = card['numbers']
-                    if 'id' in card:
-                        card_id = card['id']
-                else:
-                    card_numbers = card
-
-                # Crear el cartón individual con tamaño más compacto
-                card_table = self._create_card_table(
-                    card_numbers, card_id, event)
-
-                # Agregar a la fila correspondiente
-                if i < 2:  # Primeros dos cartones van en la primera fila
-                    row1.append(card_table)
-                else:  # Los siguientes dos cartones van en la segunda fila
-                    row2.append(card_table)
-
-            # Completar las filas si faltan cartones
-            while len(row1) < 2:
-                row1.append(Spacer(3*inch, 3*inch))
-            while len(row2) < 2:
-                row2.append(Spacer(3*inch, 3*inch))
-
-            # Agregar las filas al grid
-            grid_data.append(row1)
-            grid_data.append(row2)
-
-            # Crear la tabla del grid 2x2 con menos padding
-            grid = Table(grid_data, colWidths=[3.7*inch, 3.7*inch])
-            grid.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 5),  # Reducir padding
-                ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-                ('TOPPADDING', (0, 0), (-1, -1), 5),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-            ]))
-            elements.append(grid)
-
-            # Agregar salto de página si quedan más cartones
-            if page_start + cards_per_page < len(cards):
-                elements.append(PageBreak())
-                elements.append(self._create_header(event))
-                elements.append(Spacer(1, 0.1*inch))  # Reducir espacio
-
-        # Crear frame que ocupe toda la página
-        from reportlab.platypus.frames import Frame
-        from reportlab.platypus.doctemplate import PageTemplate
-        frame = Frame(
-            doc.leftMargin,
-            doc.bottomMargin,
-            doc.width,
-            doc.height,
-            id='normal',
-            showBoundary=0  # No mostrar bordes del frame
-        )
-
-        # Crear plantilla simple
-        template = PageTemplate(
-            id='normal',
-            frames=[frame],
-            onPage=self._add_page_number
-        )
-        doc.addPageTemplates([template])
-
-        # Construir el PDF sin footer en cada carta
-        doc.build(elements, onFirstPage=self._add_page_number,
-                  onLaterPages=self._add_page_number)
-        pdf = buffer.getvalue()
-        buffer.close()
-        return pdf
-
-    def _create_card_table(self, card_numbers, card_id, event):
-        """Crea la representación en tabla de un cartón de bingo con datos adicionales"""
-        styles = getSampleStyleSheet()
-        container_data = []
-
-        # Encabezado del cartón: título y ID (pequeño y compacto)
-        card_title = Paragraph(
-            "<font size='10'>BINGO CARD</font>", styles['Normal'])
-
-        # Determinar qué ID mostrar, priorizar correlative_id sobre UUID
-        display_id = card_id
-        correlative_id = None
-
-        # Si tenemos id, buscar el correlative_id en la base de datos
-        if isinstance(card_id, str) and len(card_id) > 10:  # Probablemente es un UUID
-            try:
-                card = BingoCard.objects.get(id=card_id)
-                if card.correlative_id:
-                    correlative_id = card.correlative_id
-                    display_id = correlative_id  # Mostrar correlativo si existe
-            except Exception:
-                # Si hay un error, usar el ID original
-                pass
-
-        # Texto del ID del cartón
-        card_id_text = Paragraph(
-            f"<font size='7'>ID: {display_id}</font>", styles['Normal'])
-
-        # Si tenemos el correlativo pero no es lo que estamos mostrando como ID, mostrarlo adicional
-        if correlative_id and display_id != correlative_id:
-            correlative_text = Paragraph(
-                f"<font size='7'>REF: {correlative_id}</font>", styles['Normal'])
-            container_data.append([correlative_text, ''])
-
-        # Get seller info if available from metadata
-        user = getattr(event, 'user', None)
-        if user:
-            seller_info = Paragraph(
-                f"<font size='7'>Vendedor: {user.username}</font>", styles['Normal'])
-            container_data.append([seller_info, ''])
-
-        container_data.append([card_title])
-
-        event_info = Paragraph(
-            f"<font size='7'>Evento: {event.name}</font>", styles['Normal'])
-        # Add event info
-        container_data.append([event_info, ''])
-        container_data.append([card_id_text, ''])
-
-        # Get seller info if available from metadata
-        user = getattr(event, 'user', None)
-        if user:
-            seller_info = Paragraph(
-                f"<font size='7'>Vendedor: {user.username}</font>", styles['Normal'])
-            container_data.append([seller_info, ''])
-
-        # Extract card numbers from dictionary if needed
-        if isinstance(card_numbers, dict) and 'numbers' in card_numbers:
-            numbers_data = card_numbers['numbers']
-        else:
-            numbers_data = card_numbers
-
-        # Creación de la cuadrícula del cartón: encabezado y 5x5
-        table_data = [['B', 'I', 'N', 'G', 'O']]
-        from .win_patterns import parse_card_numbers
-        flat_card = parse_card_numbers(numbers_data)
-
-        for row in range(5):
-            row_data = []
-            for col in range(5):
-                index = row * 5 + col
-                if index < len(flat_card):
-                    val = flat_card[index]
-                    # Si es el centro y el valor es 0, mostrar "FREE"
-                    if row == 2 and col == 2 and val == 0:
-                        row_data.append("FREE")
-                    else:
-                        row_data.append(str(val))
-                else:
-                    row_data.append("")
-            table_data.append(row_data)
-
-        # Tabla más compacta
-        bingo_table = Table(table_data, colWidths=[
-                            0.55*inch]*5, rowHeights=[0.25*inch] + [0.55*inch]*5)
-        bingo_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('BACKGROUND', (0, 0), (4, 0), colors.lightgrey),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),  # Fuente más pequeña
-            ('FONTSIZE', (0, 0), (4, 0), 12),
-            ('FONTNAME', (0, 0), (4, 0), 'Helvetica-Bold'),
-        ]))
-
-        # Integrar la cuadrícula en el contenedor del cartón
-        container_data.append([bingo_table, ''])
-        container = Table(container_data, colWidths=[2.2*inch, 0.8*inch])
-        container.setStyle(TableStyle([
-            ('SPAN', (0, 2), (1, 2)),
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        return container
-
-    def _create_header(self, event):
-        """Crea el encabezado con logo y datos del evento (versión compacta)"""
-        logo_path = os.path.join(
-            settings.BASE_DIR, 'static', 'images', 'bingo_logo.png')
-        styles = getSampleStyleSheet()
-
-        if os.path.exists(logo_path):
-            logo = Image(logo_path, width=0.9*inch, height=0.9*inch)
-        else:
-            logo = Paragraph(
-                "<font size='10'>BINGO APP</font>", styles['Normal'])
-
-        # Encabezado más compacto
-        event_title = Paragraph(f"<b>{event.name}</b>", styles['Normal'])
-
-        # Ensure date is displayed properly, defaulting to current date if not available
-        if hasattr(event, 'date') and event.date:
-            date_str = event.date.strftime('%d/%m/%Y')
-        else:
-            # Fallback to current date instead of "TBD"
-            date_str = datetime.now().strftime('%d/%m/%Y')
-
-        event_date = Paragraph(
-            f"<font size='8'>Fecha: {date_str}</font>", styles['Normal'])
-        event_info = Paragraph(
-            f"<font size='8'>ID: {event.id}</font>", styles['Normal'])
-
-        header_data = [
-            [logo, event_title],
-            ['', event_date],
-            ['', event_info]
-        ]
+        # One indexed query on (seller, created_at), the event name comes from the join
+        batches = CardBatch.objects.filter(seller=request.user).order_by('-created_at').values(
+            'id', 'created_at', 'size', 'price_paid', 'event_id', 'event__name')
 
-        # If event has location, add it
-        if hasattr(event, 'location') and event.location:
-            location_info = Paragraph(
-                f"<font size='8'>Lugar: {event.location}</font>", styles['Normal'])
-            header_data.append(['', location_info])
-
-        header = Table(header_data, colWidths=[0.8*inch, 6.2*inch])
-        header.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('SPAN', (0, 0), (0, -1)),  # Logo spans all rows
-            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ]))
-        return header
-
-    def _add_page_number(self, canvas, doc):
-        """Agrega numeración de página discreta"""
-        canvas.saveState()
-        canvas.setFont('Helvetica', 6)  # Fuente más pequeña
-        page_text = f"Página {doc.page}"
-        canvas.drawRightString(8*inch, 0.2*inch, page_text)
-
-        # Solo agregar texto de copyright en la última página
-        if doc.page % 2 == 0:  # Páginas pares
-            self._add_back_page_content(canvas, doc)
-
-        canvas.restoreState()
-
-    def _add_back_page_content(self, canvas, doc):
-        """Contenido mejorado en la contraportada"""
-        canvas.saveState()
-
-        # Texto de copyright con fecha e información adicional
-        canvas.setFont('Helvetica', 6)
-        canvas.setFillColorRGB(0.5, 0.5, 0.5)  # Gris claro para no distraer
-
-        # Add current date/time
-        current_time = datetime.now().strftime("%d/%m/%Y %H:%M")
-        footer_text = f"© Bingo App - Generado: {current_time}"
-
-        canvas.drawCentredString(4.25*inch, 0.2*inch, footer_text)
-
-        canvas.restoreState()
+        return Response([{
+            'transaction_id': str(batch['id']),
+            'generated_at': batch['created_at'].isoformat(),
+            'batch_size': batch['size'],
+            'price_paid': batch['price_paid'],
+            'event_id': str(batch['event_id']),
+            'event_name': batch['event__name']
+        } for batch in batches])
 
 
 class NumberViewSet(viewsets.ModelViewSet):
@@ -1309,7 +815,9 @@ class NumberViewSet(viewsets.ModelViewSet):
                     "This number has already been called for this event")
 
             logger.info(f"Creating number {value} for event {event_id}")
-            serializer.save(event=event)
+            with transaction.atomic():
+                serializer.save(event=event)
+                add_stats(event.id, numbers_called=1)
             logger.info("Number created successfully")
         except ValidationError as e:
             logger.error(f"Validation error: {str(e)}")
@@ -1327,11 +835,8 @@ class NumberViewSet(viewsets.ModelViewSet):
                 return Response({"error": "event_id query parameter is required"},
                                 status=status.HTTP_400_BAD_REQUEST)
 
-            numbers = Number.objects.filter(event_id=event_id)
-            serializer = self.get_serializer(numbers, many=True)
-            logger.info(
-                f"Retrieved {len(numbers)} numbers for event {event_id}")
-            return Response(serializer.data)
+            logger.info(f"Retrieving numbers for event {event_id}")
+            return paginated_response(self, Number.objects.filter(event_id=event_id))
         except Exception as e:
             logger.error(f"Error fetching numbers by event: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1390,6 +895,7 @@ class NumberViewSet(viewsets.ModelViewSet):
 
                 # Delete the number
                 latest_number.delete()
+                add_stats(latest_number.event_id, numbers_called=-1)
                 logger.info(f"Deleted latest number for event {event_id}")
 
                 return Response({"success": True, "message": "Latest number deleted successfully"})
@@ -1412,6 +918,7 @@ class NumberViewSet(viewsets.ModelViewSet):
                 # Delete all numbers for this event
                 deleted_count, _ = Number.objects.filter(
                     event_id=event_id).delete()
+                add_stats(event_id, numbers_called=-deleted_count)
                 logger.info(
                     f"Reset {deleted_count} numbers for event {event_id}")
 
@@ -1469,10 +976,74 @@ class CardPurchaseViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+class CardGenerationJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Large card batches for sellers, generated in the background by run_card_jobs"""
+    queryset = CardGenerationJob.objects.all()
+    serializer_class = CardGenerationJobSerializer
+    permission_classes = [IsAuthenticated, IsSellerPermission]
+
+    def get_queryset(self):
+        return CardGenerationJob.objects.filter(user=self.request.user)
+
+    @idempotent
+    def create(self, request):
+        """Charge and queue a batch; returns 202 with the job id immediately"""
+        serializer = CardGenerationJobRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        try:
+            event = Event.objects.get(id=serializer.validated_data['event_id'])
+        except Event.DoesNotExist:
+            return Response({"error": "Event not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            lock = get_lock_manager().acquire(
+                balance_lock_name(user.id), timeout=settings.LOCK_ACQUIRE_TIMEOUT, auto_renew=True)
+        except LockTimeout:
+            return Response({"error": "Another generation is in progress"},
+                            status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+        try:
+            success, result = submit_job(
+                user, event, serializer.validated_data['quantity'],
+                SystemConfig.get_card_price(), lock=lock)
+        finally:
+            lock.release()
+
+        if not success:
+            return Response({
+                "success": False,
+                "message": result
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        job = result['job']
+        return Response({
+            "success": True,
+            "job_id": job.id,
+            "status": job.status,
+            "new_balance": result['balance'].balance,
+            "progress_url": reverse('card-jobs-detail', args=[job.id]),
+            "message": f"Generating {job.quantity} cards in the background"
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class EmailDeliveryViewSet(viewsets.ReadOnlyModelViewSet):
+    """Delivery status of the card emails queued by the seller"""
+    queryset = EmailDelivery.objects.all()
+    serializer_class = EmailDeliverySerializer
+    permission_classes = [IsAuthenticated, IsSellerPermission]
+
+    def get_queryset(self):
+        return EmailDelivery.objects.filter(user=self.request.user)
+
+
 class WinningPatternViewSet(viewsets.ModelViewSet):
     queryset = WinningPattern.objects.all()
     serializer_class = WinningPatternSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = '-created_at'
 
     def get_queryset(self):
         """Allow users to see all active patterns but only their own inactive patterns"""
@@ -1590,10 +1161,12 @@ class DepositRequestViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        # Nested user data is serialized from the join, not one query per deposit
+        deposits = DepositRequest.objects.select_related('user', 'approved_by')
         # Staff can see all requests, users only see their own
         if user.is_staff:
-            return DepositRequest.objects.all()
-        return DepositRequest.objects.filter(user=user)
+            return deposits
+        return deposits.filter(user=user)
 
     def get_serializer_class(self):
         if self.action == 'request_deposit':
@@ -1605,6 +1178,7 @@ class DepositRequestViewSet(viewsets.ModelViewSet):
         return DepositRequestSerializer
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def request_deposit(self, request):
         """Initiate a deposit request and get a unique code"""
         serializer = self.get_serializer(data=request.data)
@@ -1698,6 +1272,7 @@ class DepositRequestViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_404_NOT_FOUND)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @idempotent
     def approve(self, request, pk=None):
         """Approve a deposit request (staff only)"""
         if not request.user.is_staff:
@@ -1722,8 +1297,22 @@ class DepositRequestViewSet(viewsets.ModelViewSet):
             if 'admin_notes' in serializer.validated_data:
                 deposit.admin_notes = serializer.validated_data['admin_notes']
 
-            # Process approval
-            deposit, balance = DepositRequest.approve(deposit.id, request.user)
+            # Process approval under the balance lock of the deposit owner
+            try:
+                lock = get_lock_manager().acquire(
+                    balance_lock_name(deposit.user_id), timeout=settings.LOCK_ACQUIRE_TIMEOUT,
+                    auto_renew=True)
+            except LockTimeout:
+                return Response({
+                    'success': False,
+                    'message': 'El saldo del usuario se está actualizando, intente de nuevo.'
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+            try:
+                with transaction.atomic():
+                    deposit, balance = DepositRequest.approve(deposit.id, request.user, fence=lock.token)
+            finally:
+                lock.release()
 
             return Response({
                 'success': True,
@@ -1786,9 +1375,8 @@ class DepositRequestViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def my_deposits(self, request):
         """Get all deposit requests for the current user"""
-        deposits = DepositRequest.objects.filter(user=request.user)
-        serializer = DepositRequestSerializer(deposits, many=True)
-        return Response(serializer.data)
+        return paginated_response(self, DepositRequest.objects.select_related(
+            'user', 'approved_by').filter(user=request.user))
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def pending(self, request):
@@ -1800,32 +1388,39 @@ class DepositRequestViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_403_FORBIDDEN)
 
         # Filter for pending deposits with references (confirmed deposits)
-        deposits = DepositRequest.objects.filter(
+        deposits = DepositRequest.objects.select_related('user', 'approved_by').filter(
             status='pending', reference__isnull=False)
 
         # Create serializer context with request
         context = {'request': request}
 
-        # Use serializer that includes nested relationships
+        # Use serializer that includes nested relationships, one page at a time
+        page = self.paginate_queryset(deposits)
         serializer = DepositRequestSerializer(
-            deposits, many=True, context=context)
+            deposits if page is None else page, many=True, context=context)
 
         # Get the serialized data
         data = serializer.data
 
+        # Payment method details of the whole page in one query
+        method_ids = {}
+        for deposit in data:
+            try:
+                method_ids[deposit.get('payment_method')] = uuid.UUID(str(deposit.get('payment_method')))
+            except ValueError:
+                pass
+        payment_methods = PaymentMethod.objects.in_bulk(method_ids.values())
+
         # For each deposit, add the payment method details if available
         for deposit in data:
-            # If there's a payment_method in the deposit, fetch its details
             if 'payment_method' in deposit and deposit['payment_method']:
-                try:
-                    payment_method = PaymentMethod.objects.get(
-                        id=deposit['payment_method'])
-                    deposit['payment_method_details'] = PaymentMethodSerializer(
-                        payment_method, context=context).data
-                except PaymentMethod.DoesNotExist:
-                    deposit['payment_method_details'] = None
+                payment_method = payment_methods.get(method_ids.get(deposit['payment_method']))
+                deposit['payment_method_details'] = PaymentMethodSerializer(
+                    payment_method, context=context).data if payment_method else None
 
-        return Response(data)
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
 
 
 class PaymentMethodViewSet(viewsets.ModelViewSet):
@@ -227,6 +227,43 @@ def parse_card_numbers(card_numbers):
     logger.debug(f"Parsed card numbers: {numbers_list}")        
     return numbers_list
 
+def grid_to_numbers(grid):
+    """Stored card format: ["B1", "I16", "N0", ...] with the same positions as the grid"""
+    return ["N0" if value == 0 else f"{'BINGO'[pos % 5]}{value}"
+            for pos, value in enumerate(grid)]
+
+def grid_fingerprint(grid):
+    """
+    Canonical fingerprint of a parsed grid.
+    The 25 row-major values (0 = free space) encoded as 50 hex characters.
+    """
+    return ''.join(f'{int(value):02x}' for value in grid)
+
+def card_fingerprint(card_numbers):
+    """Fingerprint of a card's numbers, independent of the stored format"""
+    return grid_fingerprint(parse_card_numbers(card_numbers))
+
+# Custom pattern name mapping - Spanish names sent by clients to English pattern names
+PATTERN_NAME_MAPPING = {
+    'linea horizontal 1': 'row_1',
+    'linea horizontal 2': 'row_2',
+    'linea horizontal 3': 'row_3',
+    'linea horizontal 4': 'row_4',
+    'linea horizontal 5': 'row_5',
+    'linea vertical 1': 'col_1',
+    'linea vertical 2': 'col_2',
+    'linea vertical 3': 'col_3',
+    'linea vertical 4': 'col_4',
+    'linea vertical 5': 'col_5',
+}
+
+
+def normalize_pattern_name(pattern_name):
+    """Lower-cased pattern name, with the Spanish display names mapped to their pattern"""
+    pattern_name = (pattern_name or 'bingo').lower()
+    return PATTERN_NAME_MAPPING.get(pattern_name, pattern_name)
+
+
 def check_win_pattern(card_numbers, called_numbers, pattern_name='bingo', event_id=None):
     """
     Check if a card has won with the specified pattern.
@@ -251,24 +288,8 @@ def check_win_pattern(card_numbers, called_numbers, pattern_name='bingo', event_
         else:
             patterns = get_patterns_from_db()
         
-        # Handle custom pattern name mapping - map Spanish names to English pattern names
-        pattern_name_mapping = {
-            'linea horizontal 1': 'row_1',
-            'linea horizontal 2': 'row_2',
-            'linea horizontal 3': 'row_3',
-            'linea horizontal 4': 'row_4',
-            'linea horizontal 5': 'row_5',
-            'linea vertical 1': 'col_1',
-            'linea vertical 2': 'col_2',
-            'linea vertical 3': 'col_3',
-            'linea vertical 4': 'col_4',
-            'linea vertical 5': 'col_5',
-        }
-        
-        # Try to map the pattern name if it's in Spanish
-        normalized_pattern_name = pattern_name.lower()
-        if normalized_pattern_name in pattern_name_mapping:
-            pattern_name = pattern_name_mapping[normalized_pattern_name]
+        # Map Spanish names to English pattern names
+        pattern_name = normalize_pattern_name(pattern_name)
             
         pattern = patterns.get(pattern_name.lower())
         
@@ -0,0 +1,64 @@
+"""
+Database connection pooling (Django 5.1 psycopg 3 pools).
+
+With CONN_MAX_AGE every thread keeps its own connection open, and the ASGI server
+plus the database_sync_to_async thread pool of the Channels consumer multiply them.
+With a pool each process holds between DATABASE_POOL_MIN_SIZE and
+DATABASE_POOL_MAX_SIZE connections; Django borrows one for a request or a consumer
+call and hands it back when it "closes" it. A checkout waits at most
+DATABASE_POOL_TIMEOUT seconds, connections are checked before being handed out and
+are recycled after DATABASE_POOL_MAX_IDLE / DATABASE_POOL_MAX_LIFETIME.
+
+Pools need psycopg 3 and psycopg_pool; without them, or on other engines, the
+databases keep their persistent connections.
+"""
+try:
+    import psycopg  # noqa: F401
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    ConnectionPool = None
+
+POSTGRES_ENGINE = 'django.db.backends.postgresql'
+
+
+def pool_options(min_size, max_size, timeout, max_idle, max_lifetime):
+    """OPTIONS['pool'] of a database; Django adds the checkout health check itself"""
+    return {
+        'min_size': min_size,
+        'max_size': max_size,
+        'timeout': timeout,
+        'max_idle': max_idle,
+        'max_lifetime': max_lifetime,
+    }
+
+
+def configure_pools(databases, **options):
+    """
+    Enable pooling on the PostgreSQL entries of DATABASES (called from settings).
+    Returns the aliases that got a pool.
+    """
+    if ConnectionPool is None:
+        return []
+    pooled = []
+    for alias, database in databases.items():
+        if database.get('ENGINE') != POSTGRES_ENGINE:
+            continue
+        # Django refuses persistent connections together with a pool
+        database['CONN_MAX_AGE'] = 0
+        # Django passes the pool its checkout health check (ConnectionPool.check_connection) only with this on
+        database['CONN_HEALTH_CHECKS'] = True
+        database.setdefault('OPTIONS', {})['pool'] = pool_options(**options)
+        pooled.append(alias)
+    return pooled
+
+
+def pool_stats():
+    """Per alias pool metrics for the health endpoint, None for databases without a pool"""
+    from django.db import connections
+
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        pool = getattr(connection, 'pool', None)
+        stats[alias] = pool.get_stats() if pool is not None else None
+    return stats
@@ -0,0 +1,147 @@
+"""
+Read replica routing with read-your-writes pinning.
+
+Reads go to a replica (DATABASE_REPLICAS) only inside a replica-eligible scope: a
+GET/HEAD/OPTIONS request through ReplicaPinningMiddleware, or a block wrapped in
+replica_reads() such as the websocket snapshots. Everything else, including workers
+and management commands, reads from the primary.
+
+A write pins the rest of the scope to the primary and keeps the client's following
+requests on the primary for DATABASE_PIN_WINDOW seconds, so a client never reads a
+replica that has not caught up with its own write. Authenticated users are pinned
+server-side, in the DATABASE_PIN_CACHE cache under their id, which also covers
+cross-site JWT clients and websockets; anonymous clients get a cookie.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+PIN_COOKIE = 'db_primary_until'
+PIN_CACHE_KEY = 'db_primary_until:{user_id}'
+
+_scope = ContextVar('db_routing_scope', default=None)
+
+
+class RoutingScope:
+    """Routing state of one request or websocket snapshot"""
+
+    def __init__(self, replica_allowed):
+        self.replica_allowed = replica_allowed
+        self.wrote = False
+
+
+def pinned_until(cookies):
+    """Timestamp until which the client reads from the primary, 0 when not pinned"""
+    try:
+        return float(cookies.get(PIN_COOKIE, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def pin_user(user_id):
+    """Keep the user's reads on the primary for DATABASE_PIN_WINDOW seconds, from any worker"""
+    window = settings.DATABASE_PIN_WINDOW
+    caches[settings.DATABASE_PIN_CACHE].set(
+        PIN_CACHE_KEY.format(user_id=user_id), time.time() + window, timeout=window)
+
+
+def user_pinned_until(user_id):
+    """Timestamp until which the user reads from the primary, 0 when not pinned or anonymous"""
+    if user_id is None:
+        return 0
+    return caches[settings.DATABASE_PIN_CACHE].get(PIN_CACHE_KEY.format(user_id=user_id), 0)
+
+
+def token_user_id(request):
+    """User id of the request's valid JWT (without a query), or None"""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token).get(jwt_settings.USER_ID_CLAIM)
+    except (InvalidToken, TokenError):
+        return None
+
+
+@contextmanager
+def routing_scope(replica_allowed):
+    scope = RoutingScope(replica_allowed and bool(settings.DATABASE_REPLICAS))
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def replica_reads(allowed=True):
+    """Let the reads of the block go to a replica (unless it writes first)"""
+    with routing_scope(allowed) as scope:
+        yield scope
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None or not scope.replica_allowed or scope.wrote:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction on the primary must see its writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None:
+            scope.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinningMiddleware:
+    """
+    Opens the routing scope of each request: safe methods of clients that are not
+    pinned may read from replicas; any write pins the client for DATABASE_PIN_WINDOW.
+    The user is known from the JWT before the view runs; session users only after it,
+    so their requests are pinned by the cookie as well.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        user_id = token_user_id(request)
+        pinned = max(pinned_until(request.COOKIES), user_pinned_until(user_id))
+        with routing_scope(safe and pinned < time.time()) as scope:
+            response = self.get_response(request)
+
+        if scope.wrote or not safe:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                user_id = user.pk
+            if user_id is not None:
+                pin_user(user_id)
+            window = settings.DATABASE_PIN_WINDOW
+            response.set_cookie(PIN_COOKIE, f"{time.time() + window:.3f}", max_age=window,
+                                httponly=True, samesite='Lax', secure=request.is_secure())
+        return response
@@ -1,7 +1,9 @@
 import logging
 from django.http import JsonResponse
 from django.db.utils import OperationalError, ProgrammingError
+from django.conf import settings
 from .db_utils import ensure_database_connection
+from .query_budget import record_queries, report
 import os
 import traceback
 import json
@@ -92,6 +94,32 @@ class DatabaseConnectionMiddleware:
             raise
 
 
+class QueryBudgetMiddleware:
+    """
+    Records the SQL of every request (see core.query_budget): query count, database
+    time and repeated query fingerprints. Requests over SQL_QUERY_BUDGET or with a
+    repeated query are logged as warnings; with SQL_INSTRUMENTATION_HEADERS the numbers
+    are also returned as X-DB-Queries, X-DB-Time-Ms and X-DB-Repeated headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SQL_INSTRUMENTATION:
+            return self.get_response(request)
+
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        fields = report(f"{request.method} {request.path}", recorder)
+        if settings.SQL_INSTRUMENTATION_HEADERS:
+            response['X-DB-Queries'] = str(fields['db_queries'])
+            response['X-DB-Time-Ms'] = str(fields['db_time_ms'])
+            response['X-DB-Repeated'] = str(len(fields['db_repeated']))
+        return response
+
+
 # Dictionary of common error messages translations (English to Spanish)
 ERROR_TRANSLATIONS = {
     # Authentication errors
@@ -0,0 +1,23 @@
+from rest_framework import pagination
+from rest_framework.response import Response
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Default pagination for list endpoints. Cursors stay stable while rows are inserted.
+    The ordering is the view's `cursor_ordering`, else the model's Meta.ordering, else -pk.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None) or queryset.model._meta.ordering or '-pk'
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+
+
+def paginated_response(view, queryset):
+    """Response of a custom list action, paginated like the viewset's list()"""
+    page = view.paginate_queryset(queryset)
+    if page is None:
+        return Response(view.get_serializer(queryset, many=True).data)
+    return view.get_paginated_response(view.get_serializer(page, many=True).data)
@@ -0,0 +1,143 @@
+"""
+Per-request SQL instrumentation.
+
+Every database connection gets an execute wrapper that reports each query to the
+recorders active in the current context (a ContextVar, so queries run through
+sync_to_async by the Channels consumer are attributed to the message that caused
+them). A recorder keeps the query count, the total database time and how many times
+each query fingerprint (the SQL with literals and IN lists collapsed) was executed;
+a fingerprint repeated SQL_REPEAT_THRESHOLD times or more is the usual N+1 signature.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_active_recorders = ContextVar('active_query_recorders', default=())
+
+_IN_LIST_RE = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def query_fingerprint(sql):
+    """SQL with literals replaced by ? and IN (...) lists of any length collapsed"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """Queries executed while the recorder is active"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[query_fingerprint(sql)] += 1
+
+    def repeated(self, threshold=None):
+        """Fingerprints executed at least `threshold` times, most repeated first"""
+        threshold = settings.SQL_REPEAT_THRESHOLD if threshold is None else threshold
+        return [(fingerprint, count) for fingerprint, count in self.fingerprints.most_common()
+                if count >= threshold]
+
+    def summary(self):
+        """Fields for logs: count, time in ms and the repeated fingerprints"""
+        return {
+            'db_queries': self.count,
+            'db_time_ms': round(self.duration * 1000, 1),
+            'db_repeated': [{'sql': fingerprint[:300], 'count': count}
+                            for fingerprint, count in self.repeated()],
+        }
+
+
+def _record_query(execute, sql, params, many, context):
+    recorders = _active_recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.record(sql, duration)
+
+
+def _install(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_install, dispatch_uid='core.query_budget')
+
+
+@contextmanager
+def record_queries():
+    """Record the queries of the block, including those run by sync_to_async from it"""
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+    recorder = QueryRecorder()
+    token = _active_recorders.set(_active_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _active_recorders.reset(token)
+
+
+def report(label, recorder, budget=None):
+    """Log the recorder summary; a warning when over budget or with repeated queries"""
+    budget = settings.SQL_QUERY_BUDGET if budget is None else budget
+    fields = recorder.summary()
+    over_budget = recorder.count > budget
+    if over_budget or fields['db_repeated']:
+        logger.warning(
+            f"{label}: {recorder.count} queries in {fields['db_time_ms']} ms"
+            f"{f' (budget {budget})' if over_budget else ''}, "
+            f"{len(fields['db_repeated'])} repeated", extra=fields)
+    else:
+        logger.debug(f"{label}: {recorder.count} queries in {fields['db_time_ms']} ms", extra=fields)
+    return fields
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries, max_repeats=None):
+    """
+    Test helper: fail if the block runs more than `max_queries` queries or repeats a
+    fingerprint more than `max_repeats` times (default SQL_REPEAT_THRESHOLD - 1).
+
+        with query_budget(3):
+            client.get('/api/cards/my_transactions/')
+    """
+    max_repeats = settings.SQL_REPEAT_THRESHOLD - 1 if max_repeats is None else max_repeats
+    with record_queries() as recorder:
+        yield recorder
+
+    problems = []
+    if recorder.count > max_queries:
+        problems.append(f"{recorder.count} queries, budget is {max_queries}")
+    repeated = recorder.repeated(max_repeats + 1)
+    if repeated:
+        problems.append("repeated queries (possible N+1):\n" + '\n'.join(
+            f"  {count}x {fingerprint[:300]}" for fingerprint, count in repeated))
+    if problems:
+        raise QueryBudgetExceeded('; '.join(problems))
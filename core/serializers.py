@@ -0,0 +1,25 @@
+from rest_framework import serializers
+
+
+class FieldProjectionMixin:
+    """
+    Serializer mixin for `?fields=id,name`: only the requested fields are serialized.
+    Applies to top-level serializers on read requests; unknown names are a 400.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+
+        names = {name.strip() for name in requested.split(',') if name.strip()}
+        unknown = names - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError(
+                {'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+        for name in set(self.fields) - names:
+            self.fields.pop(name)
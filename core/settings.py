@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import dj_database_url
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 from datetime import timedelta
 
@@ -82,10 +83,15 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Cursor pages ({next, previous, results}); ?page_size= up to 500, ?fields= projects serializers
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.CursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 50)),
 }
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
+    'core.db_router.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'core.middleware.DatabaseConnectionMiddleware',
@@ -358,6 +364,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
     'cache-control',
     'pragma',
 ]
@@ -412,6 +419,100 @@ CHANNEL_LAYERS = {
     },
 }
 
+# 'db_pins' holds the users pinned to the primary database (core.db_router); per process
+# locally, in Redis on Render so every worker sees the pins
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'db_pins': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'db-pins',
+    },
+}
+
+# Chat configuration
+# 'memory' keeps history per process, 'redis' shares it across workers
+CHAT_BACKEND = os.getenv('CHAT_BACKEND', 'memory')
+CHAT_REDIS_URL = redis_url
+CHAT_HISTORY_SIZE = int(os.getenv('CHAT_HISTORY_SIZE', 200))
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 50))
+CHAT_RATE_LIMIT = int(os.getenv('CHAT_RATE_LIMIT', 5))  # messages per window
+CHAT_RATE_WINDOW = float(os.getenv('CHAT_RATE_WINDOW', 10))  # seconds
+CHAT_FLUSH_INTERVAL = float(os.getenv('CHAT_FLUSH_INTERVAL', 0.1))  # seconds
+
+# Win claims received within this window are adjudicated together
+CLAIM_BATCH_WINDOW = float(os.getenv('CLAIM_BATCH_WINDOW', 0.05))  # seconds
+
+# Card issuing
+CARD_BULK_CREATE_BATCH_SIZE = int(os.getenv('CARD_BULK_CREATE_BATCH_SIZE', 500))
+# Times a batch is regenerated when a grid was issued concurrently by another batch
+CARD_FINGERPRINT_RETRIES = int(os.getenv('CARD_FINGERPRINT_RETRIES', 3))
+# Pre-generated card pool per upcoming event (refill_card_pool command)
+CARD_POOL_LOW_WATERMARK = int(os.getenv('CARD_POOL_LOW_WATERMARK', 200))
+CARD_POOL_HIGH_WATERMARK = int(os.getenv('CARD_POOL_HIGH_WATERMARK', 1000))
+CARD_POOL_REFILL_INTERVAL = float(os.getenv('CARD_POOL_REFILL_INTERVAL', 5))  # seconds
+# Batches of at least this many cards store (event seed, index) instead of the numbers; 0 disables it
+CARD_DERIVED_STORAGE_MIN_BATCH = int(os.getenv('CARD_DERIVED_STORAGE_MIN_BATCH', 1000))
+CARD_DERIVATION_CACHE_SIZE = int(os.getenv('CARD_DERIVATION_CACHE_SIZE', 50000))  # derived grids kept per process
+# Large batches generated in the background (run_card_jobs command)
+CARD_JOB_MAX_QUANTITY = int(os.getenv('CARD_JOB_MAX_QUANTITY', 20000))
+CARD_JOB_CHUNK_SIZE = int(os.getenv('CARD_JOB_CHUNK_SIZE', 500))  # cards per transaction
+CARD_JOB_WORKERS = int(os.getenv('CARD_JOB_WORKERS', 2))
+CARD_JOB_POLL_INTERVAL = float(os.getenv('CARD_JOB_POLL_INTERVAL', 1))  # seconds
+CARD_JOB_STALE_AFTER = int(os.getenv('CARD_JOB_STALE_AFTER', 300))  # seconds without progress before another worker resumes it
+
+# Card PDFs: rows read per cursor round trip and bytes kept in memory before spooling to disk (without pypdf)
+CARD_PDF_CHUNK_SIZE = int(os.getenv('CARD_PDF_CHUNK_SIZE', 400))
+CARD_PDF_SPOOL_MAX_SIZE = int(os.getenv('CARD_PDF_SPOOL_MAX_SIZE', 5 * 1024 * 1024))
+# Pages rendered as one small PDF and streamed before the next (bingo.card_pdf.iter_pdf)
+CARD_PDF_RANGE_PAGES = int(os.getenv('CARD_PDF_RANGE_PAGES', 25))
+# PDFs of at least CARD_PDF_PARALLEL_MIN_CARDS cards are rendered by CARD_PDF_WORKERS processes (needs pypdf); 1 disables it
+CARD_PDF_WORKERS = int(os.getenv('CARD_PDF_WORKERS', min(4, os.cpu_count() or 1)))
+CARD_PDF_PARALLEL_MIN_CARDS = int(os.getenv('CARD_PDF_PARALLEL_MIN_CARDS', 2000))
+# Rendered transaction PDFs (bingo.pdf_artifacts), least recently used evicted above the size cap
+CARD_PDF_ARTIFACT_STORE = os.getenv('CARD_PDF_ARTIFACT_STORE', 'bingo.pdf_artifacts.FileSystemArtifactStore')
+CARD_PDF_ARTIFACT_DIR = os.getenv('CARD_PDF_ARTIFACT_DIR', os.path.join(tempfile.gettempdir(), 'bingo_pdf_artifacts'))
+CARD_PDF_ARTIFACT_MAX_BYTES = int(os.getenv('CARD_PDF_ARTIFACT_MAX_BYTES', 512 * 1024 * 1024))
+CARD_PDF_ARTIFACT_WARM = os.getenv('CARD_PDF_ARTIFACT_WARM', 'True') == 'True'  # render right after generate_bulk
+
+# Card exports (bingo.card_export): rows per cursor round trip and per encoded chunk
+CARD_EXPORT_CHUNK_SIZE = int(os.getenv('CARD_EXPORT_CHUNK_SIZE', 2000))
+
+# SQL instrumentation (core.query_budget): per request / websocket message query counts
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', 'True') == 'True'
+SQL_INSTRUMENTATION_HEADERS = os.getenv('SQL_INSTRUMENTATION_HEADERS', str(DEBUG)) == 'True'  # X-DB-* response headers
+SQL_QUERY_BUDGET = int(os.getenv('SQL_QUERY_BUDGET', 30))  # queries per request before a warning
+SQL_REPEAT_THRESHOLD = int(os.getenv('SQL_REPEAT_THRESHOLD', 5))  # same query this many times is reported as N+1
+
+# Card email outbox (bingo.email_outbox, send_email_outbox command)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 20))  # emails sent per SMTP connection
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_RETRY_BASE = float(os.getenv('EMAIL_OUTBOX_RETRY_BASE', 30))  # seconds, doubled on every failed attempt
+EMAIL_OUTBOX_RETRY_MAX = float(os.getenv('EMAIL_OUTBOX_RETRY_MAX', 3600))  # seconds
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.getenv('EMAIL_OUTBOX_POLL_INTERVAL', 2))  # seconds
+EMAIL_OUTBOX_STALE_AFTER = int(os.getenv('EMAIL_OUTBOX_STALE_AFTER', 600))  # seconds in 'sending' before another worker retries it
+
+# Event archival (bingo.event_archive, archive_events command)
+# Existing directory on persistent storage (e.g. a Render disk mount); no default, the
+# archive files are the only copy of the moved rows and the app filesystem is ephemeral
+EVENT_ARCHIVE_DIR = os.getenv('EVENT_ARCHIVE_DIR')
+EVENT_ARCHIVE_RETENTION_DAYS = int(os.getenv('EVENT_ARCHIVE_RETENTION_DAYS', 30))  # days after Event.end
+EVENT_ARCHIVE_CHUNK_SIZE = int(os.getenv('EVENT_ARCHIVE_CHUNK_SIZE', 2000))  # rows moved per transaction
+
+# Distributed locks (bingo.locks)
+# 'memory' only protects a single process, 'redis' is shared by all workers
+LOCK_BACKEND = os.getenv('LOCK_BACKEND', 'memory')
+LOCK_REDIS_URL = redis_url
+LOCK_DEFAULT_TTL = float(os.getenv('LOCK_DEFAULT_TTL', 30))  # seconds, renewed while held
+LOCK_ACQUIRE_TIMEOUT = float(os.getenv('LOCK_ACQUIRE_TIMEOUT', 5))  # seconds to wait before 429
+
+# Idempotency-Key support for money-moving endpoints (bingo.idempotency)
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))  # seconds a response is replayable
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 15))  # seconds a duplicate waits for the first request
+IDEMPOTENCY_POLL_INTERVAL = float(os.getenv('IDEMPOTENCY_POLL_INTERVAL', 0.1))  # seconds
+IDEMPOTENCY_IN_PROGRESS_LEASE = int(os.getenv('IDEMPOTENCY_IN_PROGRESS_LEASE', 60))  # seconds without renewal before a stuck request's key is taken over
+
 # Production settings
 if ENVIRONMENT == 'production':
     # Allow CORS from production domains - support multiple domains
@@ -452,6 +553,7 @@ if ENVIRONMENT == 'production':
         'user-agent',
         'x-csrftoken',
         'x-requested-with',
+        'idempotency-key',
     ]
 
 # Update for Render.com deployment
@@ -512,6 +614,42 @@ if os.getenv('RENDER', '').lower() == 'true':
                 },
             },
         }
+        CACHES['db_pins'] = {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+        CHAT_REDIS_URL = REDIS_URL
+        LOCK_REDIS_URL = REDIS_URL
+        LOCK_BACKEND = os.getenv('LOCK_BACKEND', 'redis')
 
     print(f"Final CORS_ALLOWED_ORIGINS: {CORS_ALLOWED_ORIGINS}")
     print(f"Final CSRF_TRUSTED_ORIGINS: {CSRF_TRUSTED_ORIGINS}")
+
+# Read replicas (core.db_router): comma separated database URLs, e.g. a Postgres hot
+# standby, or locally a second alias of the same SQLite/Postgres database. Safe requests
+# read from them; a write pins the client to the primary for DATABASE_PIN_WINDOW seconds.
+DATABASE_REPLICAS = []
+for index, replica_url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    alias = f"replica_{index}"
+    DATABASES[alias] = dj_database_url.parse(
+        replica_url.strip(), conn_max_age=DATABASES['default'].get('CONN_MAX_AGE', 0))
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_PIN_WINDOW = int(os.getenv('DATABASE_PIN_WINDOW', 5))  # seconds, longer than the replication lag
+DATABASE_PIN_CACHE = 'db_pins'  # cache alias holding the pinned user ids, shared by the workers in production
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# Connection pooling (core.db_pool): replaces CONN_MAX_AGE on PostgreSQL databases when
+# psycopg 3 and psycopg_pool are installed. Sizes are per process (gunicorn worker).
+DATABASE_POOL = os.getenv('DATABASE_POOL', 'True') == 'True'
+DATABASE_POOL_MIN_SIZE = int(os.getenv('DATABASE_POOL_MIN_SIZE', 2))
+DATABASE_POOL_MAX_SIZE = int(os.getenv('DATABASE_POOL_MAX_SIZE', 10))
+DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+DATABASE_POOL_MAX_IDLE = float(os.getenv('DATABASE_POOL_MAX_IDLE', 300))  # seconds before an idle connection is closed
+DATABASE_POOL_MAX_LIFETIME = float(os.getenv('DATABASE_POOL_MAX_LIFETIME', 1800))  # seconds before a connection is replaced
+if DATABASE_POOL:
+    from core.db_pool import configure_pools
+    configure_pools(
+        DATABASES, min_size=DATABASE_POOL_MIN_SIZE, max_size=DATABASE_POOL_MAX_SIZE,
+        timeout=DATABASE_POOL_TIMEOUT, max_idle=DATABASE_POOL_MAX_IDLE,
+        max_lifetime=DATABASE_POOL_MAX_LIFETIME)
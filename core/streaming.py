@@ -0,0 +1,44 @@
+"""
+Streaming responses under ASGI.
+
+Django cannot send a synchronous iterator from an async handler chunk by chunk: it
+consumes the whole iterator with sync_to_async(list) before sending the first byte.
+streaming_content() hands StreamingHttpResponse an async iterator instead when the
+request came in through ASGI, pulling each chunk with its own sync_to_async call so
+chunks are sent as they are produced and never buffered together.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+_DONE = object()
+
+
+async def async_chunks(iterator):
+    """
+    Async iterator over a sync one. Every next() runs in the thread-sensitive sync
+    thread, the same one as the rest of the request's ORM work.
+    """
+    iterator = iter(iterator)
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(iterator, _DONE)
+            if chunk is _DONE:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
+
+
+def is_asgi_request(request):
+    """True for requests (Django or DRF) served by the ASGI handler"""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def streaming_content(request, iterator):
+    """`iterator` as StreamingHttpResponse content: async under ASGI, unchanged under WSGI"""
+    if is_asgi_request(request):
+        return async_chunks(iterator)
+    return iterator
@@ -27,7 +27,7 @@ from users.admin_commands import run_management_command
 from bingo.views import (
     DepositRequestViewSet, EventViewSet, BingoCardViewSet, NumberViewSet,
     TestCoinBalanceViewSet, CardPurchaseViewSet, WinningPatternViewSet,
-    PaymentMethodViewSet, RatesConfigViewSet
+    PaymentMethodViewSet, RatesConfigViewSet, CardGenerationJobViewSet, EmailDeliveryViewSet
 )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 import os
@@ -68,6 +68,8 @@ router.register(r'cards', BingoCardViewSet)
 router.register(r'numbers', NumberViewSet)
 router.register(r'test-coins', TestCoinBalanceViewSet)
 router.register(r'card-purchases', CardPurchaseViewSet)
+router.register(r'card-jobs', CardGenerationJobViewSet, basename='card-jobs')
+router.register(r'email-deliveries', EmailDeliveryViewSet, basename='email-deliveries')
 router.register(r'winning-patterns', WinningPatternViewSet)
 router.register(r'deposits', DepositRequestViewSet, basename='deposits')
 router.register(r'test-coins/deposit', DepositRequestViewSet,
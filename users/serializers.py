@@ -10,12 +10,13 @@ from allauth.account.models import EmailAddress
 import logging
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
+from core.serializers import FieldProjectionMixin
 
 logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(FieldProjectionMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'email', 'first_name', 'last_name', 'is_email_verified', 'phone_number', 'is_staff', 'is_seller', 'uuid', 'date_joined']
@@ -44,6 +44,7 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering = '-date_joined'
     
     @action(detail=False, methods=['get'])
     def me(self, request):